@@ -0,0 +1,341 @@
+"""
+Almacén SQLite opcional para las transacciones (ALMACEN_DATOS=sqlite)
+Los datos se cargan una vez por versión en un archivo local con índices en la fecha y en
+las dimensiones de los filtros; los filtros y las agregaciones de los gráficos se resuelven
+como consultas indexadas en lugar de recorrer el DataFrame completo
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from cache_local import obtener_directorio_cache
+
+# Columnas que se indexan si existen en los datos
+COLUMNAS_INDICE = ('Date', 'Fecha', 'Responsible', 'Responsable', 'Bank', 'Banco', 'Categoria', 'Card', 'Tarjeta')
+
+# Las fechas se guardan como texto ordenable para poder compararlas con el índice
+FORMATO_FECHA_SQL = '%Y-%m-%d %H:%M:%S'
+
+# Agrupaciones por período sobre la columna de fecha
+PERIODOS_SQL = {
+    'dia': 10,  # YYYY-MM-DD
+    'mes': 7,   # YYYY-MM
+}
+
+# Filas por lote al insertar
+FILAS_POR_LOTE = 10000
+
+Filtros = Dict[str, Any]
+
+
+def almacen_habilitado() -> bool:
+    """
+    Indica si los filtros y gráficos deben resolverse con el almacén SQLite
+    """
+    return os.getenv('ALMACEN_DATOS', 'pandas').lower() == 'sqlite'
+
+
+def contar_filas(df: pd.DataFrame) -> int:
+    """
+    Filas que representa un DataFrame: las de la tabla o consulta del almacén si es una
+    vista (AlmacenTransacciones.vista), o len(df)
+    """
+    filas = df.attrs.get('filas')
+    return len(df) if filas is None else int(filas)
+
+
+def _columna(nombre: str) -> str:
+    """
+    Nombre de columna o tabla entre comillas para SQL
+    """
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+class AlmacenTransacciones:
+    """
+    Tablas de transacciones por fuente en un archivo SQLite local
+
+    Cada tabla se reemplaza de forma atómica cuando cambia la versión de la fuente, así
+    las consultas concurrentes siempre ven una versión completa.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = ruta or os.path.join(obtener_directorio_cache(), 'transacciones.sqlite')
+        self._lock_ingesta = threading.Lock()
+        with closing(self._conectar()) as conexion, conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS _versiones "
+                "(tabla TEXT PRIMARY KEY, version TEXT, columna_fecha TEXT, filas INTEGER)"
+            )
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        return conexion
+
+    def version(self, tabla: str) -> Optional[str]:
+        """
+        Versión de la fuente cargada en la tabla, o None si no se ha cargado
+        """
+        info = self._info_tabla(tabla)
+        return info[0] if info else None
+
+    def vista(self, tabla: str) -> pd.DataFrame:
+        """
+        Representación liviana de una tabla para el registro de datos compartido
+
+        Es un DataFrame sin filas con las columnas de la tabla; attrs lleva 'tabla_almacen',
+        'filas' y 'version_fuente'. Los datos se consultan en el almacén, así la memoria del
+        proceso no guarda otra copia completa.
+        """
+        with closing(self._conectar()) as conexion:
+            version, filas = conexion.execute(
+                "SELECT version, filas FROM _versiones WHERE tabla = ?", (tabla,)
+            ).fetchone()
+        df = self._leer(tabla, f"SELECT * FROM {_columna(tabla)} LIMIT 0", [])
+        df.attrs.update({'tabla_almacen': tabla, 'filas': filas, 'version_fuente': version})
+        return df
+
+    def _info_tabla(self, tabla: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Versión y columna de fecha de una tabla, o None si no se ha cargado
+        """
+        with closing(self._conectar()) as conexion:
+            return conexion.execute(
+                "SELECT version, columna_fecha FROM _versiones WHERE tabla = ?", (tabla,)
+            ).fetchone()
+
+    def ingerir(self, tabla: str, df: pd.DataFrame, version: Optional[str] = None,
+                columna_fecha: Optional[str] = None) -> bool:
+        """
+        Carga el DataFrame en la tabla si la versión cambió
+
+        Args:
+            tabla: Nombre de la tabla (una por fuente)
+            df: Datos ya procesados
+            version: Versión de la fuente; si no se indica se usa un hash del contenido
+            columna_fecha: Columna de fecha usada en los filtros por rango
+
+        Returns:
+            True si se cargaron datos nuevos
+        """
+        if version is None:
+            version = f"hash:{int(pd.util.hash_pandas_object(df, index=False).sum())}"
+
+        with self._lock_ingesta:
+            info = self._info_tabla(tabla)
+            if info is not None and info[0] == version:
+                return False
+
+            df_sql = df.copy()
+            for columna in df_sql.columns:
+                if pd.api.types.is_datetime64_any_dtype(df_sql[columna]):
+                    df_sql[columna] = df_sql[columna].dt.strftime(FORMATO_FECHA_SQL)
+                elif df_sql[columna].dtype == object:
+                    # Valores mezclados (fechas, números y texto) se guardan como texto
+                    tipo = pd.api.types.infer_dtype(df_sql[columna], skipna=True)
+                    if tipo not in ('string', 'integer', 'floating', 'boolean', 'empty'):
+                        df_sql[columna] = df_sql[columna].astype(str).where(df_sql[columna].notna())
+
+            tabla_nueva = f"{tabla}__nueva"
+            with closing(self._conectar()) as conexion:
+                conexion.execute(f"DROP TABLE IF EXISTS {_columna(tabla_nueva)}")
+                df_sql.to_sql(tabla_nueva, conexion, index=False, chunksize=FILAS_POR_LOTE)
+
+                # Reemplazo atómico: las consultas ven la versión anterior hasta el COMMIT
+                with conexion:
+                    conexion.execute(f"DROP TABLE IF EXISTS {_columna(tabla)}")
+                    conexion.execute(f"ALTER TABLE {_columna(tabla_nueva)} RENAME TO {_columna(tabla)}")
+                    for columna in COLUMNAS_INDICE:
+                        if columna in df_sql.columns:
+                            conexion.execute(
+                                f"CREATE INDEX IF NOT EXISTS {_columna(f'idx_{tabla}_{columna}')} "
+                                f"ON {_columna(tabla)} ({_columna(columna)})"
+                            )
+                    conexion.execute(
+                        "INSERT OR REPLACE INTO _versiones (tabla, version, columna_fecha, filas) VALUES (?, ?, ?, ?)",
+                        (tabla, version, columna_fecha, len(df_sql))
+                    )
+        return True
+
+    def _where(self, tabla: str, filtros: Optional[Filtros]) -> Tuple[str, List[Any]]:
+        """
+        Arma la cláusula WHERE de los filtros
+
+        Filtros admitidos: 'desde' y 'hasta' (fechas, inclusive), 'iguales' {columna: valor}
+        y 'minimos' {columna: valor}.
+        """
+        if not filtros:
+            return "", []
+
+        condiciones = []
+        parametros: List[Any] = []
+
+        info = self._info_tabla(tabla)
+        columna_fecha = info[1] if info else None
+        if columna_fecha:
+            if filtros.get('desde') is not None:
+                condiciones.append(f"{_columna(columna_fecha)} >= ?")
+                parametros.append(pd.Timestamp(filtros['desde']).strftime('%Y-%m-%d'))
+            if filtros.get('hasta') is not None:
+                # Hasta el final del día indicado
+                hasta = pd.Timestamp(filtros['hasta']).date() + timedelta(days=1)
+                condiciones.append(f"{_columna(columna_fecha)} < ?")
+                parametros.append(hasta.strftime('%Y-%m-%d'))
+
+        for columna, valor in (filtros.get('iguales') or {}).items():
+            condiciones.append(f"{_columna(columna)} = ?")
+            parametros.append(valor)
+
+        for columna, valor in (filtros.get('minimos') or {}).items():
+            condiciones.append(f"{_columna(columna)} >= ?")
+            parametros.append(valor)
+
+        if not condiciones:
+            return "", []
+        return " WHERE " + " AND ".join(condiciones), parametros
+
+    def _leer(self, tabla: str, consulta: str, parametros: List[Any]) -> pd.DataFrame:
+        with closing(self._conectar()) as conexion:
+            df = pd.read_sql_query(consulta, conexion, params=parametros)
+
+        info = self._info_tabla(tabla)
+        if info and info[1] in df.columns:
+            df[info[1]] = pd.to_datetime(df[info[1]], format=FORMATO_FECHA_SQL, errors='coerce')
+        return df
+
+    def consultar(self, tabla: str, filtros: Optional[Filtros] = None, orden: Optional[str] = None,
+                  descendente: bool = False, limite: Optional[int] = None) -> pd.DataFrame:
+        """
+        Filas que cumplen los filtros
+
+        Args:
+            tabla: Nombre de la tabla
+            filtros: Filtros a aplicar
+            orden: Columna por la que se ordenan las filas (opcional)
+            descendente: Ordenar de mayor a menor
+            limite: Cantidad máxima de filas (p. ej. solo las que se muestran en una tabla)
+
+        Returns:
+            DataFrame con las columnas de la tabla (la fecha ya convertida)
+        """
+        where, parametros = self._where(tabla, filtros)
+        consulta = f"SELECT * FROM {_columna(tabla)}{where}"
+        if orden:
+            consulta += f" ORDER BY {_columna(orden)}{' DESC' if descendente else ''}"
+        if limite is not None:
+            consulta += f" LIMIT {int(limite)}"
+        return self._leer(tabla, consulta, parametros)
+
+    def totales(self, tabla: str, valor: str, filtros: Optional[Filtros] = None,
+                maximo: Optional[str] = None, distintos: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Cantidad de filas y suma de `valor` de las filas que cumplen los filtros
+
+        Args:
+            tabla: Nombre de la tabla
+            valor: Columna a sumar
+            filtros: Filtros a aplicar
+            maximo: Columna de la que se devuelve el valor máximo (opcional)
+            distintos: Columna de la que se cuentan los valores distintos (opcional)
+
+        Returns:
+            Diccionario con 'filas' y 'suma' (y 'maximo' y 'distintos' si se pidieron)
+        """
+        where, parametros = self._where(tabla, filtros)
+        columnas = ["COUNT(*)", f"COALESCE(SUM({_columna(valor)}), 0)"]
+        if maximo:
+            columnas.append(f"MAX({_columna(maximo)})")
+        if distintos:
+            columnas.append(f"COUNT(DISTINCT {_columna(distintos)})")
+
+        with closing(self._conectar()) as conexion:
+            fila = conexion.execute(
+                f"SELECT {', '.join(columnas)} FROM {_columna(tabla)}{where}", parametros
+            ).fetchone()
+
+        resultado = {'filas': fila[0], 'suma': float(fila[1])}
+        extras = fila[2:]
+        if maximo:
+            resultado['maximo'], extras = extras[0], extras[1:]
+        if distintos:
+            resultado['distintos'] = extras[0]
+        return resultado
+
+    def agrupar(self, tabla: str, por: str, valor: str, filtros: Optional[Filtros] = None,
+                periodo: Optional[str] = None, limite: Optional[int] = None,
+                descendente: bool = False) -> pd.DataFrame:
+        """
+        Suma de `valor` agrupada por una columna o por período de la fecha
+
+        Args:
+            tabla: Nombre de la tabla
+            por: Columna de agrupación (con `periodo`, nombre de la columna resultante)
+            valor: Columna a sumar
+            filtros: Filtros a aplicar
+            periodo: 'dia' o 'mes' para agrupar por la columna de fecha
+            limite: Cantidad máxima de grupos (los de mayor suma si `descendente`)
+            descendente: Ordenar por la suma de mayor a menor (si no, por el grupo)
+
+        Returns:
+            DataFrame con las columnas `por` y `valor`
+        """
+        where, parametros = self._where(tabla, filtros)
+
+        if periodo:
+            info = self._info_tabla(tabla)
+            grupo = f"substr({_columna(info[1])}, 1, {PERIODOS_SQL[periodo]})"
+        else:
+            grupo = _columna(por)
+
+        orden = f"{_columna(valor)} DESC" if descendente else _columna(por)
+        consulta = (
+            f"SELECT {grupo} AS {_columna(por)}, SUM({_columna(valor)}) AS {_columna(valor)} "
+            f"FROM {_columna(tabla)}{where} GROUP BY {grupo} ORDER BY {orden}"
+        )
+        if limite:
+            consulta += f" LIMIT {int(limite)}"
+
+        with closing(self._conectar()) as conexion:
+            return pd.read_sql_query(consulta, conexion, params=parametros)
+
+    def valores_distintos(self, tabla: str, columna: str) -> List[Any]:
+        """
+        Valores distintos (no nulos) de una columna, resueltos con su índice
+        """
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(
+                f"SELECT DISTINCT {_columna(columna)} FROM {_columna(tabla)} "
+                f"WHERE {_columna(columna)} IS NOT NULL ORDER BY {_columna(columna)}"
+            ).fetchall()
+        return [fila[0] for fila in filas]
+
+    def rango_fechas(self, tabla: str) -> Optional[Tuple[date, date]]:
+        """
+        Primera y última fecha de la tabla
+        """
+        info = self._info_tabla(tabla)
+        if not info or not info[1]:
+            return None
+        with closing(self._conectar()) as conexion:
+            minimo, maximo = conexion.execute(
+                f"SELECT MIN({_columna(info[1])}), MAX({_columna(info[1])}) FROM {_columna(tabla)}"
+            ).fetchone()
+        if minimo is None:
+            return None
+        return pd.Timestamp(minimo).date(), pd.Timestamp(maximo).date()
+
+
+@st.cache_resource
+def obtener_almacen() -> AlmacenTransacciones:
+    """
+    Almacén único del proceso
+    """
+    return AlmacenTransacciones()
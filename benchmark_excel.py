@@ -0,0 +1,74 @@
+"""
+Benchmark de los motores de lectura de Excel
+Genera libros con create_sample_data.py y mide el tiempo de lectura de cada motor instalado.
+El motor más rápido en el libro más grande queda guardado y lector_excel lo usa por defecto
+(MOTOR_EXCEL=auto)
+
+Uso:
+    python benchmark_excel.py
+    python benchmark_excel.py --filas 1000 100000 --repeticiones 3
+"""
+
+import argparse
+import os
+import time
+
+from cache_local import obtener_directorio_cache, guardar_json
+from create_sample_data import create_sample_data
+from lector_excel import leer_excel, motores_disponibles, NOMBRE_BENCHMARK
+
+FILAS_POR_DEFECTO = [1_000, 100_000, 1_000_000]
+
+
+def preparar_libro(filas):
+    """Crea (una sola vez) el libro de ejemplo con la cantidad de filas indicada"""
+    archivo = os.path.join(obtener_directorio_cache(), f"benchmark_{filas}.xlsx")
+    if not os.path.exists(archivo):
+        print(f"🛠️ Generando libro de {filas:,} filas (puede tardar varios minutos)...")
+        create_sample_data(filas=filas, archivo=archivo)
+    return archivo
+
+
+def medir_motor(motor, archivo, repeticiones):
+    """Mejor tiempo de lectura (en segundos) de un motor sobre un archivo"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        df = leer_excel(archivo, motor=motor)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide los motores de lectura de Excel")
+    parser.add_argument('--filas', type=int, nargs='+', default=FILAS_POR_DEFECTO,
+                        help="Tamaños de libro a medir (filas)")
+    parser.add_argument('--repeticiones', type=int, default=1,
+                        help="Lecturas por motor y tamaño (se toma la mejor)")
+    args = parser.parse_args()
+
+    motores = motores_disponibles()
+    print(f"⚙️ Motores instalados: {', '.join(motores)}")
+
+    resultados = {}
+    for filas in sorted(args.filas):
+        archivo = preparar_libro(filas)
+        resultados[filas] = {}
+        for motor in motores:
+            segundos, filas_leidas = medir_motor(motor, archivo, args.repeticiones)
+            resultados[filas][motor] = round(segundos, 4)
+            print(f"  {filas:>10,} filas | {motor:<9} | {segundos:8.3f} s | {filas_leidas:,} filas leídas")
+
+    mayor = max(resultados)
+    motor_mas_rapido = min(resultados[mayor], key=resultados[mayor].get)
+
+    guardar_json(NOMBRE_BENCHMARK, {
+        'motor_mas_rapido': motor_mas_rapido,
+        'resultados': {str(filas): tiempos for filas, tiempos in resultados.items()},
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S')
+    })
+    print(f"🏆 Motor más rápido con {mayor:,} filas: {motor_mas_rapido} (guardado para MOTOR_EXCEL=auto)")
+
+
+if __name__ == "__main__":
+    main()
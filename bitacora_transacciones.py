@@ -0,0 +1,232 @@
+"""
+Bitácora de transacciones de solo anexado, indexada por MessageID
+Cada sincronización agrega un segmento Parquet con las filas nuevas, las modificadas y las
+eliminadas; un índice MessageID -> hash de la fila permite saber qué cambió sin volver a
+transformar todo el libro, y evita duplicados
+"""
+
+import os
+import re
+from typing import Optional, Dict, List, Set, Tuple
+
+import pandas as pd
+
+from cache_local import obtener_directorio_cache, nombre_seguro, guardar_parquet
+
+COLUMNA_ID = 'MessageID'
+
+# Operaciones registradas en la bitácora
+ALTA = 'alta'
+CAMBIO = 'cambio'
+BAJA = 'baja'
+
+# Segmentos a partir de los cuales la bitácora se compacta en uno solo
+MAX_SEGMENTOS = 20
+
+_PATRON_SEGMENTO = re.compile(r'^segmento_(\d+)\.parquet$')
+
+
+def _ids(df: pd.DataFrame) -> pd.Series:
+    """
+    MessageID normalizado como texto (None si la fila no tiene)
+    """
+    return df[COLUMNA_ID].astype(str).where(df[COLUMNA_ID].notna())
+
+
+def _hash_filas(df: pd.DataFrame) -> pd.Series:
+    """
+    Hash del contenido de cada fila; se calcula sobre el texto para no depender del tipo
+    que el lector infiera en cada bloque
+    """
+    return pd.util.hash_pandas_object(df.astype(str), index=False).astype(str)
+
+
+class BitacoraTransacciones:
+    """
+    Bitácora de un archivo de transacciones
+
+    Los segmentos se numeran en orden; el estado de sincronización guarda el número del
+    último confirmado y los posteriores (de una sincronización interrumpida) se descartan al
+    abrir. La lista de segmentos se lee del disco una sola vez.
+    """
+
+    def __init__(self, nombre: str, segmentos_confirmados: Optional[int] = None):
+        """
+        Args:
+            nombre: Nombre del archivo de transacciones
+            segmentos_confirmados: Número del último segmento reflejado en los datos
+                guardados; los siguientes se descartan (None para conservar todos)
+        """
+        self.directorio = os.path.join(obtener_directorio_cache(), f"bitacora_{nombre_seguro(nombre)}")
+        os.makedirs(self.directorio, exist_ok=True)
+        self._indice: Optional[Dict[str, str]] = None
+
+        # Número de segmento -> ruta, en orden
+        numerados = []
+        for archivo in os.listdir(self.directorio):
+            coincidencia = _PATRON_SEGMENTO.match(archivo)
+            if coincidencia:
+                numerados.append((int(coincidencia.group(1)), os.path.join(self.directorio, archivo)))
+        self._segmentos: List[Tuple[int, str]] = sorted(numerados)
+
+        if segmentos_confirmados is not None:
+            for numero, ruta in self._segmentos:
+                if numero > segmentos_confirmados:
+                    os.remove(ruta)
+            self._segmentos = [(n, r) for n, r in self._segmentos if n <= segmentos_confirmados]
+
+    def _rutas_segmentos(self) -> List[str]:
+        return [ruta for _, ruta in self._segmentos]
+
+    @property
+    def segmentos(self) -> int:
+        """
+        Cantidad de segmentos de la bitácora
+        """
+        return len(self._segmentos)
+
+    @property
+    def ultimo_segmento(self) -> int:
+        """
+        Número del último segmento (0 si no hay); es el que confirma el estado de sincronización
+        """
+        return self._segmentos[-1][0] if self._segmentos else 0
+
+    def reiniciar(self) -> None:
+        """
+        Elimina todos los segmentos (por ejemplo, al forzar una sincronización completa)
+        """
+        for ruta in self._rutas_segmentos():
+            os.remove(ruta)
+        self._segmentos = []
+        self._indice = {}
+
+    def compactar(self, max_segmentos: int = MAX_SEGMENTOS) -> bool:
+        """
+        Reemplaza los segmentos por uno solo con la última operación de cada MessageID
+
+        Debe llamarse después de confirmar los segmentos en el estado de sincronización. El
+        segmento compactado conserva el número del último, así ese estado sigue siendo válido;
+        los anteriores se eliminan del más viejo al más nuevo, de modo que una interrupción
+        deja segmentos que el compactado ya refleja.
+
+        Args:
+            max_segmentos: Solo se compacta si hay más segmentos que este valor
+
+        Returns:
+            True si se compactó la bitácora
+        """
+        if len(self._segmentos) <= max_segmentos:
+            return False
+
+        registros = pd.concat(
+            [pd.read_parquet(ruta) for ruta in self._rutas_segmentos()], ignore_index=True
+        ).drop_duplicates(COLUMNA_ID, keep='last')
+
+        numero, ruta_ultimo = self._segmentos[-1]
+        guardar_parquet(ruta_ultimo, registros)
+        for _, ruta in self._segmentos[:-1]:
+            os.remove(ruta)
+        self._segmentos = [(numero, ruta_ultimo)]
+        return True
+
+    def indice(self) -> Dict[str, str]:
+        """
+        Índice MessageID -> hash de la última versión de cada transacción vigente
+
+        Se arma leyendo solo las columnas de ID, hash y operación de cada segmento.
+        """
+        if self._indice is None:
+            partes = [
+                pd.read_parquet(ruta, columns=[COLUMNA_ID, '_hash', '_op'])
+                for ruta in self._rutas_segmentos()
+            ]
+            if partes:
+                registros = pd.concat(partes, ignore_index=True).drop_duplicates(COLUMNA_ID, keep='last')
+                registros = registros[registros['_op'] != BAJA]
+                self._indice = dict(zip(registros[COLUMNA_ID], registros['_hash']))
+            else:
+                self._indice = {}
+        return self._indice
+
+    def _guardar_segmento(self, segmento: pd.DataFrame) -> None:
+        numero = self.ultimo_segmento + 1
+        ruta = os.path.join(self.directorio, f"segmento_{numero:06d}.parquet")
+        guardar_parquet(ruta, segmento)
+        self._segmentos.append((numero, ruta))
+
+    def fusionar(self, df_crudo: pd.DataFrame, completo: bool = True) -> Tuple[pd.DataFrame, Set[str]]:
+        """
+        Registra una versión del libro y devuelve solo lo que cambió
+
+        Es idempotente: fusionar dos veces las mismas filas no agrega nada la segunda vez.
+
+        Args:
+            df_crudo: Filas del libro sin transformar (con columna MessageID)
+            completo: Si las filas son el libro completo; solo entonces los MessageID
+                ausentes se registran como eliminados
+
+        Returns:
+            Tupla (filas nuevas o modificadas, más las que no tienen MessageID;
+            MessageID eliminados)
+        """
+        if df_crudo.empty or COLUMNA_ID not in df_crudo.columns:
+            return df_crudo, set()
+
+        ids = _ids(df_crudo)
+        sin_id = df_crudo[ids.isna()]
+
+        # Un MessageID repetido en el libro cuenta una sola vez (la última fila)
+        con_id = df_crudo[ids.notna()]
+        ids = ids[ids.notna()]
+        unicas = ~ids.duplicated(keep='last')
+        con_id, ids = con_id[unicas], ids[unicas]
+
+        indice = self.indice()
+        hashes = _hash_filas(con_id)
+        previos = ids.map(indice)
+        es_alta = previos.isna()
+        es_cambio = ~es_alta & (previos != hashes)
+
+        eliminados = set(indice) - set(ids) if completo else set()
+
+        cambiadas = con_id[es_alta | es_cambio]
+        if not cambiadas.empty or eliminados:
+            segmento = cambiadas.assign(
+                **{COLUMNA_ID: ids[es_alta | es_cambio]},
+                _hash=hashes[es_alta | es_cambio],
+                _op=es_cambio[es_alta | es_cambio].map({True: CAMBIO, False: ALTA})
+            )
+            if eliminados:
+                bajas = pd.DataFrame({COLUMNA_ID: sorted(eliminados), '_hash': None, '_op': BAJA})
+                segmento = pd.concat([segmento, bajas], ignore_index=True)
+
+            self._guardar_segmento(segmento)
+
+            indice.update(zip(ids[es_alta | es_cambio], hashes[es_alta | es_cambio]))
+            for message_id in eliminados:
+                indice.pop(message_id, None)
+
+        # Conservar el orden del libro
+        return pd.concat([cambiadas, sin_id]).sort_index(), eliminados
+
+    def registrar_eliminados(self, ids_vigentes: Set[str]) -> Set[str]:
+        """
+        Registra como eliminados los MessageID vigentes que ya no están en el libro
+
+        Complementa a `fusionar(..., completo=False)` cuando el libro se recorre por bloques:
+        se llama una vez al final con todos los MessageID vistos.
+
+        Args:
+            ids_vigentes: MessageID presentes en el libro
+
+        Returns:
+            MessageID eliminados
+        """
+        indice = self.indice()
+        eliminados = set(indice) - ids_vigentes
+        if eliminados:
+            self._guardar_segmento(pd.DataFrame({COLUMNA_ID: sorted(eliminados), '_hash': None, '_op': BAJA}))
+            for message_id in eliminados:
+                indice.pop(message_id, None)
+        return eliminados
@@ -0,0 +1,194 @@
+"""
+Caché local en disco para el dashboard
+Guarda el estado de sincronización y los datos procesados entre sesiones y reinicios
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Optional, Dict, Any, Tuple, Iterable
+
+import pandas as pd
+
+
+def obtener_directorio_cache() -> str:
+    """
+    Obtiene (y crea si no existe) el directorio de caché local
+
+    Returns:
+        Ruta del directorio, configurable con HOMESPEND_CACHE_DIR
+    """
+    directorio = os.getenv(
+        'HOMESPEND_CACHE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+    )
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def nombre_seguro(texto: str) -> str:
+    """
+    Convierte un texto arbitrario (nombre de archivo, ID) en un nombre válido para disco
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(texto))
+
+
+def escribir_atomico(ruta: str, contenido: bytes) -> None:
+    """
+    Escribe un archivo de forma atómica para no dejar cachés corruptas si el proceso se interrumpe
+    """
+    directorio = os.path.dirname(ruta)
+    fd, ruta_temporal = tempfile.mkstemp(dir=directorio, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(ruta_temporal, ruta)
+    except Exception:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+
+def leer_json(nombre: str) -> Dict[str, Any]:
+    """
+    Lee un estado JSON guardado en la caché
+
+    Returns:
+        Diccionario con el estado o vacío si no existe o está dañado
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"{nombre_seguro(nombre)}.json")
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_json(nombre: str, datos: Dict[str, Any]) -> None:
+    """
+    Guarda un estado JSON en la caché
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"{nombre_seguro(nombre)}.json")
+    escribir_atomico(ruta, json.dumps(datos, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def _preparar_para_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte a texto las columnas de tipos mezclados (p. ej. números y 'Desconocido'),
+    que Parquet no puede guardar en una sola columna
+    """
+    df = df.copy()
+    for columna in df.columns:
+        if df[columna].dtype == object:
+            tipo = pd.api.types.infer_dtype(df[columna], skipna=True)
+            if tipo.startswith('mixed'):
+                df[columna] = df[columna].astype(str).where(df[columna].notna())
+    return df
+
+
+def guardar_parquet(ruta: str, df: pd.DataFrame) -> None:
+    """
+    Escribe un DataFrame como Parquet de forma atómica
+    """
+    fd, ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix='.tmp_')
+    os.close(fd)
+    try:
+        _preparar_para_parquet(df).to_parquet(ruta_temporal, index=False)
+        os.replace(ruta_temporal, ruta)
+    except Exception:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+
+def leer_snapshot(nombre: str) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+    """
+    Lee un snapshot columnar (Parquet) junto con sus metadatos
+
+    Returns:
+        Tupla (DataFrame o None si no existe, metadatos con la versión de la fuente)
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"snapshot_{nombre_seguro(nombre)}.parquet")
+    metadatos = leer_json(f"snapshot_{nombre}")
+    if not metadatos or not os.path.exists(ruta):
+        return None, {}
+    try:
+        return pd.read_parquet(ruta), metadatos
+    except Exception:
+        return None, {}
+
+
+def guardar_snapshot(nombre: str, df: pd.DataFrame, version: Optional[str], **metadatos: Any) -> None:
+    """
+    Guarda el DataFrame ya procesado como snapshot Parquet junto con la versión de la fuente
+
+    Args:
+        nombre: Nombre del snapshot
+        df: Datos procesados
+        version: eTag (u otro identificador) de la versión de la fuente
+        **metadatos: Datos adicionales a guardar con el snapshot
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"snapshot_{nombre_seguro(nombre)}.parquet")
+    guardar_parquet(ruta, df)
+
+    guardar_json(f"snapshot_{nombre}", {
+        'version': version,
+        'filas': len(df),
+        'guardado': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        **metadatos
+    })
+
+
+def leer_bytes(nombre: str) -> Optional[bytes]:
+    """
+    Lee contenido binario guardado en la caché (por ejemplo, un Excel descargado)
+
+    Returns:
+        Bytes del archivo o None si no existe
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"{nombre_seguro(nombre)}.bin")
+    try:
+        with open(ruta, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def guardar_bytes(nombre: str, contenido: bytes) -> None:
+    """
+    Guarda contenido binario en la caché
+    """
+    ruta = os.path.join(obtener_directorio_cache(), f"{nombre_seguro(nombre)}.bin")
+    escribir_atomico(ruta, contenido)
+
+
+def ruta_archivo(nombre: str, extension: str = 'bin') -> str:
+    """
+    Ruta en la caché de un archivo guardado con guardar_flujo
+    """
+    return os.path.join(obtener_directorio_cache(), f"{nombre_seguro(nombre)}.{extension}")
+
+
+def guardar_flujo(nombre: str, bloques: Iterable[bytes], extension: str = 'bin') -> str:
+    """
+    Guarda en la caché un contenido que llega por bloques, sin reunirlo en memoria
+
+    Se escribe en un archivo temporal y se mueve a su destino solo al terminar.
+
+    Returns:
+        Ruta del archivo guardado
+    """
+    ruta = ruta_archivo(nombre, extension)
+    fd, ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for bloque in bloques:
+                f.write(bloque)
+        os.replace(ruta_temporal, ruta)
+    except Exception:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+    return ruta
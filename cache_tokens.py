@@ -0,0 +1,91 @@
+"""
+Caché de tokens de MSAL compartida por todo el proceso
+Los tokens se guardan cifrados en disco (Fernet, clave derivada de SECRET_KEY) para que
+sobrevivan a reinicios; sin SECRET_KEY la caché solo vive en memoria
+"""
+
+import base64
+import os
+import threading
+from typing import Optional
+
+import msal
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from cache_local import leer_bytes, guardar_bytes
+
+# Nombre del archivo cifrado dentro del directorio de caché
+NOMBRE_CACHE_TOKENS = 'tokens_msal'
+
+_cache_tokens: Optional[msal.SerializableTokenCache] = None
+_lock_tokens = threading.Lock()
+
+
+def _obtener_secret_key() -> Optional[str]:
+    """
+    Lee SECRET_KEY de los secrets de Streamlit o de las variables de entorno
+    """
+    try:
+        import streamlit as st
+        return st.secrets["SECRET_KEY"]
+    except Exception:
+        return os.getenv('SECRET_KEY')
+
+
+def _obtener_cifrador() -> Optional[Fernet]:
+    """
+    Crea el cifrador a partir de SECRET_KEY (None si no está configurada)
+    """
+    secret_key = _obtener_secret_key()
+    if not secret_key:
+        return None
+
+    clave = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'homespend-msal-token-cache'
+    ).derive(secret_key.encode('utf-8'))
+    return Fernet(base64.urlsafe_b64encode(clave))
+
+
+def obtener_cache_tokens() -> msal.SerializableTokenCache:
+    """
+    Obtiene la caché de tokens del proceso, cargándola del disco la primera vez
+
+    Returns:
+        Caché serializable para pasar como token_cache a MSAL
+    """
+    global _cache_tokens
+    with _lock_tokens:
+        if _cache_tokens is None:
+            cache = msal.SerializableTokenCache()
+            cifrador = _obtener_cifrador()
+            contenido = leer_bytes(NOMBRE_CACHE_TOKENS) if cifrador else None
+            if contenido:
+                try:
+                    cache.deserialize(cifrador.decrypt(contenido).decode('utf-8'))
+                except (InvalidToken, ValueError):
+                    # Clave distinta o archivo dañado: se empieza con una caché vacía
+                    pass
+            _cache_tokens = cache
+        return _cache_tokens
+
+
+def guardar_cache_tokens() -> None:
+    """
+    Guarda la caché cifrada en disco si cambió desde la última vez
+    """
+    with _lock_tokens:
+        cache = _cache_tokens
+        if cache is None or not cache.has_state_changed:
+            return
+
+        cifrador = _obtener_cifrador()
+        if cifrador is None:
+            return
+
+        guardar_bytes(NOMBRE_CACHE_TOKENS, cifrador.encrypt(cache.serialize().encode('utf-8')))
+        cache.has_state_changed = False
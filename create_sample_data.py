@@ -2,8 +2,13 @@ import pandas as pd
 from datetime import datetime, timedelta
 import random
 
-def create_sample_data():
-    """Crea datos de ejemplo para el dashboard"""
+def create_sample_data(filas=500, archivo='datos_ejemplo.xlsx'):
+    """Crea datos de ejemplo para el dashboard
+    
+    Args:
+        filas: Cantidad de transacciones a generar
+        archivo: Ruta del Excel a crear
+    """
     
     # Configuración de datos de ejemplo
     bancos = ["BAC Credomatic", "Banco Nacional", "BCR", "Banco Popular"]
@@ -35,7 +40,7 @@ def create_sample_data():
     data = []
     message_id = 1000
     
-    for i in range(500):  # 500 transacciones de ejemplo
+    for i in range(filas):
         # Fecha aleatoria en los últimos 6 meses
         days_ago = random.randint(0, 180)
         fecha = end_date - timedelta(days=days_ago)
@@ -73,8 +78,8 @@ def create_sample_data():
     df = pd.DataFrame(data)
     
     # Guardar como Excel
-    df.to_excel('datos_ejemplo.xlsx', index=False)
-    print("✅ Archivo 'datos_ejemplo.xlsx' creado con 500 transacciones de ejemplo")
+    df.to_excel(archivo, index=False)
+    print(f"✅ Archivo '{archivo}' creado con {filas} transacciones de ejemplo")
     print("📊 Puedes usar este archivo para probar el dashboard")
     print("🔗 Sube este archivo a OneDrive/Google Drive y usa la URL pública en la configuración")
 
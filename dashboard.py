@@ -1,13 +1,22 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+import logging
 import os
+import time
 from dotenv import load_dotenv
 import bcrypt
 import requests
-from io import BytesIO
+from lector_excel import leer_archivo_datos
+from cache_local import leer_json, leer_snapshot, guardar_snapshot, ruta_archivo
+from descarga import descargar_a_archivo, huella_archivo
+from registro_datos import obtener_registro
+from almacen_sqlite import almacen_habilitado, obtener_almacen, contar_filas
+from esquema_columnas import normalizar_columnas, ROLES_EXCEL, COLUMNAS_EXCEL
+from transformaciones import agregar_calendario, aplicar_esquema, parsear_montos, parsear_fechas, codigo_mes, fecha_de_codigo
 
 # Cargar variables de entorno de forma explícita
 env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -17,6 +26,26 @@ load_dotenv(env_path)
 if not os.getenv("DASHBOARD_USERNAME"):
     st.error("❌ No se pudo cargar el archivo .env. Verifica que existe en el directorio del proyecto.")
 
+# Fuentes de datos en el registro compartido (los datos de ejemplo nunca se publican como
+# EXCEL_URL) y frecuencia de la actualización en segundo plano
+FUENTE_EXCEL = 'dashboard_excel'
+FUENTE_EJEMPLO = 'dashboard_ejemplo'
+INTERVALO_ACTUALIZACION_S = float(os.getenv("INTERVALO_ACTUALIZACION_S", "300"))
+
+# Segundos durante los que load_data reutiliza la descarga con la que version_actual_excel
+# calculó la huella de una fuente sin ETag
+VIGENCIA_DESCARGA_S = 60
+_descargas_verificadas = {}
+
+# Filas de la tabla de detalle cuando los datos se consultan en el almacén SQLite
+FILAS_TABLA_ALMACEN = 1000
+
+logger = logging.getLogger(__name__)
+
+HEADERS_DESCARGA = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
 # Configuración de la página
 st.set_page_config(
     page_title="Dashboard de Gastos del Hogar",
@@ -103,124 +132,282 @@ Variables de entorno detectadas:
                 st.error("❌ Usuario o contraseña incorrectos")
                 st.warning("💡 Si el problema persiste, verifica la configuración con: `python test_password.py`")
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
+def avisar(tipo, mensaje):
+    """Muestra un aviso en la sesión; en la actualización en segundo plano (sin sesión) solo se registra en el log"""
+    if get_script_run_ctx() is None:
+        logger.info(mensaje)
+    else:
+        getattr(st, tipo)(mensaje)
+
+def modo_debug():
+    """Modo debug de la sesión actual (desactivado en la actualización en segundo plano)"""
+    return get_script_run_ctx() is not None and st.session_state.get('debug_mode', False)
+
 def load_data():
-    """Carga los datos desde el archivo Excel en línea o local"""
+    """Carga los datos desde el archivo Excel en línea o local
+    
+    Si la fuente no responde devuelve None: el registro conserva la última versión buena y
+    los datos de ejemplo se cargan aparte (load_local_data)
+    """
     try:
         excel_url = os.getenv("EXCEL_URL")
         if not excel_url:
-            st.error("URL del archivo Excel no configurada")
+            avisar('error', "URL del archivo Excel no configurada")
             return None
         
         # Opción 1: Intentar cargar desde URL
         if excel_url.startswith('http'):
-            st.info(f"📥 Intentando descargar desde: {excel_url[:50]}...")
+            avisar('info', f"📥 Intentando descargar desde: {excel_url[:50]}...")
             
             # Convertir URL de OneDrive a formato de descarga directa si es necesario
-            if "1drv.ms" in excel_url or "onedrive.live.com" in excel_url:
-                if "?e=" in excel_url:
-                    excel_url = excel_url.replace("?e=", "&download=1&e=")
-                else:
-                    excel_url += "&download=1"
+            excel_url = url_descarga_directa(excel_url)
+            headers = HEADERS_DESCARGA
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            # Si la fuente no cambió, usar el snapshot local ya procesado
+            version_fuente = obtener_version_fuente(excel_url, headers)
+            df_snapshot = cargar_snapshot_vigente(excel_url, version_fuente)
+            if df_snapshot is not None:
+                return df_snapshot
             
             try:
-                response = requests.get(excel_url, headers=headers, timeout=30)
-                response.raise_for_status()
+                # Sin ETag ni Last-Modified la versión es la huella del contenido; si la
+                # actualización en segundo plano acaba de descargar el archivo para calcularla,
+                # se usa esa misma descarga
+                descarga = None if version_fuente else tomar_descarga_verificada(excel_url)
+                if descarga is None:
+                    # Descargar por bloques a disco (reanuda si la conexión se corta)
+                    descarga = descargar_a_archivo(
+                        excel_url,
+                        ruta_archivo('dashboard_excel_descarga', 'xlsx'),
+                        headers=headers
+                    )
                 
                 # Verificar que se descargó contenido válido
-                if len(response.content) == 0:
+                if descarga['bytes'] == 0:
                     raise Exception("El archivo descargado está vacío")
                 
+                # Si la huella del contenido no cambió, se usa el snapshot sin volver a procesar
+                if not version_fuente:
+                    version_fuente = descarga.get('version') or huella_archivo(descarga['ruta'])
+                    df_snapshot = cargar_snapshot_vigente(excel_url, version_fuente)
+                    if df_snapshot is not None:
+                        return df_snapshot
+                
                 # Verificar si es HTML (página web) en lugar de Excel
-                content_type = response.headers.get('content-type', '').lower()
-                if 'text/html' in content_type:
+                if 'text/html' in descarga['content_type'].lower():
                     raise Exception("OneDrive devolvió una página web en lugar del archivo Excel")
                 
-                # Intentar leer el archivo Excel
-                try:
-                    df = pd.read_excel(BytesIO(response.content), engine='openpyxl')
-                except Exception:
-                    df = pd.read_excel(BytesIO(response.content), engine='xlrd')
+                # Leer desde el archivo con el lector de su formato real (falla de inmediato si es HTML)
+                df = leer_archivo_datos(descarga['ruta'])
                 
-                st.success(f"✅ Datos cargados desde URL: {len(df)} filas")
+                avisar('success', f"✅ Datos cargados desde URL: {len(df)} filas")
                 
             except Exception as url_error:
-                st.warning(f"⚠️ Error al cargar desde URL: {str(url_error)}")
-                st.info("🔄 Intentando cargar datos de ejemplo local...")
-                
-                # Fallback: cargar datos de ejemplo
-                if os.path.exists('datos_ejemplo.xlsx'):
-                    df = pd.read_excel('datos_ejemplo.xlsx')
-                    st.warning("📊 Usando datos de ejemplo locales. Para usar datos reales, configura correctamente la URL de OneDrive.")
-                else:
-                    st.error("❌ No se encontraron datos de ejemplo. Ejecuta: python create_sample_data.py")
-                    return None
+                avisar('warning', f"⚠️ Error al cargar desde URL: {str(url_error)}")
+                return None
         
         # Opción 2: Archivo local
         else:
             if os.path.exists(excel_url):
-                df = pd.read_excel(excel_url)
-                st.success(f"✅ Datos cargados desde archivo local: {len(df)} filas")
+                version_fuente = obtener_version_fuente(excel_url)
+                df_snapshot = cargar_snapshot_vigente(excel_url, version_fuente)
+                if df_snapshot is not None:
+                    return df_snapshot
+                
+                df = leer_archivo_datos(excel_url)
+                avisar('success', f"✅ Datos cargados desde archivo local: {len(df)} filas")
             else:
-                st.error(f"❌ Archivo local no encontrado: {excel_url}")
+                avisar('error', f"❌ Archivo local no encontrado: {excel_url}")
                 return None
         
-        # Verificar que el DataFrame no esté vacío
-        if df.empty:
-            st.error("❌ El archivo está vacío")
+        df = preparar_datos(df)
+        if df is None:
             return None
         
-        # Mostrar información de debug si está habilitado
-        if st.session_state.get('debug_mode', False):
-            st.write(f"**Columnas encontradas:** {list(df.columns)}")
-            st.write(f"**Primeras filas:**")
-            st.dataframe(df.head(3))
+        # Guardar snapshot para no volver a procesar mientras la fuente no cambie
+        if version_fuente:
+            guardar_snapshot('dashboard_excel', df, version_fuente, fuente=excel_url)
         
-        # Verificar y ajustar columnas
-        expected_columns = 9
-        if len(df.columns) < expected_columns:
-            st.error(f"❌ El archivo debe tener al menos {expected_columns} columnas. Se encontraron {len(df.columns)}.")
-            return None
+        df.attrs['version_fuente'] = version_fuente
+        return ingerir_en_almacen(df, FUENTE_EXCEL)
         
-        # Asignar nombres de columnas (tomar solo las primeras 9)
-        df = df.iloc[:, :9]  # Tomar solo las primeras 9 columnas
-        df.columns = ['MessageID', 'ID', 'Bank', 'Business', 'Location', 'Date', 'Card', 'Amount', 'Responsible']
-        
-        # Convertir la fecha
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        
-        # Convertir el monto a numérico
-        df['Amount'] = pd.to_numeric(df['Amount'].astype(str).str.replace(',', ''), errors='coerce')
+    except Exception as e:
+        avisar('error', f"Error al cargar los datos: {str(e)}")
+        return None
+
+def load_local_data():
+    """Carga los datos de ejemplo locales, registrados aparte de EXCEL_URL"""
+    try:
+        if not os.path.exists('datos_ejemplo.xlsx'):
+            st.error("❌ No se encontraron datos de ejemplo. Ejecuta: python create_sample_data.py")
+            return None
         
-        # Filtrar filas válidas
-        df = df.dropna(subset=['Date', 'Amount'])
+        st.info("🔄 Intentando cargar datos de ejemplo local...")
+        df = preparar_datos(leer_archivo_datos('datos_ejemplo.xlsx'))
+        if df is None:
+            return None
+        st.warning("📊 Usando datos de ejemplo locales. Para usar datos reales, configura correctamente la URL de OneDrive.")
         
-        return df
+        df.attrs['version_fuente'] = f"ejemplo:{huella_archivo('datos_ejemplo.xlsx')}"
+        return ingerir_en_almacen(df, FUENTE_EJEMPLO)
         
     except Exception as e:
-        st.error(f"Error al cargar los datos: {str(e)}")
+        st.error(f"Error al cargar los datos de ejemplo: {str(e)}")
         return None
 
-def create_summary_cards(df):
-    """Crea tarjetas de resumen"""
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+def preparar_datos(df):
+    """Valida las columnas del Excel y convierte los tipos una vez por versión de los datos"""
+    # Verificar que el DataFrame no esté vacío
+    if df.empty:
+        avisar('error', "❌ El archivo está vacío")
+        return None
     
-    # Filtros para el mes actual
-    current_month_data = df[
-        (df['Date'].dt.month == current_month) & 
-        (df['Date'].dt.year == current_year)
-    ]
+    # Mostrar información de debug si está habilitado
+    if modo_debug():
+        st.write(f"**Columnas encontradas:** {list(df.columns)}")
+        st.write(f"**Primeras filas:**")
+        st.dataframe(df.head(3))
     
-    # Métricas
-    total_gastos = df['Amount'].sum()
-    gastos_mes_actual = current_month_data['Amount'].sum()
-    promedio_diario = current_month_data['Amount'].sum() / max(current_month_data['Date'].dt.day.max(), 1)
-    num_transacciones = len(current_month_data)
+    # Verificar y ajustar columnas
+    expected_columns = len(COLUMNAS_EXCEL)
+    if len(df.columns) < expected_columns:
+        avisar('error', f"❌ El archivo debe tener al menos {expected_columns} columnas. Se encontraron {len(df.columns)}.")
+        return None
+    
+    # Asignar nombres de columnas: por nombre, o por posición si el encabezado no se reconoce
+    # (la asignación se guarda por huella del encabezado)
+    df, faltantes = normalizar_columnas(df, ROLES_EXCEL, posicional=COLUMNAS_EXCEL)
+    if faltantes:
+        avisar('error', f"❌ No se encontraron las columnas: {', '.join(faltantes)}")
+        return None
+    df = df[list(COLUMNAS_EXCEL)]
+    
+    # Convertir la fecha
+    df['Date'] = parsear_fechas(df['Date'])
+    
+    # Convertir el monto a numérico (₡, comas, paréntesis y celdas ya numéricas)
+    df['Amount'], montos_invalidos = parsear_montos(df['Amount'])
+    if montos_invalidos.any() and modo_debug():
+        st.write(f"**Montos no válidos descartados:** {int(montos_invalidos.sum())}")
+    
+    # Filtrar filas válidas
+    df = df.dropna(subset=['Date', 'Amount'])
+    
+    # Dimensiones categóricas y faltantes completados por tipo de columna
+    df = aplicar_esquema(df, 'Date', 'Amount')
+    
+    # Dimensión de calendario (códigos enteros para agrupar sin formatear fechas)
+    return agregar_calendario(df, 'Date')
+
+def url_descarga_directa(excel_url):
+    """Convierte un enlace compartido de OneDrive en URL de descarga directa"""
+    if "1drv.ms" in excel_url or "onedrive.live.com" in excel_url:
+        if "?e=" in excel_url:
+            return excel_url.replace("?e=", "&download=1&e=")
+        return excel_url + "&download=1"
+    return excel_url
+
+def version_actual_excel():
+    """Versión actual de EXCEL_URL para la actualización en segundo plano (sin procesar el archivo)"""
+    excel_url = os.getenv("EXCEL_URL")
+    if not excel_url:
+        return None
+    if excel_url.startswith('http'):
+        excel_url = url_descarga_directa(excel_url)
+        version = obtener_version_fuente(excel_url, HEADERS_DESCARGA)
+        if version:
+            return version
+        # Sin ETag ni Last-Modified: descargar y comparar la huella del contenido; la descarga
+        # queda disponible para que load_data no vuelva a bajar el archivo si cambió
+        try:
+            descarga = descargar_a_archivo(
+                excel_url,
+                ruta_archivo('dashboard_excel_version', 'xlsx'),
+                headers=HEADERS_DESCARGA
+            )
+        except requests.exceptions.RequestException:
+            return None
+        descarga['version'] = huella_archivo(descarga['ruta'])
+        descarga['hora'] = time.monotonic()
+        _descargas_verificadas[excel_url] = descarga
+        return descarga['version']
+    if os.path.exists(excel_url):
+        return obtener_version_fuente(excel_url)
+    return None
+
+def tomar_descarga_verificada(excel_url):
+    """Descarga reciente de version_actual_excel para la URL (con su huella), o None"""
+    descarga = _descargas_verificadas.pop(excel_url, None)
+    if descarga is None or time.monotonic() - descarga['hora'] > VIGENCIA_DESCARGA_S:
+        return None
+    return descarga if os.path.exists(descarga['ruta']) else None
+
+def obtener_version_fuente(excel_url, headers=None):
+    """Identifica la versión actual de la fuente: ETag/Last-Modified de la URL o fecha y tamaño del archivo local"""
+    if not excel_url.startswith('http'):
+        estado = os.stat(excel_url)
+        return f"{estado.st_mtime_ns}-{estado.st_size}"
+    
+    try:
+        response = requests.head(excel_url, headers=headers, timeout=10, allow_redirects=True)
+        if response.ok:
+            return response.headers.get('ETag') or response.headers.get('Last-Modified')
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+def cargar_snapshot_vigente(excel_url, version_fuente):
+    """Devuelve el snapshot local si corresponde a la misma fuente y versión, o None"""
+    if not version_fuente:
+        return None
+    
+    # Con el almacén SQLite ya cargado en esta versión no hace falta leer el snapshot
+    metadatos = leer_json('snapshot_dashboard_excel')
+    if (almacen_habilitado() and metadatos.get('fuente') == excel_url and metadatos.get('version') == version_fuente
+            and obtener_almacen().version(FUENTE_EXCEL) == version_fuente):
+        avisar('info', "⚡ Datos sin cambios, usando el almacén local")
+        return obtener_almacen().vista(FUENTE_EXCEL)
+    
+    df_snapshot, metadatos = leer_snapshot('dashboard_excel')
+    if df_snapshot is None or metadatos.get('fuente') != excel_url or metadatos.get('version') != version_fuente:
+        return None
+    
+    avisar('info', f"⚡ Datos sin cambios, usando snapshot local ({len(df_snapshot)} filas)")
+    df_snapshot = agregar_calendario(aplicar_esquema(df_snapshot, 'Date', 'Amount'), 'Date')
+    df_snapshot.attrs['version_fuente'] = version_fuente
+    return ingerir_en_almacen(df_snapshot, FUENTE_EXCEL)
+
+def ingerir_en_almacen(df, fuente):
+    """Con el almacén SQLite, carga en la base local (una tabla por fuente) la versión que se va a
+    publicar en el registro y devuelve su vista sin filas: el registro no guarda otra copia completa"""
+    df.attrs['tabla_almacen'] = fuente
+    if not almacen_habilitado():
+        return df
+    almacen = obtener_almacen()
+    almacen.ingerir(fuente, df, version=df.attrs.get('version_fuente'), columna_fecha='Date')
+    return almacen.vista(fuente)
+
+def create_summary_cards(df):
+    """Crea tarjetas de resumen"""
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        # Totales calculados en el almacén SQLite
+        filtros_mes = {**filtros, 'iguales': {**filtros['iguales'], 'Mes': codigo_mes(datetime.now())}}
+        mes = obtener_almacen().totales(df.attrs['tabla_almacen'], 'Amount', filtros_mes, maximo='Dia')
+        total_gastos = df.attrs['suma']
+        gastos_mes_actual = mes['suma']
+        dias_transcurridos = int(mes['maximo'] % 100) if mes['filas'] else 1
+        num_transacciones = mes['filas']
+    else:
+        # Filtro para el mes actual
+        current_month_data = df[df['Mes'] == codigo_mes(datetime.now())]
+        
+        # Métricas
+        total_gastos = df['Amount'].sum()
+        gastos_mes_actual = current_month_data['Amount'].sum()
+        dias_transcurridos = int(current_month_data['Dia'].max() % 100) if not current_month_data.empty else 1
+        num_transacciones = len(current_month_data)
+    promedio_diario = gastos_mes_actual / max(dias_transcurridos, 1)
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -252,14 +439,29 @@ def create_summary_cards(df):
             delta=None
         )
 
+def agrupar_montos(df, por, limite=None, descendente=False):
+    """Suma de Amount por columna, con consulta indexada si los datos vienen del almacén SQLite"""
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        return obtener_almacen().agrupar(df.attrs['tabla_almacen'], por, 'Amount', filtros, limite=limite, descendente=descendente)
+    
+    datos = df.groupby(por, observed=True)['Amount'].sum().reset_index()
+    if descendente:
+        datos = datos.sort_values('Amount', ascending=False)
+    return datos.head(limite) if limite else datos
+
 def create_charts(df):
     """Crea los gráficos del dashboard"""
     
     # Gráfico de gastos por mes
     st.subheader("📈 Tendencia de Gastos Mensuales")
     
-    monthly_data = df.groupby([df['Date'].dt.to_period('M')])['Amount'].sum().reset_index()
-    monthly_data['Date'] = monthly_data['Date'].dt.to_timestamp()
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        monthly_data = obtener_almacen().agrupar(df.attrs['tabla_almacen'], 'Mes', 'Amount', filtros)
+    else:
+        monthly_data = df.groupby('Mes')['Amount'].sum().reset_index()
+    monthly_data['Date'] = fecha_de_codigo(monthly_data['Mes'])
     
     fig_monthly = px.line(
         monthly_data, 
@@ -276,8 +478,7 @@ def create_charts(df):
     with col1:
         # Gráfico por responsable
         st.subheader("👤 Gastos por Responsable")
-        responsible_data = df.groupby('Responsible')['Amount'].sum().reset_index()
-        responsible_data = responsible_data.sort_values('Amount', ascending=False)
+        responsible_data = agrupar_montos(df, 'Responsible', descendente=True)
         
         fig_responsible = px.pie(
             responsible_data,
@@ -290,8 +491,7 @@ def create_charts(df):
     with col2:
         # Gráfico por banco/tarjeta
         st.subheader("🏦 Gastos por Banco")
-        bank_data = df.groupby('Bank')['Amount'].sum().reset_index()
-        bank_data = bank_data.sort_values('Amount', ascending=False).head(10)
+        bank_data = agrupar_montos(df, 'Bank', limite=10, descendente=True)
         
         fig_bank = px.bar(
             bank_data,
@@ -304,8 +504,7 @@ def create_charts(df):
     
     # Gráfico de gastos por categoría de negocio
     st.subheader("🏪 Gastos por Tipo de Negocio")
-    business_data = df.groupby('Business')['Amount'].sum().reset_index()
-    business_data = business_data.sort_values('Amount', ascending=False).head(15)
+    business_data = agrupar_montos(df, 'Business', limite=15, descendente=True)
     
     fig_business = px.bar(
         business_data,
@@ -320,9 +519,16 @@ def create_filters(df):
     """Crea los filtros laterales"""
     st.sidebar.header("🎛️ Filtros")
     
+    almacen = obtener_almacen() if almacen_habilitado() else None
+    tabla = df.attrs.get('tabla_almacen', FUENTE_EXCEL)
+    
     # Filtro de fecha
-    min_date = df['Date'].min().date()
-    max_date = df['Date'].max().date()
+    rango = almacen.rango_fechas(tabla) if almacen else None
+    if rango:
+        min_date, max_date = rango
+    else:
+        min_date = df['Date'].min().date()
+        max_date = df['Date'].max().date()
     
     date_range = st.sidebar.date_input(
         "Rango de Fechas",
@@ -332,11 +538,15 @@ def create_filters(df):
     )
     
     # Filtro de responsable
-    responsables = ['Todos'] + list(df['Responsible'].dropna().unique())
+    responsables = ['Todos'] + (
+        almacen.valores_distintos(tabla, 'Responsible') if almacen else list(df['Responsible'].dropna().unique())
+    )
     selected_responsible = st.sidebar.selectbox("Responsable", responsables)
     
     # Filtro de banco
-    bancos = ['Todos'] + list(df['Bank'].dropna().unique())
+    bancos = ['Todos'] + (
+        almacen.valores_distintos(tabla, 'Bank') if almacen else list(df['Bank'].dropna().unique())
+    )
     selected_bank = st.sidebar.selectbox("Banco", bancos)
     
     # Filtro de monto mínimo
@@ -344,8 +554,29 @@ def create_filters(df):
     
     return date_range, selected_responsible, selected_bank, min_amount
 
+def filtros_seleccionados(date_range, responsible, bank, min_amount):
+    """Filtros del sidebar en el formato del almacén SQLite"""
+    filtros = {'iguales': {}, 'minimos': {'Amount': min_amount}}
+    if len(date_range) == 2:
+        filtros['desde'], filtros['hasta'] = date_range
+    if responsible != 'Todos':
+        filtros['iguales']['Responsible'] = responsible
+    if bank != 'Todos':
+        filtros['iguales']['Bank'] = bank
+    return filtros
+
 def filter_data(df, date_range, responsible, bank, min_amount):
     """Aplica los filtros a los datos"""
+    if almacen_habilitado():
+        # Consulta indexada; los gráficos reutilizan los mismos filtros
+        filtros = filtros_seleccionados(date_range, responsible, bank, min_amount)
+        # Solo se consultan los totales; las tarjetas, los gráficos y la tabla consultan el
+        # almacén con los mismos filtros
+        filtered_df = df.iloc[0:0].copy()
+        filtered_df.attrs.update(obtener_almacen().totales(df.attrs['tabla_almacen'], 'Amount', filtros))
+        filtered_df.attrs['filtros_sql'] = filtros
+        return filtered_df
+    
     filtered_df = df.copy()
     
     # Filtro de fecha
@@ -373,8 +604,17 @@ def show_data_table(df):
     """Muestra la tabla de datos"""
     st.subheader("📋 Datos Detallados")
     
-    # Ordenar por fecha descendente
-    df_display = df.sort_values('Date', ascending=False)
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        # Solo las filas más recientes, ordenadas y limitadas en la consulta
+        df_display = obtener_almacen().consultar(
+            df.attrs['tabla_almacen'], filtros, orden='Date', descendente=True, limite=FILAS_TABLA_ALMACEN
+        )
+        if contar_filas(df) > len(df_display):
+            st.caption(f"Mostrando las {len(df_display):,} transacciones más recientes de {contar_filas(df):,}")
+    else:
+        # Ordenar por fecha descendente
+        df_display = df.sort_values('Date', ascending=False)
     
     # Formatear la tabla
     df_display['Date'] = df_display['Date'].dt.strftime('%Y-%m-%d')
@@ -403,16 +643,37 @@ def main():
         st.session_state['authenticated'] = False
         st.rerun()
     
+    registro = obtener_registro()
+    
     # Botón para actualizar datos
     if st.sidebar.button("🔄 Actualizar Datos"):
-        st.cache_data.clear()
+        registro.invalidar(FUENTE_EXCEL)
+        st.session_state.pop('fallo_excel', None)
         st.rerun()
     
-    # Cargar datos
-    with st.spinner("Cargando datos..."):
-        df = load_data()
+    # Revalidar la fuente en segundo plano; las sesiones siempre reciben la última copia buena
+    registro.programar_actualizacion(
+        FUENTE_EXCEL, load_data,
+        obtener_version=version_actual_excel,
+        intervalo_s=INTERVALO_ACTUALIZACION_S
+    )
     
-    if df is None or df.empty:
+    # Cargar datos (solo bloquea la primera vez). Si EXCEL_URL no responde se usan los datos
+    # de ejemplo, registrados aparte, y la sesión no reintenta la descarga en cada interacción:
+    # la actualización en segundo plano publica EXCEL_URL en cuanto vuelva a estar disponible
+    with st.spinner("Cargando datos..."):
+        df = None
+        ultimo_fallo = st.session_state.get('fallo_excel')
+        if (registro.clave_vigente(FUENTE_EXCEL) is not None or ultimo_fallo is None
+                or time.monotonic() - ultimo_fallo >= INTERVALO_ACTUALIZACION_S):
+            df = registro.adquirir(FUENTE_EXCEL, load_data)
+            if df is None:
+                st.session_state['fallo_excel'] = time.monotonic()
+        if df is None:
+            df = registro.adquirir(FUENTE_EJEMPLO, load_local_data)
+        fuente_datos = df.attrs.get('tabla_almacen', FUENTE_EXCEL) if df is not None else FUENTE_EXCEL
+    
+    if df is None or contar_filas(df) == 0:
         st.error("No se pudieron cargar los datos")
         return
     
@@ -422,14 +683,17 @@ def main():
     # Aplicar filtros
     filtered_df = filter_data(df, date_range, responsible, bank, min_amount)
     
-    if filtered_df.empty:
+    if contar_filas(filtered_df) == 0:
         st.warning("No hay datos que coincidan con los filtros seleccionados")
         return
     
     # Mostrar información de datos filtrados
     st.sidebar.markdown("---")
-    st.sidebar.markdown(f"**Registros mostrados:** {len(filtered_df)}")
-    st.sidebar.markdown(f"**Total general:** {len(df)}")
+    st.sidebar.markdown(f"**Registros mostrados:** {contar_filas(filtered_df)}")
+    st.sidebar.markdown(f"**Total general:** {contar_filas(df)}")
+    info_datos = registro.info_vigente(fuente_datos)
+    if info_datos:
+        st.sidebar.caption(f"🕒 Datos al {info_datos['verificado']:%d/%m/%Y %H:%M}")
     
     # Crear tarjetas de resumen
     create_summary_cards(filtered_df)
@@ -446,7 +710,7 @@ def main():
     
     # Footer
     st.markdown("---")
-    st.markdown("*Dashboard actualizado automáticamente cada 5 minutos*")
+    st.markdown(f"*Dashboard actualizado automáticamente cada {INTERVALO_ACTUALIZACION_S / 60:g} minutos*")
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,8 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
 import bcrypt
+from lector_excel import leer_excel
+from transformaciones import aplicar_esquema, parsear_montos, parsear_fechas
 
 # Configuración de la página
 st.set_page_config(
@@ -42,22 +44,22 @@ def login_form():
 def load_demo_data():
     """Carga los datos desde el archivo Excel local"""
     try:
-        df = pd.read_excel('datos_ejemplo.xlsx')
+        df = leer_excel('datos_ejemplo.xlsx')
         
         # Limpiar y procesar los datos
         df.columns = ['MessageID', 'ID', 'Bank', 'Business', 'Location', 'Date', 'Card', 'Amount', 'Responsible']
         
         # Convertir la fecha
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        df['Date'] = parsear_fechas(df['Date'])
         
-        # Limpiar el monto (remover ₡ y comas)
-        df['Amount'] = df['Amount'].astype(str).str.replace('₡', '').str.replace(',', '')
-        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+        # Limpiar el monto (₡, comas, paréntesis) en una sola pasada
+        df['Amount'], _ = parsear_montos(df['Amount'])
         
         # Filtrar filas válidas
         df = df.dropna(subset=['Date', 'Amount'])
         
-        return df
+        # Dimensiones categóricas (menos memoria, groupby y filtros más rápidos)
+        return aplicar_esquema(df, 'Date', 'Amount')
         
     except Exception as e:
         st.error(f"Error al cargar los datos: {str(e)}")
@@ -135,7 +137,7 @@ def create_charts(df):
     with col1:
         # Gráfico por responsable
         st.subheader("👤 Gastos por Responsable")
-        responsible_data = df.groupby('Responsible')['Amount'].sum().reset_index()
+        responsible_data = df.groupby('Responsible', observed=True)['Amount'].sum().reset_index()
         responsible_data = responsible_data.sort_values('Amount', ascending=False)
         
         fig_responsible = px.pie(
@@ -149,7 +151,7 @@ def create_charts(df):
     with col2:
         # Gráfico por banco/tarjeta
         st.subheader("🏦 Gastos por Banco")
-        bank_data = df.groupby('Bank')['Amount'].sum().reset_index()
+        bank_data = df.groupby('Bank', observed=True)['Amount'].sum().reset_index()
         bank_data = bank_data.sort_values('Amount', ascending=False).head(10)
         
         fig_bank = px.bar(
@@ -164,7 +166,7 @@ def create_charts(df):
     
     # Gráfico de gastos por categoría de negocio
     st.subheader("🏪 Gastos por Tipo de Negocio")
-    business_data = df.groupby('Business')['Amount'].sum().reset_index()
+    business_data = df.groupby('Business', observed=True)['Amount'].sum().reset_index()
     business_data = business_data.sort_values('Amount', ascending=False).head(15)
     
     fig_business = px.bar(
@@ -9,6 +9,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from onedrive_graph import load_spending_data
+from transformaciones import agregar_calendario, aplicar_esquema, etiqueta_mes, COLUMNAS_CALENDARIO
 
 # Configuración de la página
 st.set_page_config(
@@ -68,8 +69,8 @@ def create_monthly_spending_chart(df):
     if df.empty:
         return go.Figure()
     
-    monthly_data = df.groupby([df['Fecha'].dt.to_period('M')])['Monto'].sum().reset_index()
-    monthly_data['Fecha_str'] = monthly_data['Fecha'].astype(str)
+    monthly_data = df.groupby('Mes')['Monto'].sum().reset_index()
+    monthly_data['Fecha_str'] = etiqueta_mes(monthly_data['Mes'])
     
     fig = px.line(
         monthly_data, 
@@ -99,7 +100,7 @@ def create_category_chart(df):
     if df.empty:
         return go.Figure()
     
-    category_data = df.groupby('Categoría')['Monto'].sum().sort_values(ascending=True)
+    category_data = df.groupby('Categoría', observed=True)['Monto'].sum().sort_values(ascending=True)
     
     fig = px.bar(
         x=category_data.values,
@@ -172,11 +173,11 @@ def show_metrics(df):
         st.metric("💰 Gasto Total", format_currency(total_spent))
     
     with col2:
-        avg_monthly = df.groupby(df['Fecha'].dt.to_period('M'))['Monto'].sum().mean()
+        avg_monthly = df.groupby('Mes')['Monto'].sum().mean()
         st.metric("📅 Promedio Mensual", format_currency(avg_monthly))
     
     with col3:
-        current_month = df[df['Fecha'].dt.to_period('M') == df['Fecha'].max().to_period('M')]['Monto'].sum()
+        current_month = df.loc[df['Mes'] == df['Mes'].max(), 'Monto'].sum()
         st.metric("📈 Mes Actual", format_currency(current_month))
     
     with col4:
@@ -261,10 +262,33 @@ def show_dashboard(df):
     
     # Tabla de datos completa
     with st.expander("📋 Ver todos los datos"):
-        display_df = filtered_df.copy()
+        display_df = filtered_df.drop(columns=list(COLUMNAS_CALENDARIO), errors='ignore')
         display_df['Monto'] = display_df['Monto'].apply(format_currency)
         st.dataframe(display_df, use_container_width=True, hide_index=True)
 
+def load_data():
+    """
+    Carga los datos y les aplica el esquema y la dimensión de calendario una sola vez por
+    conjunto cargado; en los reruns se reutiliza el resultado guardado en la sesión
+    
+    No se usa el registro compartido porque load_spending_data resuelve la autenticación
+    de cada sesión.
+    """
+    df = load_spending_data()
+    if df is None:
+        return None
+    
+    # Mismo conjunto: el mismo objeto o la misma versión de la fuente (una caché que
+    # devuelve copias conserva attrs['version_fuente'])
+    version = df.attrs.get('version_fuente')
+    previo = st.session_state.get('datos_preparados')
+    if previo is not None and (previo['datos'] is df or (version is not None and previo['version'] == version)):
+        return previo['preparados']
+    
+    df_preparado = agregar_calendario(aplicar_esquema(df, 'Fecha', 'Monto'), 'Fecha')
+    st.session_state['datos_preparados'] = {'datos': df, 'version': version, 'preparados': df_preparado}
+    return df_preparado
+
 def main():
     """Función principal de la aplicación"""
     
@@ -273,7 +297,7 @@ def main():
     
     # Cargar datos con autenticación integrada
     with st.spinner("🔄 Cargando datos de OneDrive..."):
-        df = load_spending_data()
+        df = load_data()
     
     if df is None:
         st.stop()  # La función load_spending_data ya maneja la UI de autenticación
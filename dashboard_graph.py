@@ -12,7 +12,10 @@ from datetime import datetime, timedelta
 import bcrypt
 import os
 from dotenv import load_dotenv
-from onedrive_graph import init_graph_connection, handle_oauth_callback
+from onedrive_graph import init_graph_connection, handle_oauth_callback, obtener_estadisticas_http, asegurar_token_vigente
+from registro_datos import obtener_registro, adquirir_de_sesion, invalidar_de_sesion
+from esquema_columnas import normalizar_columnas, ROLES_GASTOS
+from transformaciones import agregar_calendario, aplicar_esquema, parsear_montos, parsear_fechas, codigo_mes, etiqueta_mes, fecha_de_codigo, COLUMNAS_CALENDARIO
 
 # Cargar variables de entorno
 load_dotenv()
@@ -118,16 +121,13 @@ def transform_onedrive_data(df):
     
     # Procesar columna de monto
     if 'Monto' in transformed_df.columns:
-        # Limpiar el formato de moneda (remover ₡, comas, etc.)
-        transformed_df['Monto'] = transformed_df['Monto'].astype(str)
-        transformed_df['Monto'] = transformed_df['Monto'].str.replace('₡', '', regex=False)
-        transformed_df['Monto'] = transformed_df['Monto'].str.replace(',', '', regex=False)
-        transformed_df['Monto'] = pd.to_numeric(transformed_df['Monto'], errors='coerce')
+        # Limpiar el formato de moneda (₡, comas, paréntesis) en una sola pasada
+        transformed_df['Monto'], _ = parsear_montos(transformed_df['Monto'])
         transformed_df['Monto'] = transformed_df['Monto'].abs()  # Valores absolutos para gastos
     
     # Procesar columna de fecha
     if 'Fecha' in transformed_df.columns:
-        transformed_df['Fecha'] = pd.to_datetime(transformed_df['Fecha'], errors='coerce')
+        transformed_df['Fecha'] = parsear_fechas(transformed_df['Fecha'])
     
     # Limpiar valores nulos en categoría
     if 'Categoria' in transformed_df.columns:
@@ -138,52 +138,116 @@ def transform_onedrive_data(df):
         transformed_df = transformed_df.dropna(subset=['Monto', 'Fecha'])
         transformed_df = transformed_df[transformed_df['Monto'] > 0]
     
+    # El calendario se agrega una sola vez sobre el conjunto completo (preparar_transformados)
     return transformed_df
 
 def load_data():
-    """Cargar datos desde OneDrive usando Microsoft Graph API o archivo local como respaldo"""
+    """Cargar datos desde OneDrive usando Microsoft Graph API (None si no se pudo; el respaldo local se registra aparte)"""
+    
+    connector = init_graph_connection()
+    if not connector:
+        return None
+    
+    filename = os.getenv('ONEDRIVE_FILENAME', 'HomeSpend.xlsx')
+    
+    try:
+        # Usa el snapshot local si el archivo no cambió; si cambió, transforma
+        # bloque a bloque solo lo necesario
+        df_transformed = connector.get_excel_data_delta(
+            asegurar_token_vigente(connector),
+            filename,
+            transform=transform_onedrive_data
+        )
+        if df_transformed is None:
+            st.warning("⚠️ No se pudo cargar desde OneDrive, usando datos locales")
+            return None
+        
+        # Tipos y calendario del conjunto completo (una vez, después de concatenar bloques)
+        df_transformed = preparar_transformados(df_transformed)
+        if df_transformed is None:
+            return None
+        
+        # Mostrar estructura de datos para debug
+        with st.expander("🔍 Estructura de datos cargados"):
+            st.write("Columnas encontradas:", list(df_transformed.columns))
+            st.write("Primeras 3 filas:", df_transformed.head(3))
+        
+        st.success(f"✅ Datos transformados: {len(df_transformed)} filas válidas")
+        
+        return df_transformed
+    except Exception as e:
+        st.warning(f"⚠️ Error con OneDrive: {str(e)}, usando datos locales")
+        return None
+
+def load_local_data():
+    """Cargar datos desde archivo local o datos de ejemplo"""
     
-    # Verificar si hay autenticación de Microsoft Graph
-    if 'access_token' in st.session_state:
-        connector = init_graph_connection()
-        if connector:
-            filename = os.getenv('ONEDRIVE_FILENAME', 'HomeSpend.xlsx')
-            
-            try:
-                df_raw = connector.get_excel_data(st.session_state['access_token'], filename)
-                if df_raw is not None:
-                    st.success(f"✅ Datos cargados desde OneDrive: {len(df_raw)} filas")
-                    
-                    # Mostrar estructura de datos para debug
-                    with st.expander("🔍 Estructura de datos cargados"):
-                        st.write("Columnas encontradas:", list(df_raw.columns))
-                        st.write("Primeras 3 filas:", df_raw.head(3))
-                    
-                    # Transformar datos al formato esperado
-                    df_transformed = transform_onedrive_data(df_raw)
-                    st.success(f"✅ Datos transformados: {len(df_transformed)} filas válidas")
-                    
-                    return df_transformed
-                else:
-                    st.warning("⚠️ No se pudo cargar desde OneDrive, usando datos locales")
-            except Exception as e:
-                st.warning(f"⚠️ Error con OneDrive: {str(e)}, usando datos locales")
-    
-    # Cargar desde archivo local como respaldo
     excel_url = os.getenv('EXCEL_URL', 'datos_ejemplo.xlsx')
     
     try:
         # Intentar cargar archivo local
         if os.path.exists(excel_url):
-            df = pd.read_excel(excel_url)
+            df = preparar_datos(pd.read_excel(excel_url))
             st.info("📁 Datos cargados desde archivo local")
             return df
         else:
             st.error(f"❌ No se encontró el archivo: {excel_url}")
-            return create_sample_data()
+            return preparar_datos(create_sample_data())
     except Exception as e:
         st.error(f"❌ Error cargando datos: {str(e)}")
-        return create_sample_data()
+        return preparar_datos(create_sample_data())
+
+def preparar_transformados(df):
+    """Aplicar tipos y calendario a datos ya transformados por transform_onedrive_data (sin volver a normalizar ni parsear)"""
+    if df is None:
+        return None
+    if 'Fecha' not in df.columns or 'Monto' not in df.columns:
+        st.error("❌ No se encontraron las columnas de fecha y monto en los datos")
+        return None
+    
+    df = df.copy(deep=False)
+    if 'Categoria' not in df.columns:
+        df['Categoria'] = 'General'
+    if 'Descripcion' not in df.columns:
+        df['Descripcion'] = 'Gasto general'
+    
+    # Un snapshot o una fusión con filas de sincronizaciones anteriores puede traer un
+    # calendario parcial: se recalcula completo una sola vez
+    df = df.drop(columns=list(COLUMNAS_CALENDARIO), errors='ignore')
+    df = aplicar_esquema(df, 'Fecha', 'Monto')
+    return agregar_calendario(df, 'Fecha')
+
+def preparar_datos(df):
+    """Resolver columnas (una vez por encabezado) y convertir tipos una vez por versión de los datos"""
+    if df is None:
+        return None
+    
+    # Asignación de columnas cacheada por huella del encabezado
+    df, faltantes = normalizar_columnas(df, ROLES_GASTOS)
+    if 'Fecha' in faltantes:
+        st.error("❌ No se encontró una columna de fecha en los datos")
+        return None
+    if 'Monto' in faltantes:
+        st.error("❌ No se encontró una columna de monto en los datos")
+        return None
+    if 'Categoria' in faltantes:
+        # Si no hay categoría, crear una genérica
+        df['Categoria'] = 'General'
+    if 'Descripcion' in faltantes:
+        # Si no hay descripción, crear una genérica
+        df['Descripcion'] = 'Gasto general'
+    
+    # Convertir tipos de datos
+    try:
+        df['Fecha'] = parsear_fechas(df['Fecha'])
+        df['Monto'], _ = parsear_montos(df['Monto'])
+        # Eliminar filas con montos inválidos
+        df = df.dropna(subset=['Monto'])
+        df = aplicar_esquema(df, 'Fecha', 'Monto')
+        return agregar_calendario(df, 'Fecha')
+    except Exception as e:
+        st.error(f"❌ Error procesando datos: {str(e)}")
+        return None
 
 def create_sample_data():
     """Crear datos de ejemplo si no se puede cargar el archivo"""
@@ -250,12 +314,15 @@ def setup_onedrive_auth():
     if 'access_token' in st.session_state:
         st.success("✅ Conectado a OneDrive")
         if st.button("🔄 Renovar conexión"):
-            if 'refresh_token' in st.session_state:
-                new_token = connector.get_token_from_refresh(st.session_state['refresh_token'])
-                if new_token:
-                    st.session_state['access_token'] = new_token['access_token']
-                    st.success("✅ Token renovado")
-                    st.rerun()
+            connector.cuenta_id = st.session_state.get('cuenta_msal')
+            new_token = connector.obtener_token_vigente(forzar=True)
+            if new_token is None and 'refresh_token' in st.session_state:
+                result = connector.get_token_from_refresh(st.session_state['refresh_token'])
+                new_token = result['access_token'] if result else None
+            if new_token:
+                st.session_state['access_token'] = new_token
+                st.success("✅ Token renovado")
+                st.rerun()
         return
     
     # Mostrar botón de autenticación
@@ -277,7 +344,7 @@ def display_metrics(df):
     
     with col1:
         total_gastos = df['Monto'].sum()
-        unique_days = len(df.groupby('Fecha'))
+        unique_days = df['Dia'].nunique()
         avg_daily = total_gastos / unique_days if unique_days > 0 else 0
         st.metric(
             label="💰 Total Gastado", 
@@ -286,7 +353,7 @@ def display_metrics(df):
         )
     
     with col2:
-        gastos_mes = df[df['Fecha'].dt.month == datetime.now().month]['Monto'].sum()
+        gastos_mes = df.loc[df['Mes'] == codigo_mes(datetime.now()), 'Monto'].sum()
         st.metric(
             label="📅 Este Mes", 
             value=f"${gastos_mes:,.2f}",
@@ -294,7 +361,7 @@ def display_metrics(df):
         )
     
     with col3:
-        categoria_gastos = df.groupby('Categoria')['Monto'].sum()
+        categoria_gastos = df.groupby('Categoria', observed=True)['Monto'].sum()
         if not categoria_gastos.empty:
             categoria_top = categoria_gastos.idxmax()
             monto_top = categoria_gastos.max()
@@ -328,7 +395,7 @@ def create_charts(df):
     
     # Gráfico de gastos por categoría
     st.markdown("### 📊 Gastos por Categoría")
-    gastos_categoria = df.groupby('Categoria')['Monto'].sum().reset_index()
+    gastos_categoria = df.groupby('Categoria', observed=True)['Monto'].sum().reset_index()
     
     if not gastos_categoria.empty:
         fig_pie = px.pie(
@@ -345,7 +412,8 @@ def create_charts(df):
     
     # Gráfico de tendencia temporal
     st.markdown("### 📈 Tendencia de Gastos")
-    gastos_diarios = df.groupby('Fecha')['Monto'].sum().reset_index()
+    gastos_diarios = df.groupby('Dia')['Monto'].sum().reset_index()
+    gastos_diarios['Fecha'] = fecha_de_codigo(gastos_diarios['Dia'])
     
     if not gastos_diarios.empty:
         fig_line = px.line(
@@ -365,8 +433,8 @@ def create_charts(df):
     
     with col1:
         st.markdown("### 📊 Gastos Mensuales")
-        df['Mes'] = df['Fecha'].dt.strftime('%Y-%m')
         gastos_mensuales = df.groupby('Mes')['Monto'].sum().reset_index()
+        gastos_mensuales['Mes'] = etiqueta_mes(gastos_mensuales['Mes'])
         
         if not gastos_mensuales.empty:
             fig_bar = px.bar(
@@ -404,6 +472,17 @@ def main():
     # Título principal
     st.markdown('<h1 class="main-header">🏠 Dashboard de Gastos del Hogar</h1>', unsafe_allow_html=True)
     
+    # Los datos de OneDrive se registran por cuenta (home_account_id incluye el tenant) y los
+    # locales de respaldo por separado, así un respaldo nunca queda publicado como OneDrive.
+    # Sin cuenta identificada los datos de OneDrive quedan solo en la sesión
+    fuente_local = f"local:{os.getenv('EXCEL_URL', 'datos_ejemplo.xlsx')}"
+    fuente_onedrive = None
+    cuenta = None
+    if 'access_token' in st.session_state:
+        cuenta = st.session_state.get('cuenta_msal')
+        fuente_onedrive = f"onedrive:{cuenta or 'sesion'}:{os.getenv('ONEDRIVE_FILENAME', 'HomeSpend.xlsx')}"
+    fuente_datos = fuente_onedrive or fuente_local
+    
     # Sidebar para configuración
     with st.sidebar:
         st.markdown("### ⚙️ Configuración")
@@ -417,69 +496,37 @@ def main():
         st.markdown("### ℹ️ Información")
         st.info(f"📅 Última actualización: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
         
+        with st.expander("🌐 Conexiones a OneDrive"):
+            estadisticas = obtener_estadisticas_http()
+            st.write(f"Solicitudes: {estadisticas['solicitudes']} (reintentos: {estadisticas['reintentos']})")
+            st.write(f"Conexiones nuevas: {estadisticas['conexiones_nuevas']} · reutilizadas: {estadisticas['conexiones_reutilizadas']}")
+            st.write(f"Tiempo total en red: {estadisticas['tiempo_total_s']:.2f} s")
+            datos = obtener_registro().estadisticas()
+            st.write(f"Datos compartidos: {datos['versiones']} versión(es), {datos['sesiones']} sesión(es), {datos['memoria_mb']:.1f} MB")
+        
         if st.button("🔄 Recargar Datos"):
-            if 'df' in st.session_state:
-                del st.session_state['df']
+            obtener_registro().invalidar(fuente_datos)
+            invalidar_de_sesion(fuente_datos)
             st.rerun()
     
-    # Cargar datos
-    if 'df' not in st.session_state:
-        with st.spinner("📊 Cargando datos..."):
-            st.session_state['df'] = load_data()
-    
-    df = st.session_state['df']
+    # Cargar datos (compartidos por todas las sesiones; la sesión solo guarda sus filtros)
+    with st.spinner("📊 Cargando datos..."):
+        df = None
+        if fuente_onedrive and cuenta:
+            df = obtener_registro().adquirir(fuente_onedrive, load_data)
+        elif fuente_onedrive:
+            df = adquirir_de_sesion(fuente_onedrive, load_data)
+        if df is None:
+            df = obtener_registro().adquirir(fuente_local, load_local_data)
     
     if df is None or df.empty:
         st.error("❌ No se pudieron cargar los datos")
         st.info("💡 Verifica que el archivo Excel exista y tenga datos válidos")
         return
     
-    # Procesar datos
-    # Verificar y ajustar nombres de columnas
-    if 'Fecha' not in df.columns:
-        # Buscar columnas que puedan ser fechas
-        date_columns = [col for col in df.columns if any(word in col.lower() for word in ['fecha', 'date', 'time', 'día', 'dia'])]
-        if date_columns:
-            df = df.rename(columns={date_columns[0]: 'Fecha'})
-        else:
-            st.error("❌ No se encontró una columna de fecha en los datos")
-            return
-    
-    if 'Monto' not in df.columns:
-        # Buscar columnas que puedan ser montos
-        amount_columns = [col for col in df.columns if any(word in col.lower() for word in ['monto', 'amount', 'precio', 'cost', 'gasto', 'valor'])]
-        if amount_columns:
-            df = df.rename(columns={amount_columns[0]: 'Monto'})
-        else:
-            st.error("❌ No se encontró una columna de monto en los datos")
-            return
-    
-    if 'Categoria' not in df.columns:
-        # Buscar columnas que puedan ser categorías
-        category_columns = [col for col in df.columns if any(word in col.lower() for word in ['categoria', 'category', 'tipo', 'type', 'class'])]
-        if category_columns:
-            df = df.rename(columns={category_columns[0]: 'Categoria'})
-        else:
-            # Si no hay categoría, crear una genérica
-            df['Categoria'] = 'General'
-    
-    if 'Descripcion' not in df.columns:
-        # Buscar columnas que puedan ser descripciones
-        desc_columns = [col for col in df.columns if any(word in col.lower() for word in ['descripcion', 'description', 'detalle', 'detail', 'concepto'])]
-        if desc_columns:
-            df = df.rename(columns={desc_columns[0]: 'Descripcion'})
-        else:
-            # Si no hay descripción, crear una genérica
-            df['Descripcion'] = 'Gasto general'
-    
-    # Convertir tipos de datos
-    try:
-        df['Fecha'] = pd.to_datetime(df['Fecha'])
-        df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce')
-        # Eliminar filas con montos inválidos
-        df = df.dropna(subset=['Monto'])
-    except Exception as e:
-        st.error(f"❌ Error procesando datos: {str(e)}")
+    # Las columnas y los tipos ya se resolvieron al cargar esta versión de los datos
+    if 'Fecha' not in df.columns or 'Monto' not in df.columns:
+        st.error("❌ Los datos no tienen columnas de fecha y monto")
         return
     
     # Mostrar métricas
@@ -493,6 +540,7 @@ def main():
     # Tabla de datos recientes
     st.markdown("### 📋 Gastos Recientes")
     datos_recientes = df.sort_values('Fecha', ascending=False).head(20)
+    datos_recientes = datos_recientes.drop(columns=list(COLUMNAS_CALENDARIO), errors='ignore')
     st.dataframe(datos_recientes, use_container_width=True)
     
     # Footer
@@ -10,7 +10,12 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
-from onedrive_graph import load_spending_data
+from onedrive_graph import load_spending_data, init_graph_connection, asegurar_token_vigente
+from registro_datos import obtener_registro, adquirir_de_sesion, invalidar_de_sesion
+from almacen_sqlite import almacen_habilitado, obtener_almacen, contar_filas
+from transformaciones import (asignar_responsables, obtener_responsable_por_defecto, agregar_calendario,
+                              aplicar_esquema, completar_vacios, parsear_montos, parsear_fechas,
+                              codigo_mes, etiqueta_semana, etiqueta_mes, fecha_de_codigo)
 
 # Configuración de la página
 st.set_page_config(
@@ -41,6 +46,20 @@ else:
     AZURE_TENANT_ID = os.getenv('AZURE_TENANT_ID')
     ONEDRIVE_FILENAME = os.getenv('ONEDRIVE_FILENAME')
 
+# Datos de una sesión sin cuenta de MSAL identificada (no se comparten entre sesiones)
+FUENTE_SESION = f"onedrive:sesion:{ONEDRIVE_FILENAME or 'HomeSpend.xlsx'}"
+
+
+def fuente_datos():
+    """
+    Fuente de los datos en el registro compartido y en el almacén SQLite
+
+    Es el archivo de OneDrive de la cuenta de MSAL de la sesión (home_account_id incluye el
+    tenant), así cada cuenta ve solo sus datos; None si la sesión no tiene cuenta identificada.
+    """
+    cuenta = st.session_state.get('cuenta_msal')
+    return f"onedrive:{cuenta}:{ONEDRIVE_FILENAME or 'HomeSpend.xlsx'}" if cuenta else None
+
 # CSS personalizado
 st.markdown("""
 <style>
@@ -131,7 +150,7 @@ def main():
     
     return False
 
-def transform_onedrive_data(df):
+def transform_onedrive_data(df, incluir_gastos_fijos=True):
     """Transformar datos de OneDrive a formato esperado del dashboard"""
     if df is None or df.empty:
         return df
@@ -156,58 +175,39 @@ def transform_onedrive_data(df):
     
     # Procesar columna de monto
     if 'Monto' in transformed_df.columns:
-        # Limpiar el formato de moneda (remover ₡, comas, etc.)
-        transformed_df['Monto'] = transformed_df['Monto'].astype(str)
-        transformed_df['Monto'] = transformed_df['Monto'].str.replace('₡', '', regex=False)
-        transformed_df['Monto'] = transformed_df['Monto'].str.replace(',', '', regex=False)
-        transformed_df['Monto'] = pd.to_numeric(transformed_df['Monto'], errors='coerce')
+        # Limpiar el formato de moneda (₡, comas, paréntesis) en una sola pasada
+        transformed_df['Monto'], _ = parsear_montos(transformed_df['Monto'])
         transformed_df['Monto'] = transformed_df['Monto'].abs()  # Valores absolutos para gastos
     
     # Procesar columna de fecha
     if 'Fecha' in transformed_df.columns:
-        transformed_df['Fecha'] = pd.to_datetime(transformed_df['Fecha'], errors='coerce')
+        transformed_df['Fecha'] = parsear_fechas(transformed_df['Fecha'])
     
     # Limpiar valores nulos en categoría
     if 'Categoria' in transformed_df.columns:
         transformed_df['Categoria'] = transformed_df['Categoria'].fillna('Otros')
     
-    # Asignar responsables basado en números de tarjeta
+    # Asignar responsables basado en la terminación de la tarjeta (configurable)
     if 'Card' in transformed_df.columns:
-        def asignar_responsable(row):
-            card = str(row.get('Card', ''))
-            
-            # Si ya tiene responsable asignado, mantenerlo
-            responsable_actual = row.get('Responsable', '')
-            if pd.notna(responsable_actual) and responsable_actual.strip():
-                return responsable_actual
-            
-            # Asignar basado en terminación de tarjeta
-            if card.endswith('9366'):
-                return 'FIORELLA INFANTE AMORE'
-            elif card.endswith('2081') or card.endswith('4136'):
-                return 'LUIS ESTEBAN OVIEDO MATAMOROS'
-            else:
-                return 'ALVARO FERNANDO OVIEDO MATAMOROS'
-        
-        # Aplicar la función de asignación de responsables
-        transformed_df['Responsable'] = transformed_df.apply(asignar_responsable, axis=1)
+        transformed_df['Responsable'] = asignar_responsables(transformed_df)
     elif 'Responsable' in transformed_df.columns:
-        # Si no hay columna Card pero sí Responsable, completar vacíos con Alvaro
-        transformed_df['Responsable'] = transformed_df['Responsable'].fillna('ALVARO FERNANDO OVIEDO MATAMOROS')
+        # Si no hay columna Card pero sí Responsable, completar vacíos con el responsable por defecto
+        transformed_df['Responsable'] = transformed_df['Responsable'].fillna(obtener_responsable_por_defecto())
     else:
-        # Si no hay columna Responsable, crearla con Alvaro por defecto
-        transformed_df['Responsable'] = 'ALVARO FERNANDO OVIEDO MATAMOROS'
+        # Si no hay columna Responsable, crearla con el responsable por defecto
+        transformed_df['Responsable'] = obtener_responsable_por_defecto()
     
     # Filtrar filas con datos válidos
     if 'Monto' in transformed_df.columns and 'Fecha' in transformed_df.columns:
         transformed_df = transformed_df.dropna(subset=['Monto', 'Fecha'])
         transformed_df = transformed_df[transformed_df['Monto'] > 0]
     
-    # Agregar gastos fijos mensuales
-    transformed_df = add_monthly_fixed_expenses(transformed_df)
+    # Agregar gastos fijos mensuales (en sincronización incremental se agregan al final)
+    if incluir_gastos_fijos:
+        transformed_df = add_monthly_fixed_expenses(transformed_df)
     
-    # Completar valores vacíos con "Desconocido"
-    transformed_df = transformed_df.fillna('Desconocido')
+    # Completar con "Desconocido" solo los textos vacíos (números y fechas mantienen su tipo)
+    transformed_df = completar_vacios(transformed_df)
     
     return transformed_df
 
@@ -229,7 +229,7 @@ def add_monthly_fixed_expenses(df):
     ]
     
     # Configuración común para todos los gastos fijos
-    RESPONSABLE_FIJO = 'ALVARO FERNANDO OVIEDO MATAMOROS'
+    RESPONSABLE_FIJO = obtener_responsable_por_defecto()
     CARD_FIJA = '4128'
     LOCATION_FIJO = 'SAN JOSÉ'
     
@@ -307,8 +307,13 @@ def add_monthly_fixed_expenses(df):
     
     return df
 
-def load_data():
-    """Cargar datos desde OneDrive usando Microsoft Graph API"""
+def load_data(fuente=None):
+    """Cargar datos desde OneDrive usando Microsoft Graph API
+    
+    Args:
+        fuente: Fuente de los datos en el registro; con el almacén SQLite se cargan en su
+            tabla (sin fuente compartida no se usa el almacén)
+    """
     
     connector = init_graph_connection()
     if not connector:
@@ -319,14 +324,34 @@ def load_data():
     filename = ONEDRIVE_FILENAME or 'HomeSpend.xlsx'
     
     try:
-        df_raw = connector.get_excel_data(st.session_state['access_token'], filename)
-        if df_raw is not None:
-            st.success(f"✅ Datos cargados desde OneDrive: {len(df_raw)} filas")
+        # Sincronización incremental: solo se transforman las filas nuevas
+        df_transformed = connector.get_excel_data_delta(
+            asegurar_token_vigente(connector),
+            filename,
+            transform=lambda df_nuevas: transform_onedrive_data(df_nuevas, incluir_gastos_fijos=False),
+            usar_workbook_api=True
+        )
+        if df_transformed is not None:
+            # Versión de los datos: cTag del libro y mes actual (los gastos fijos llegan hasta hoy)
+            version_fuente = df_transformed.attrs.get('version_fuente')
+            if version_fuente:
+                version_fuente = f"{version_fuente}:{datetime.now():%Y-%m}"
             
-            # Transformar datos al formato esperado
-            df_transformed = transform_onedrive_data(df_raw)
+            # Los gastos fijos dependen del rango completo de fechas
+            df_transformed = add_monthly_fixed_expenses(df_transformed)
+            # Tipos del conjunto completo: dimensiones categóricas, Monto float64, Fecha datetime64
+            df_transformed = aplicar_esquema(df_transformed, 'Fecha', 'Monto')
+            # Dimensión de calendario calculada una vez por versión de los datos
+            df_transformed = agregar_calendario(df_transformed, 'Fecha')
+            df_transformed.attrs['version_fuente'] = version_fuente
             st.success(f"✅ Datos procesados: {len(df_transformed)} filas válidas")
             
+            # Con el almacén SQLite, cada versión publicada en el registro se ingiere una sola vez
+            # y el registro guarda solo su vista sin filas (las consultas van al almacén)
+            if fuente and almacen_habilitado():
+                obtener_almacen().ingerir(fuente, df_transformed, version=version_fuente, columna_fecha='Fecha')
+                return obtener_almacen().vista(fuente)
+            
             return df_transformed
         else:
             st.error("❌ No se pudo cargar el archivo desde OneDrive")
@@ -339,27 +364,39 @@ def load_data():
 def apply_filters(df):
     """Aplicar filtros globales a los datos desde el sidebar"""
     
-    if df.empty:
+    if contar_filas(df) == 0:
         return df
     
+    tabla = df.attrs.get('tabla_almacen')
+    almacen = obtener_almacen() if tabla else None
+    
     # Filtros en sidebar
     with st.sidebar:
         st.markdown("### 🔍 Filtros Globales")
         
         # Filtro por fechas
-        fecha_min = df['Fecha'].min().date()
-        fecha_max = df['Fecha'].max().date()
+        rango = almacen.rango_fechas(tabla) if almacen else None
+        if rango:
+            fecha_min, fecha_max = rango
+        else:
+            fecha_min = df['Fecha'].min().date()
+            fecha_max = df['Fecha'].max().date()
         
         fecha_inicio = st.date_input("📅 Fecha Inicio", fecha_min, key="fecha_inicio")
         fecha_fin = st.date_input("📅 Fecha Fin", fecha_max, key="fecha_fin")
         
         # Filtro por categoría
-        categorias = ['Todas'] + sorted(df['Categoria'].unique().tolist())
+        categorias = ['Todas'] + (
+            almacen.valores_distintos(tabla, 'Categoria') if almacen else sorted(df['Categoria'].unique().tolist())
+        )
         categoria_seleccionada = st.selectbox("🏷️ Categoría", categorias, key="categoria")
         
         # Filtro por responsable (si existe la columna)
         if 'Responsable' in df.columns:
-            responsables_unicos = df['Responsable'].dropna().unique()
+            responsables_unicos = (
+                pd.Series(almacen.valores_distintos(tabla, 'Responsable')) if almacen
+                else df['Responsable'].dropna().unique()
+            )
             if len(responsables_unicos) > 1:
                 responsables = ['Todos'] + sorted(responsables_unicos.tolist())
                 responsable_seleccionado = st.selectbox("👤 Responsable", responsables, key="responsable")
@@ -369,21 +406,34 @@ def apply_filters(df):
             responsable_seleccionado = 'Todos'
         
         # Aplicar filtros
-        df_filtrado = df.copy()
-        
-        # Filtro por fechas
-        df_filtrado = df_filtrado[
-            (df_filtrado['Fecha'].dt.date >= fecha_inicio) & 
-            (df_filtrado['Fecha'].dt.date <= fecha_fin)
-        ]
-        
-        # Filtro por categoría
-        if categoria_seleccionada != 'Todas':
-            df_filtrado = df_filtrado[df_filtrado['Categoria'] == categoria_seleccionada]
-        
-        # Filtro por responsable
-        if responsable_seleccionado != 'Todos':
-            df_filtrado = df_filtrado[df_filtrado['Responsable'] == responsable_seleccionado]
+        if almacen:
+            # Consulta indexada; los gráficos reutilizan los mismos filtros
+            filtros = {'desde': fecha_inicio, 'hasta': fecha_fin, 'iguales': {}}
+            if categoria_seleccionada != 'Todas':
+                filtros['iguales']['Categoria'] = categoria_seleccionada
+            if responsable_seleccionado != 'Todos':
+                filtros['iguales']['Responsable'] = responsable_seleccionado
+            # Solo se consultan los totales; métricas, gráficos y tablas consultan el almacén
+            # con los mismos filtros
+            df_filtrado = df.iloc[0:0].copy()
+            df_filtrado.attrs.update(almacen.totales(tabla, 'Monto', filtros, distintos='Dia'))
+            df_filtrado.attrs['filtros_sql'] = filtros
+        else:
+            df_filtrado = df.copy()
+            
+            # Filtro por fechas
+            df_filtrado = df_filtrado[
+                (df_filtrado['Fecha'].dt.date >= fecha_inicio) & 
+                (df_filtrado['Fecha'].dt.date <= fecha_fin)
+            ]
+            
+            # Filtro por categoría
+            if categoria_seleccionada != 'Todas':
+                df_filtrado = df_filtrado[df_filtrado['Categoria'] == categoria_seleccionada]
+            
+            # Filtro por responsable
+            if responsable_seleccionado != 'Todos':
+                df_filtrado = df_filtrado[df_filtrado['Responsable'] == responsable_seleccionado]
         
         # Mostrar información de filtros aplicados
         st.markdown("---")
@@ -392,20 +442,31 @@ def apply_filters(df):
         st.info(f"🏷️ Categoría: {categoria_seleccionada}")
         if responsable_seleccionado != 'Todos':
             st.info(f"👤 Responsable: {responsable_seleccionado}")
-        st.info(f"📈 Registros: {len(df_filtrado):,} de {len(df):,}")
+        st.info(f"📈 Registros: {contar_filas(df_filtrado):,} de {contar_filas(df):,}")
     
     return df_filtrado
 def display_metrics(df):
     """Mostrar métricas principales"""
     
-    if df.empty:
+    if contar_filas(df) == 0:
         st.warning("⚠️ No hay datos para mostrar métricas")
         return
     
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        # Totales calculados en el almacén SQLite
+        filtros_mes = {**filtros, 'iguales': {**filtros['iguales'], 'Mes': codigo_mes(datetime.now())}}
+        total_gastos = df.attrs['suma']
+        gastos_mes_actual = obtener_almacen().totales(df.attrs['tabla_almacen'], 'Monto', filtros_mes)['suma']
+        dias_con_gastos = df.attrs['distintos']
+    else:
+        total_gastos = df['Monto'].sum()
+        gastos_mes_actual = df.loc[df['Mes'] == codigo_mes(datetime.now()), 'Monto'].sum()
+        dias_con_gastos = df['Dia'].nunique()
+    
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_gastos = df['Monto'].sum()
         st.metric(
             label="💰 Total Gastado", 
             value=f"₡{total_gastos:,.2f}"
@@ -413,16 +474,13 @@ def display_metrics(df):
     
     with col2:
         # Gastos del período filtrado vs mes actual
-        fecha_actual = datetime.now()
-        gastos_mes_actual = df[df['Fecha'].dt.month == fecha_actual.month]['Monto'].sum()
         st.metric(
             label="📅 Mes Actual", 
             value=f"₡{gastos_mes_actual:,.2f}"
         )
     
     with col3:
-        # Promedio diario del período filtrado
-        dias_con_gastos = df['Fecha'].nunique()
+        # Promedio diario del período filtrado (días con gastos)
         promedio_diario = total_gastos / dias_con_gastos if dias_con_gastos > 0 else 0
         st.metric(
             label="📊 Promedio Diario", 
@@ -431,7 +489,7 @@ def display_metrics(df):
     
     with col4:
         # Total de transacciones filtradas
-        total_transacciones = len(df)
+        total_transacciones = contar_filas(df)
         st.metric(
             label="🧾 Transacciones", 
             value=f"{total_transacciones:,}"
@@ -440,13 +498,13 @@ def display_metrics(df):
 def display_charts(df):
     """Mostrar gráficos con datos ya filtrados"""
     
-    if df.empty:
+    if contar_filas(df) == 0:
         st.warning("⚠️ No hay datos para mostrar gráficos en el período seleccionado")
         return
     # Gráfico de línea - Tendencia de gastos con agrupación dinámica
     st.markdown("### 📈 Tendencia de Gastos")
     
-    if not df.empty:
+    if contar_filas(df) > 0:
         # Selector de agrupación temporal
         col_selector, col_empty = st.columns([1, 3])
         with col_selector:
@@ -456,52 +514,33 @@ def display_charts(df):
                 key="agrupacion_tendencia"
             )
         
-        # Preparar datos según la agrupación seleccionada
-        df_trend = df.copy()
-        
+        # Agrupar por el código de calendario precalculado al cargar los datos
         if agrupacion == "Día":
-            df_trend['Periodo'] = df_trend['Fecha'].dt.date
+            columna_periodo = 'Dia'
             titulo = "Gastos Diarios en Período Seleccionado"
-            formato_fecha = "%Y-%m-%d"
         elif agrupacion == "Semana ISO":
             # Semana personalizada: S1 empieza el 1 de enero, luego lunes a domingo
-            def calcular_semana_personalizada(fecha):
-                # Obtener el año
-                año = fecha.year
-                
-                # Fecha del 1 de enero del año
-                primer_enero = pd.Timestamp(f'{año}-01-01')
-                
-                # Calcular días desde el 1 de enero
-                dias_desde_enero = (fecha - primer_enero).days
-                
-                # La semana 1 incluye el 1 de enero hasta el primer domingo
-                # Encontrar el primer domingo del año
-                dias_hasta_primer_domingo = (6 - primer_enero.weekday()) % 7
-                if primer_enero.weekday() == 6:  # Si el 1 de enero es domingo
-                    dias_hasta_primer_domingo = 0
-                
-                # Calcular número de semana
-                if dias_desde_enero <= dias_hasta_primer_domingo:
-                    semana = 1
-                else:
-                    # Días después del primer domingo
-                    dias_despues_primer_domingo = dias_desde_enero - dias_hasta_primer_domingo - 1
-                    semana = 2 + (dias_despues_primer_domingo // 7)
-                
-                return f"{año}-S{semana:02d}"
-            
-            df_trend['Periodo'] = df_trend['Fecha'].apply(calcular_semana_personalizada)
+            columna_periodo = 'Semana'
             titulo = "Gastos por Semana (S1 desde 1 Ene, Lun-Dom) en Período Seleccionado"
-            formato_fecha = "%Y-S%W"
         else:  # Mes
-            df_trend['Periodo'] = df_trend['Fecha'].dt.to_period('M').astype(str)
+            columna_periodo = 'Mes'
             titulo = "Gastos Mensuales en Período Seleccionado"
-            formato_fecha = "%Y-%m"
         
-        # Agrupar por período
-        gastos_agrupados = df_trend.groupby('Periodo')['Monto'].sum().reset_index()
-        gastos_agrupados = gastos_agrupados.sort_values('Periodo')
+        # Consulta indexada si hay almacén SQLite
+        filtros = df.attrs.get('filtros_sql')
+        if filtros is not None:
+            gastos_agrupados = obtener_almacen().agrupar(df.attrs['tabla_almacen'], columna_periodo, 'Monto', filtros)
+        else:
+            gastos_agrupados = df.groupby(columna_periodo)['Monto'].sum().reset_index()
+        gastos_agrupados = gastos_agrupados.rename(columns={columna_periodo: 'Periodo'}).sort_values('Periodo')
+        
+        # Etiquetas solo para los grupos, no para cada fila
+        if agrupacion == "Día":
+            gastos_agrupados['Periodo'] = fecha_de_codigo(gastos_agrupados['Periodo']).dt.date
+        elif agrupacion == "Semana ISO":
+            gastos_agrupados['Periodo'] = etiqueta_semana(gastos_agrupados['Periodo'])
+        else:
+            gastos_agrupados['Periodo'] = etiqueta_mes(gastos_agrupados['Periodo'])
         
         # Crear gráfico
         fig_line = px.line(
@@ -556,9 +595,15 @@ def display_charts(df):
     
     with col1:
         st.markdown("### 🏷️ Gastos por Categoría")
-        if not df.empty:
-            gastos_categoria = df.groupby('Categoria')['Monto'].sum().reset_index()
-            gastos_categoria = gastos_categoria.sort_values('Monto', ascending=False)
+        if contar_filas(df) > 0:
+            filtros = df.attrs.get('filtros_sql')
+            if filtros is not None:
+                gastos_categoria = obtener_almacen().agrupar(
+                    df.attrs['tabla_almacen'], 'Categoria', 'Monto', filtros, descendente=True
+                )
+            else:
+                gastos_categoria = df.groupby('Categoria', observed=True)['Monto'].sum().reset_index()
+                gastos_categoria = gastos_categoria.sort_values('Monto', ascending=False)
             
             fig_bar = px.bar(
                 gastos_categoria, 
@@ -577,8 +622,14 @@ def display_charts(df):
     
     with col2:
         st.markdown("### 💰 Top 10 Gastos")
-        if not df.empty:
-            top_gastos = df.nlargest(10, 'Monto')[['Fecha', 'Categoria', 'Monto', 'Descripcion']]
+        if contar_filas(df) > 0:
+            filtros = df.attrs.get('filtros_sql')
+            if filtros is not None:
+                top_gastos = obtener_almacen().consultar(
+                    df.attrs['tabla_almacen'], filtros, orden='Monto', descendente=True, limite=10
+                )[['Fecha', 'Categoria', 'Monto', 'Descripcion']]
+            else:
+                top_gastos = df.nlargest(10, 'Monto')[['Fecha', 'Categoria', 'Monto', 'Descripcion']]
             top_gastos['Fecha'] = top_gastos['Fecha'].dt.strftime('%Y-%m-%d')
             top_gastos['Monto'] = top_gastos['Monto'].apply(lambda x: f"₡{x:,.2f}")
             st.dataframe(top_gastos, use_container_width=True, height=400)
@@ -589,12 +640,18 @@ def show_recent_transactions(df):
     """Mostrar transacciones del período filtrado"""
     st.markdown("### 📋 Transacciones en Período Filtrado")
     
-    if df.empty:
+    if contar_filas(df) == 0:
         st.info("📋 No hay transacciones para el período seleccionado")
         return
     
     # Mostrar transacciones ordenadas por fecha (más recientes primero)
-    recent_df = df.sort_values('Fecha', ascending=False).head(20).copy()
+    filtros = df.attrs.get('filtros_sql')
+    if filtros is not None:
+        recent_df = obtener_almacen().consultar(
+            df.attrs['tabla_almacen'], filtros, orden='Fecha', descendente=True, limite=20
+        )
+    else:
+        recent_df = df.sort_values('Fecha', ascending=False).head(20).copy()
     recent_df['Fecha'] = recent_df['Fecha'].dt.strftime('%Y-%m-%d %H:%M')
     recent_df['Monto'] = recent_df['Monto'].apply(lambda x: f"₡{x:,.2f}")
     
@@ -623,26 +680,30 @@ def main():
     # Título principal (solo se muestra después de autenticarse)
     st.markdown('<h1 class="main-header">🏠 Dashboard de Gastos del Hogar</h1>', unsafe_allow_html=True)
     
+    fuente = fuente_datos()
+    
     # Sidebar para recarga de datos
     with st.sidebar:
         st.markdown("### 🔄 Acciones")
         if st.button("🔄 Recargar Datos", use_container_width=True):
-            if 'df' in st.session_state:
-                del st.session_state['df']
+            if fuente:
+                obtener_registro().invalidar(fuente)
+            invalidar_de_sesion(FUENTE_SESION)
             st.rerun()
         
         st.markdown("---")
         st.markdown("### ℹ️ Información")
         st.info(f"📅 Última actualización: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
     
-    # Cargar datos
-    if 'df' not in st.session_state:
-        with st.spinner("📊 Cargando datos desde OneDrive..."):
-            st.session_state['df'] = load_data()
-    
-    df = st.session_state['df']
+    # Cargar datos (compartidos por las sesiones de la misma cuenta; la sesión solo guarda sus
+    # filtros). Sin cuenta identificada los datos quedan solo en esta sesión
+    with st.spinner("📊 Cargando datos desde OneDrive..."):
+        if fuente:
+            df = obtener_registro().adquirir(fuente, lambda: load_data(fuente))
+        else:
+            df = adquirir_de_sesion(FUENTE_SESION, load_data)
     
-    if df is None or df.empty:
+    if df is None or contar_filas(df) == 0:
         st.error("❌ No se pudieron cargar los datos")
         st.info("💡 Verifica que el archivo HomeSpend.xlsx existe en tu OneDrive")
         return
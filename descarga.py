@@ -0,0 +1,130 @@
+"""
+Descarga de archivos grandes a disco
+El contenido se escribe por bloques en un archivo parcial y, si la conexión se corta, la
+descarga continúa desde el último byte recibido con solicitudes HTTP Range
+"""
+
+import hashlib
+import os
+import time
+from typing import Optional, Dict, Any, Tuple
+
+import requests
+
+from cache_local import leer_json, guardar_json, nombre_seguro
+
+# Tamaño de cada bloque escrito a disco
+TAMANO_BLOQUE = 1024 * 1024
+
+# Intentos (incluida la primera solicitud) antes de abandonar la descarga
+MAX_INTENTOS = 4
+
+# Timeout (conexión, lectura entre bloques) en segundos
+TIMEOUT_DESCARGA: Tuple[float, float] = (10, 60)
+
+
+def descargar_a_archivo(url: str, ruta_destino: str, headers: Optional[Dict[str, str]] = None,
+                        intentos: int = MAX_INTENTOS,
+                        timeout: Tuple[float, float] = TIMEOUT_DESCARGA) -> Dict[str, Any]:
+    """
+    Descarga una URL a un archivo, reanudando con Range si la conexión se interrumpe
+
+    Los bytes se acumulan en `ruta_destino + '.parcial'` y solo al completarse se mueve el
+    archivo a su destino. Un archivo parcial de una ejecución anterior se reanuda si el
+    servidor confirma (If-Range) que la versión no cambió; si cambió, se descarga completo.
+
+    Args:
+        url: URL del archivo
+        ruta_destino: Ruta final del archivo descargado
+        headers: Encabezados adicionales de la solicitud
+        intentos: Cantidad máxima de solicitudes
+        timeout: Timeout (conexión, lectura) por solicitud
+
+    Returns:
+        Diccionario con 'ruta', 'bytes' y 'content_type' de la descarga
+
+    Raises:
+        requests.exceptions.RequestException: Si la descarga no se completa tras los intentos
+    """
+    ruta_parcial = f"{ruta_destino}.parcial"
+    clave_estado = f"descarga_parcial_{nombre_seguro(os.path.basename(ruta_destino))}"
+
+    # Validador (ETag/Last-Modified) de la versión a la que pertenecen los bytes parciales
+    validador = leer_json(clave_estado).get('validador') if os.path.exists(ruta_parcial) else None
+    descargado = os.path.getsize(ruta_parcial) if validador else 0
+
+    content_type = ''
+    ultimo_error: Optional[Exception] = None
+    for intento in range(intentos):
+        encabezados = dict(headers or {})
+        if descargado:
+            encabezados['Range'] = f"bytes={descargado}-"
+            encabezados['If-Range'] = validador
+
+        try:
+            with requests.get(url, headers=encabezados, stream=True, timeout=timeout) as response:
+                if descargado and response.status_code == 416:
+                    # El archivo parcial ya estaba completo
+                    break
+                response.raise_for_status()
+
+                if response.status_code != 206:
+                    # Primera solicitud, o el servidor ignoró el Range: empezar de cero
+                    descargado = 0
+                    validador = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    if validador:
+                        guardar_json(clave_estado, {'validador': validador, 'url': url})
+
+                content_type = response.headers.get('content-type', '')
+                restante = response.headers.get('content-length')
+                total = descargado + int(restante) if restante and restante.isdigit() else None
+
+                with open(ruta_parcial, 'ab' if descargado else 'wb') as f:
+                    for bloque in response.iter_content(TAMANO_BLOQUE):
+                        f.write(bloque)
+                        descargado += len(bloque)
+
+            if total is None or descargado >= total:
+                break
+            ultimo_error = requests.exceptions.ChunkedEncodingError("Descarga incompleta")
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            ultimo_error = e
+
+        # Sin validador no se puede reanudar con seguridad
+        if not validador:
+            descargado = 0
+        if intento < intentos - 1:
+            time.sleep(min(2 ** intento, 10))
+    else:
+        raise ultimo_error or requests.exceptions.RequestException("No se pudo completar la descarga")
+
+    os.replace(ruta_parcial, ruta_destino)
+    guardar_json(clave_estado, {})
+
+    return {
+        'ruta': ruta_destino,
+        'bytes': os.path.getsize(ruta_destino),
+        'content_type': content_type
+    }
+
+
+def huella_archivo(ruta: str) -> str:
+    """
+    Versión de un archivo según su contenido (tamaño y hash de los bytes)
+
+    Sirve para fuentes que no informan ETag ni Last-Modified: si la huella no cambió, el
+    contenido tampoco.
+
+    Args:
+        ruta: Ruta del archivo
+
+    Returns:
+        Texto 'contenido:<bytes>-<sha256>'
+    """
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b''):
+            sha.update(bloque)
+    return f"contenido:{os.path.getsize(ruta)}-{sha.hexdigest()}"
@@ -0,0 +1,135 @@
+"""
+Resolución de columnas por huella del encabezado
+La asignación de columnas (qué columna del archivo es la fecha, el monto, etc.) se calcula
+una sola vez por encabezado distinto y se guarda en la caché; las cargas siguientes con el
+mismo encabezado solo renombran
+"""
+
+import hashlib
+import json
+import threading
+from typing import Optional, Dict, List, Sequence, Tuple
+
+import pandas as pd
+
+from cache_local import leer_json, guardar_json
+
+# Archivo JSON de la caché con las asignaciones por huella
+NOMBRE_CACHE_ESQUEMAS = 'esquemas_columnas'
+
+# Rol -> palabras clave que lo identifican en el nombre de la columna
+Roles = Dict[str, Sequence[str]]
+
+# Roles del dashboard de OneDrive (columnas en español)
+ROLES_GASTOS: Roles = {
+    'Fecha': ('fecha', 'date', 'time', 'día', 'dia'),
+    'Monto': ('monto', 'amount', 'precio', 'cost', 'gasto', 'valor'),
+    'Categoria': ('categoria', 'category', 'tipo', 'type', 'class'),
+    'Descripcion': ('descripcion', 'description', 'detalle', 'detail', 'concepto'),
+}
+
+# Columnas del Excel de transacciones, en su orden habitual (dashboard.py)
+COLUMNAS_EXCEL = ('MessageID', 'ID', 'Bank', 'Business', 'Location', 'Date', 'Card', 'Amount', 'Responsible')
+
+ROLES_EXCEL: Roles = {
+    'MessageID': ('messageid', 'message id', 'mensaje'),
+    'ID': (),
+    'Bank': ('bank', 'banco'),
+    'Business': ('business', 'comercio', 'negocio'),
+    'Location': ('location', 'ubicacion', 'ubicación', 'lugar'),
+    'Date': ('date', 'fecha'),
+    'Card': ('card', 'tarjeta'),
+    'Amount': ('amount', 'monto'),
+    'Responsible': ('responsible', 'responsable'),
+}
+
+_lock = threading.Lock()
+_esquemas: Optional[Dict[str, Dict[str, str]]] = None
+
+
+def huella_columnas(columnas: Sequence, roles: Roles, posicional: Optional[Sequence[str]] = None) -> str:
+    """
+    Huella del encabezado junto con los roles buscados (cambia si cambia cualquiera de los dos)
+    """
+    contenido = json.dumps(
+        [[str(columna) for columna in columnas], {rol: list(claves) for rol, claves in roles.items()},
+         list(posicional or [])],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+
+def _detectar(columnas: List[str], roles: Roles, posicional: Optional[Sequence[str]]) -> Dict[str, str]:
+    """
+    Heurística de nombres: coincidencia exacta con el rol y luego por palabra clave
+    """
+    mapeo: Dict[str, str] = {}
+    libres = [columna for columna in columnas if columna not in roles]
+
+    for rol, claves in roles.items():
+        if rol in columnas:
+            continue
+        exacta = [columna for columna in libres if columna.lower() == rol.lower()]
+        candidatas = exacta or [
+            columna for columna in libres
+            if any(clave in columna.lower() for clave in claves)
+        ]
+        if candidatas:
+            mapeo[candidatas[0]] = rol
+            libres.remove(candidatas[0])
+
+    # Sin nombres reconocibles: asignar los roles por posición
+    if posicional:
+        resueltos = set(columnas) | set(mapeo.values())
+        if not all(rol in resueltos for rol in posicional) and len(columnas) >= len(posicional):
+            mapeo = dict(zip(columnas, posicional))
+
+    return mapeo
+
+
+def resolver_columnas(columnas: Sequence, roles: Roles,
+                      posicional: Optional[Sequence[str]] = None) -> Dict[str, str]:
+    """
+    Asignación columna original -> rol para un encabezado
+
+    Se calcula con la heurística la primera vez que aparece un encabezado y luego se lee
+    de la caché (en memoria y en disco).
+
+    Args:
+        columnas: Encabezado del archivo
+        roles: Roles a buscar y sus palabras clave
+        posicional: Roles en el orden de las columnas, usados si la heurística no
+            encuentra todos (opcional)
+
+    Returns:
+        Diccionario para DataFrame.rename (solo las columnas que cambian de nombre)
+    """
+    global _esquemas
+    columnas = [str(columna) for columna in columnas]
+    huella = huella_columnas(columnas, roles, posicional)
+
+    with _lock:
+        if _esquemas is None:
+            _esquemas = leer_json(NOMBRE_CACHE_ESQUEMAS)
+        mapeo = _esquemas.get(huella)
+        if mapeo is None:
+            mapeo = _detectar(columnas, roles, posicional)
+            _esquemas[huella] = mapeo
+            guardar_json(NOMBRE_CACHE_ESQUEMAS, _esquemas)
+
+    return {original: rol for original, rol in mapeo.items() if original != rol}
+
+
+def normalizar_columnas(df: pd.DataFrame, roles: Roles,
+                        posicional: Optional[Sequence[str]] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Renombra las columnas del DataFrame según la asignación de su encabezado
+
+    Returns:
+        Tupla (DataFrame renombrado, roles que no se encontraron)
+    """
+    if not all(isinstance(columna, str) for columna in df.columns):
+        df = df.rename(columns=str)
+    df = df.rename(columns=resolver_columnas(df.columns, roles, posicional))
+    faltantes = [rol for rol in (posicional or roles) if rol not in df.columns]
+    return df, faltantes
@@ -0,0 +1,332 @@
+"""
+Lectura de archivos Excel por bloques
+Recorre las filas en modo solo lectura de openpyxl y arma bloques columnares tipados,
+sin mantener en memoria el árbol completo del libro
+
+También permite elegir el motor de lectura (openpyxl, calamine o fastexcel/Arrow) según
+los que estén instalados y los resultados de benchmark_excel.py
+"""
+
+import importlib.util
+import os
+from typing import Optional, Callable, Iterator, List, Any, Union, IO, Dict
+
+import openpyxl
+import pandas as pd
+
+from cache_local import leer_json
+
+# Filas por bloque al leer el Excel
+FILAS_POR_BLOQUE = 5000
+
+FuenteExcel = Union[str, IO[bytes]]
+
+# Firmas (magic bytes) de los formatos de archivo soportados
+FIRMA_ZIP = b'PK\x03\x04'
+FIRMA_OLE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+BYTES_DETECCION = 512
+
+
+def detectar_formato(cabecera: bytes) -> str:
+    """
+    Detecta el formato real de un archivo a partir de sus primeros bytes
+
+    Args:
+        cabecera: Primeros bytes del archivo (BYTES_DETECCION alcanzan)
+
+    Returns:
+        'xlsx' (zip), 'xls' (OLE), 'html', 'csv' o 'desconocido'
+    """
+    if cabecera.startswith(FIRMA_ZIP):
+        return 'xlsx'
+    if cabecera.startswith(FIRMA_OLE):
+        return 'xls'
+
+    texto = cabecera.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if texto.startswith((b'<!doctype html', b'<html', b'<head', b'<body', b'<?xml')):
+        return 'html'
+
+    if not texto or b'\x00' in texto:
+        return 'desconocido'
+    try:
+        texto.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Solo se tolera un carácter multibyte cortado al final de la cabecera
+        if e.start < len(texto) - 3:
+            return 'desconocido'
+    return 'csv'
+
+
+def _leer_cabecera(fuente: FuenteExcel) -> bytes:
+    """
+    Lee los primeros bytes de una ruta o buffer sin mover la posición del buffer
+    """
+    if isinstance(fuente, str):
+        with open(fuente, 'rb') as f:
+            return f.read(BYTES_DETECCION)
+
+    posicion = fuente.tell()
+    cabecera = fuente.read(BYTES_DETECCION)
+    fuente.seek(posicion)
+    return cabecera
+
+
+def unificar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Lleva los datos leídos a los mismos tipos sin importar el motor
+
+    Cada motor infiere distinto la misma hoja (un ID entero llega como float64 con Arrow e
+    int64 con calamine u openpyxl, y un bloque con celdas vacías pasa a float64). Como Excel
+    guarda todos los números como double, las columnas numéricas quedan como float64 y las
+    de fecha como datetime64[ns]; el resto se conserva.
+
+    Args:
+        df: Datos recién leídos (se modifican en el mismo DataFrame)
+
+    Returns:
+        El mismo DataFrame
+    """
+    df = df.infer_objects()
+    for columna in df.columns:
+        serie = df[columna]
+        if pd.api.types.is_bool_dtype(serie):
+            continue
+        if pd.api.types.is_numeric_dtype(serie):
+            if serie.dtype != 'float64':
+                df[columna] = serie.astype('float64')
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            if getattr(serie.dt, 'tz', None) is None and serie.dtype != 'datetime64[ns]':
+                df[columna] = serie.astype('datetime64[ns]')
+    return df
+
+
+def _bloque_a_dataframe(encabezados: List[str], columnas: List[List[Any]]) -> pd.DataFrame:
+    """
+    Convierte listas por columna en un DataFrame con los tipos de unificar_tipos
+    """
+    return unificar_tipos(pd.DataFrame({nombre: valores for nombre, valores in zip(encabezados, columnas)}))
+
+
+def iterar_bloques_excel(fuente: FuenteExcel, filas_por_bloque: int = FILAS_POR_BLOQUE,
+                         hoja: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Itera el Excel en bloques de filas ya convertidos a DataFrame
+
+    Args:
+        fuente: Ruta o buffer del archivo xlsx
+        filas_por_bloque: Cantidad de filas por bloque
+        hoja: Nombre de la hoja (por defecto la primera)
+
+    Yields:
+        DataFrames de hasta `filas_por_bloque` filas con los encabezados de la primera fila
+    """
+    # openpyxl rechaza las rutas sin extensión .xlsx; con el archivo abierto vale el
+    # formato detectado por contenido
+    archivo = open(fuente, 'rb') if isinstance(fuente, str) else None
+    try:
+        libro = openpyxl.load_workbook(archivo or fuente, read_only=True, data_only=True)
+    except Exception:
+        if archivo is not None:
+            archivo.close()
+        raise
+    try:
+        hoja_excel = libro[hoja] if hoja else libro.worksheets[0]
+        filas = hoja_excel.iter_rows(values_only=True)
+
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+
+        encabezados = [
+            str(nombre) if nombre is not None else f"Unnamed: {i}"
+            for i, nombre in enumerate(encabezado)
+        ]
+        total_columnas = len(encabezados)
+
+        columnas: List[List[Any]] = [[] for _ in range(total_columnas)]
+        filas_en_bloque = 0
+
+        for fila in filas:
+            # Omitir filas completamente vacías (igual que pd.read_excel)
+            if all(valor is None for valor in fila):
+                continue
+
+            for i in range(total_columnas):
+                columnas[i].append(fila[i] if i < len(fila) else None)
+            filas_en_bloque += 1
+
+            if filas_en_bloque >= filas_por_bloque:
+                yield _bloque_a_dataframe(encabezados, columnas)
+                columnas = [[] for _ in range(total_columnas)]
+                filas_en_bloque = 0
+
+        if filas_en_bloque:
+            yield _bloque_a_dataframe(encabezados, columnas)
+    finally:
+        libro.close()
+        if archivo is not None:
+            archivo.close()
+
+
+def leer_excel_por_bloques(fuente: FuenteExcel,
+                           transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                           filas_por_bloque: int = FILAS_POR_BLOQUE,
+                           hoja: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee un Excel completo por bloques, aplicando la transformación a cada bloque
+
+    Args:
+        fuente: Ruta o buffer del archivo xlsx
+        transform: Función aplicada a cada bloque antes de combinarlos (opcional)
+        filas_por_bloque: Cantidad de filas por bloque
+        hoja: Nombre de la hoja (por defecto la primera)
+
+    Returns:
+        DataFrame con todos los bloques combinados
+    """
+    bloques = []
+    for bloque in iterar_bloques_excel(fuente, filas_por_bloque=filas_por_bloque, hoja=hoja):
+        if transform is not None:
+            bloque = transform(bloque)
+        if bloque is not None and not bloque.empty:
+            bloques.append(bloque)
+
+    if not bloques:
+        return pd.DataFrame()
+
+    return pd.concat(bloques, ignore_index=True)
+
+
+def _leer_con_openpyxl(fuente: FuenteExcel, hoja: Optional[str]) -> pd.DataFrame:
+    return leer_excel_por_bloques(fuente, hoja=hoja)
+
+
+def _leer_con_calamine(fuente: FuenteExcel, hoja: Optional[str]) -> pd.DataFrame:
+    return pd.read_excel(fuente, engine='calamine', sheet_name=hoja or 0)
+
+
+def _leer_con_arrow(fuente: FuenteExcel, hoja: Optional[str]) -> pd.DataFrame:
+    import fastexcel
+
+    lector = fastexcel.read_excel(fuente if isinstance(fuente, str) else fuente.read())
+    return lector.load_sheet(hoja or 0).to_arrow().to_pandas()
+
+
+# Motores de lectura de xlsx: nombre -> (módulo requerido, función de lectura)
+MOTORES_EXCEL: Dict[str, tuple] = {
+    'arrow': ('fastexcel', _leer_con_arrow),
+    'calamine': ('python_calamine', _leer_con_calamine),
+    'openpyxl': ('openpyxl', _leer_con_openpyxl),
+}
+
+# Orden de preferencia cuando no hay MOTOR_EXCEL ni resultados de benchmark: la lectura por
+# bloques de openpyxl (memoria acotada); calamine y Arrow leen la hoja completa de una vez
+ORDEN_MOTORES = ['openpyxl', 'calamine', 'arrow']
+
+# Nombre del resultado de benchmark_excel.py en la caché local
+NOMBRE_BENCHMARK = 'benchmark_motores_excel'
+
+
+def motores_disponibles() -> List[str]:
+    """
+    Motores de lectura instalados, en orden de preferencia
+    """
+    return [
+        nombre for nombre in ORDEN_MOTORES
+        if importlib.util.find_spec(MOTORES_EXCEL[nombre][0]) is not None
+    ]
+
+
+def elegir_motor(motor: Optional[str] = None) -> str:
+    """
+    Elige el motor de lectura de xlsx
+
+    Se usa, en orden: el motor indicado, la variable MOTOR_EXCEL, el más rápido según el
+    último benchmark (benchmark_excel.py) o el primero disponible de ORDEN_MOTORES, es
+    decir openpyxl por bloques.
+
+    Args:
+        motor: Nombre del motor o 'auto' (opcional)
+
+    Returns:
+        Nombre de un motor instalado
+    """
+    disponibles = motores_disponibles()
+    motor = motor or os.getenv('MOTOR_EXCEL', 'auto')
+    if motor in disponibles:
+        return motor
+
+    mas_rapido = leer_json(NOMBRE_BENCHMARK).get('motor_mas_rapido')
+    if mas_rapido in disponibles:
+        return mas_rapido
+
+    return disponibles[0]
+
+
+def leer_excel(fuente: FuenteExcel, transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+               hoja: Optional[str] = None, motor: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee un xlsx completo con el motor elegido
+
+    Args:
+        fuente: Ruta o buffer del archivo xlsx
+        transform: Función aplicada a los datos leídos (opcional)
+        hoja: Nombre de la hoja (por defecto la primera)
+        motor: Motor de lectura (por defecto elegir_motor())
+
+    Returns:
+        DataFrame con los datos del archivo
+    """
+    motor = elegir_motor(motor)
+    if motor == 'openpyxl':
+        # Con openpyxl la hoja se recorre por bloques
+        return leer_excel_por_bloques(fuente, transform=transform, hoja=hoja)
+
+    df = unificar_tipos(MOTORES_EXCEL[motor][1](fuente, hoja))
+    if transform is None or df.empty:
+        return df
+
+    # Misma semántica que la lectura por bloques: la transformación recibe bloques de
+    # FILAS_POR_BLOQUE filas
+    bloques = [
+        transform(df.iloc[inicio:inicio + FILAS_POR_BLOQUE])
+        for inicio in range(0, len(df), FILAS_POR_BLOQUE)
+    ]
+    bloques = [bloque for bloque in bloques if bloque is not None and not bloque.empty]
+    return pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame()
+
+
+def leer_archivo_datos(fuente: FuenteExcel,
+                       transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> pd.DataFrame:
+    """
+    Lee un archivo de datos con el único lector que corresponde a su formato real
+
+    El formato se detecta por los primeros bytes (no por la extensión ni el content-type),
+    así un archivo dañado o en formato antiguo se intenta leer una sola vez.
+
+    Args:
+        fuente: Ruta o buffer del archivo (xlsx, xls o csv)
+        transform: Función aplicada a los datos leídos (opcional)
+
+    Returns:
+        DataFrame con los datos del archivo
+
+    Raises:
+        ValueError: Si el archivo es una página HTML o tiene un formato no soportado
+    """
+    formato = detectar_formato(_leer_cabecera(fuente))
+
+    if formato == 'xlsx':
+        return leer_excel(fuente, transform=transform)
+    if formato == 'html':
+        raise ValueError("Se recibió una página web (HTML) en lugar del archivo de datos")
+    if formato == 'xls':
+        # calamine también lee el formato antiguo y es más rápido que xlrd
+        motor = 'calamine' if 'calamine' in motores_disponibles() else 'xlrd'
+        df = pd.read_excel(fuente, engine=motor)
+    elif formato == 'csv':
+        df = pd.read_csv(fuente)
+    else:
+        raise ValueError("Formato de archivo no reconocido")
+
+    return transform(df) if transform is not None else df
@@ -5,16 +5,103 @@ Requiere configuración previa en Azure Portal
 
 import msal
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import os
-from typing import Optional, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, Callable, Tuple, Iterator, List, Set
 import pandas as pd
-from io import BytesIO
+from urllib.parse import quote
 import time
+from lector_excel import iterar_bloques_excel, leer_excel, unificar_tipos
+from cache_local import (
+    leer_json, guardar_json, leer_snapshot, guardar_snapshot, ruta_archivo, guardar_flujo
+)
+from descarga import TAMANO_BLOQUE
+from cache_tokens import obtener_cache_tokens, guardar_cache_tokens
+from bitacora_transacciones import BitacoraTransacciones, COLUMNA_ID
+from transformaciones import parsear_fechas
+
+
+# Sesión HTTP compartida por todo el proceso (keep-alive entre recargas y sesiones)
+_sesion_http: Optional[requests.Session] = None
+_lock_sesion = threading.Lock()
+_estadisticas_http = {'solicitudes': 0, 'reintentos': 0, 'errores': 0, 'tiempo_total_s': 0.0}
+
+# Timeout por defecto: (conexión, lectura) en segundos
+TIMEOUT_GRAPH: Tuple[float, float] = (5, 60)
+
+# Máximo de consultas simultáneas al buscar el archivo
+MAX_SONDEOS_PARALELOS = 6
+
+# Columnas del Excel de transacciones, en orden
+COLUMNAS_EXCEL = ['MessageID', 'ID', 'Bank', 'Business', 'Location', 'Date', 'Card', 'Amount', 'Responsible']
+
+# Filas por solicitud al leer rangos con la API de workbook
+FILAS_POR_BLOQUE_WORKBOOK = 5000
+
+# Propiedades pedidas al listar carpetas y buscar archivos (cTag se usa en la sincronización
+# incremental), y elementos por página
+CAMPOS_LISTADO = 'id,name,folder,eTag,cTag,parentReference,lastModifiedDateTime'
+ELEMENTOS_POR_PAGINA = 200
+
+
+def obtener_sesion_http() -> requests.Session:
+    """
+    Obtiene la sesión HTTP compartida con pool de conexiones y política de reintentos
+
+    Reintenta errores de conexión, 429 y 5xx con backoff exponencial respetando Retry-After.
+    """
+    global _sesion_http
+    with _lock_sesion:
+        if _sesion_http is None:
+            reintentos = Retry(
+                total=4,
+                connect=3,
+                read=2,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET', 'HEAD'],
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=reintentos)
+            sesion = requests.Session()
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            _sesion_http = sesion
+        return _sesion_http
+
+
+def obtener_estadisticas_http() -> Dict[str, Any]:
+    """
+    Estadísticas del pool de conexiones y de los reintentos hacia Graph
+
+    Returns:
+        Diccionario con solicitudes, reintentos, conexiones abiertas y reutilizadas
+    """
+    conexiones_nuevas = 0
+    solicitudes_pool = 0
+    if _sesion_http is not None:
+        for adaptador in set(_sesion_http.adapters.values()):
+            for pool in list(adaptador.poolmanager.pools._container.values()):
+                conexiones_nuevas += pool.num_connections
+                solicitudes_pool += pool.num_requests
+
+    with _lock_sesion:
+        estadisticas = dict(_estadisticas_http)
+    estadisticas['conexiones_nuevas'] = conexiones_nuevas
+    estadisticas['conexiones_reutilizadas'] = max(solicitudes_pool - conexiones_nuevas, 0)
+    return estadisticas
 
 
 class OneDriveGraphConnector:
-    def __init__(self, client_id: str, client_secret: str, tenant_id: str):
+    def __init__(self, client_id: str, client_secret: str, tenant_id: str,
+                 graph_url: str = "https://graph.microsoft.com/v1.0",
+                 timeout: Tuple[float, float] = TIMEOUT_GRAPH):
         """
         Inicializa el conector de Microsoft Graph
         
@@ -22,6 +109,8 @@ class OneDriveGraphConnector:
             client_id: Application (client) ID de Azure
             client_secret: Client secret de Azure
             tenant_id: Directory (tenant) ID de Azure
+            graph_url: URL base de Graph (permite apuntar a un servidor local de pruebas)
+            timeout: Timeout (conexión, lectura) por llamada en segundos
         """
         self.client_id = client_id
         self.client_secret = client_secret
@@ -31,13 +120,106 @@ class OneDriveGraphConnector:
         self.scopes = ["https://graph.microsoft.com/Files.Read.All"]
         
         # URL base de Microsoft Graph
-        self.graph_url = "https://graph.microsoft.com/v1.0"
+        self.graph_url = graph_url.rstrip('/')
         
-        # Configurar MSAL para device code flow (más compatible con Streamlit)
+        # Pool de conexiones compartido con reintentos
+        self.session = obtener_sesion_http()
+        self.timeout = timeout
+        
+        # Cuenta de MSAL (home_account_id) de la sesión y tokens reemplazados tras un 401
+        self.cuenta_id: Optional[str] = None
+        self._tokens_renovados: Dict[str, str] = {}
+        
+        # Configurar MSAL para device code flow (más compatible con Streamlit), con la
+        # caché de tokens cifrada compartida por el proceso
         self.app = msal.PublicClientApplication(
             client_id=self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}"
+            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+            token_cache=obtener_cache_tokens()
+        )
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET a Graph usando el pool compartido, con timeout y registro de estadísticas
+        
+        Si Graph responde 401 renueva el token una vez y repite la solicitud.
+        """
+        headers = kwargs.get('headers') or {}
+        token = headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if token in self._tokens_renovados:
+            token = self._tokens_renovados[token]
+            kwargs['headers'] = {**headers, 'Authorization': f'Bearer {token}'}
+        
+        response = self._enviar(url, **kwargs)
+        
+        if response.status_code == 401 and token:
+            nuevo_token = self.obtener_token_vigente(forzar=True)
+            if nuevo_token and nuevo_token != token:
+                self._tokens_renovados[token] = nuevo_token
+                kwargs['headers'] = {**headers, 'Authorization': f'Bearer {nuevo_token}'}
+                response = self._enviar(url, **kwargs)
+        return response
+    
+    def _enviar(self, url: str, **kwargs) -> requests.Response:
+        """
+        Ejecuta el GET y registra tiempos, errores y reintentos
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        inicio = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            with _lock_sesion:
+                _estadisticas_http['errores'] += 1
+            raise
+        finally:
+            with _lock_sesion:
+                _estadisticas_http['solicitudes'] += 1
+                _estadisticas_http['tiempo_total_s'] += time.perf_counter() - inicio
+        
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            with _lock_sesion:
+                _estadisticas_http['reintentos'] += len(retries.history)
+        return response
+    
+    def obtener_token_vigente(self, forzar: bool = False) -> Optional[str]:
+        """
+        Token de acceso vigente de la cuenta del conector (self.cuenta_id)
+        
+        MSAL devuelve el token guardado o, si vence en los próximos minutos, lo renueva
+        con el refresh token de la caché antes de que expire.
+        
+        Args:
+            forzar: Renovar aunque el token guardado siga vigente (p. ej. tras un 401)
+            
+        Returns:
+            Token de acceso o None si la cuenta no está en la caché o no se pudo renovar
+        """
+        if not self.cuenta_id:
+            return None
+        
+        cuenta = next(
+            (c for c in self.app.get_accounts() if c.get('home_account_id') == self.cuenta_id),
+            None
         )
+        if cuenta is None:
+            return None
+        
+        result = self.app.acquire_token_silent_with_error(self.scopes, account=cuenta, force_refresh=forzar)
+        guardar_cache_tokens()
+        
+        if result and "access_token" in result:
+            return result["access_token"]
+        return None
+    
+    def cuenta_de_resultado(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        Obtiene el home_account_id de la cuenta que inició sesión a partir del resultado de MSAL
+        """
+        usuario = (result.get('id_token_claims') or {}).get('preferred_username')
+        cuentas = self.app.get_accounts(username=usuario) if usuario else []
+        return cuentas[0]['home_account_id'] if cuentas else None
     
     def authenticate_device_flow(self):
         """
@@ -67,9 +249,11 @@ class OneDriveGraphConnector:
         # Botón para verificar si la autenticación se completó
         if st.button("🔄 Verificar Autenticación"):
             result = self.app.acquire_token_by_device_flow(flow)
+            guardar_cache_tokens()
             
             if "access_token" in result:
                 st.session_state["access_token"] = result["access_token"]
+                st.session_state["cuenta_msal"] = self.cuenta_de_resultado(result)
                 st.success("✅ ¡Autenticación exitosa!")
                 st.rerun()
                 return result["access_token"]
@@ -125,6 +309,7 @@ class OneDriveGraphConnector:
                 scopes=self.scopes,
                 redirect_uri=self.get_redirect_uri()
             )
+            guardar_cache_tokens()
             
             if "access_token" in result:
                 return result
@@ -151,6 +336,7 @@ class OneDriveGraphConnector:
                 refresh_token=refresh_token,
                 scopes=self.scopes
             )
+            guardar_cache_tokens()
             
             if "access_token" in result:
                 return result
@@ -166,6 +352,108 @@ class OneDriveGraphConnector:
         """
         Busca archivos por nombre en OneDrive (raíz y subdirectorios)
         
+        Usa primero la ubicación guardada de búsquedas anteriores de la misma cuenta (una sola
+        consulta) y solo recorre OneDrive si el archivo ya no existe o cambió de nombre. Sin
+        cuenta identificada no se guardan ubicaciones.
+        
+        Args:
+            access_token: Token de acceso válido
+            filename: Nombre del archivo a buscar
+            
+        Returns:
+            Información del archivo o None si no se encuentra
+        """
+        clave = self._clave_ubicacion(filename)
+        ubicacion = leer_json('ubicaciones_archivos').get(clave) if clave else None
+        
+        if ubicacion:
+            item = self.get_item_metadata(access_token, ubicacion['item_id'], drive_id=ubicacion.get('drive_id'))
+            if item and item.get('name', '').lower() == filename.lower():
+                # Actualizar la ruta si el archivo se movió de carpeta
+                ruta = item.get('parentReference', {}).get('path')
+                if ruta != ubicacion.get('path'):
+                    self._guardar_ubicacion(filename, item)
+                return item
+            st.info("🔍 La ubicación guardada ya no es válida, buscando de nuevo...")
+        
+        item = self._search_files_full_async(access_token, filename)
+        if item is False:
+            item = self._search_files_full(access_token, filename)
+        if item:
+            self._guardar_ubicacion(filename, item)
+        return item
+    
+    def _search_files_full_async(self, access_token: str, filename: str):
+        """
+        Búsqueda completa con el conector asíncrono, en el event loop compartido del proceso
+        
+        Los sondeos concurrentes de carpetas no ocupan un pool de hilos por sesión; usa la
+        misma aplicación MSAL y cuenta, así un 401 renueva el token igual que aquí.
+        
+        Returns:
+            Información del archivo, None si no se encuentra o False si httpx no está
+            instalado (se usa _search_files_full)
+        """
+        conector = self._conector_async()
+        if conector is None:
+            return False
+        from onedrive_graph_async import ejecutar
+        
+        st.info(f"🔍 Buscando '{filename}' en OneDrive...")
+        item = ejecutar(conector.search_files_full(access_token, filename))
+        if item:
+            st.success(f"✅ Archivo encontrado: {item['name']}")
+            st.info(f"📂 Ubicación: {item.get('parentReference', {}).get('path', 'Raíz')}")
+        else:
+            st.warning(f"⚠️ No se encontró el archivo: {filename}")
+        return item
+    
+    def _conector_async(self):
+        """
+        Conector asíncrono con la misma aplicación MSAL, cuenta y tokens renovados que este
+        conector, o None si httpx no está instalado
+        """
+        try:
+            from onedrive_graph_async import OneDriveGraphConnectorAsync
+        except ImportError:
+            return None
+        
+        conector = OneDriveGraphConnectorAsync(
+            self.client_id, self.client_secret, self.tenant_id,
+            graph_url=self.graph_url, app=self.app
+        )
+        conector.cuenta_id = self.cuenta_id
+        conector._tokens_renovados = self._tokens_renovados
+        return conector
+    
+    def _clave_ubicacion(self, filename: str) -> Optional[str]:
+        """
+        Clave de la ubicación guardada: cuenta y nombre del archivo (None sin cuenta)
+        """
+        return f"{self.cuenta_id}:{filename.lower()}" if self.cuenta_id else None
+    
+    def _guardar_ubicacion(self, filename: str, item: Dict[str, Any]) -> None:
+        """
+        Guarda en disco la ubicación resuelta de un archivo (drive, ID y ruta) para la cuenta
+        """
+        clave = self._clave_ubicacion(filename)
+        if not clave:
+            return
+        ubicaciones = leer_json('ubicaciones_archivos')
+        ubicaciones[clave] = {
+            'drive_id': item.get('parentReference', {}).get('driveId'),
+            'item_id': item['id'],
+            'path': item.get('parentReference', {}).get('path')
+        }
+        guardar_json('ubicaciones_archivos', ubicaciones)
+    
+    def _search_files_full(self, access_token: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Búsqueda completa: raíz, carpetas comunes y búsqueda global
+        
+        La búsqueda global y las carpetas comunes se consultan en paralelo; la primera
+        coincidencia exacta gana y se cancelan las consultas pendientes.
+        
         Args:
             access_token: Token de acceso válido
             filename: Nombre del archivo a buscar
@@ -178,52 +466,69 @@ class OneDriveGraphConnector:
             'Content-Type': 'application/json'
         }
         
+        # Los hilos del pool heredan el contexto de Streamlit para poder mostrar mensajes
+        ctx = get_script_run_ctx()
+        executor = ThreadPoolExecutor(
+            max_workers=MAX_SONDEOS_PARALELOS,
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx) if ctx else None
+        )
+        
         try:
-            # Primero intentar buscar en la raíz
-            search_url = f"{self.graph_url}/me/drive/root/children"
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
+            # La búsqueda global arranca de inmediato, en paralelo con la raíz
+            futuro_global = executor.submit(self._search_global, access_token, filename)
             
-            data = response.json()
+            # Buscar coincidencia exacta en la raíz, recordando las carpetas comunes
+            common_folders = ['casa', 'documents', 'documentos', 'home', 'archivos']
+            carpetas = []
+            for item in self._iterar_elementos(f"{self.graph_url}/me/drive/root/children", headers):
+                if item['name'].lower() == filename.lower():
+                    st.success(f"✅ Archivo encontrado en raíz: {item['name']}")
+                    return item
+                if 'folder' in item and item['name'].lower() in common_folders:
+                    carpetas.append(item)
             
-            if data.get('value'):
-                # Buscar coincidencia exacta en la raíz
-                for item in data['value']:
-                    if item['name'].lower() == filename.lower():
-                        st.success(f"✅ Archivo encontrado en raíz: {item['name']}")
-                        return item
-                
-                # Buscar en carpetas comunes (Casa, Documents, etc.)
-                common_folders = ['casa', 'documents', 'documentos', 'home', 'archivos']
-                for item in data['value']:
-                    if item.get('folder') and item['name'].lower() in common_folders:
-                        st.info(f"🔍 Buscando en carpeta: {item['name']}")
-                        folder_result = self._search_in_folder(access_token, item['id'], filename)
-                        if folder_result:
-                            return folder_result
+            if carpetas:
+                st.info(f"🔍 Buscando en carpetas: {', '.join(c['name'] for c in carpetas)} y en todo OneDrive...")
+            else:
+                st.info(f"🔍 Buscando '{filename}' en todo OneDrive...")
             
-            # Si no se encuentra en carpetas específicas, usar búsqueda global
-            st.info(f"🔍 Buscando '{filename}' en todo OneDrive...")
-            search_url = f"{self.graph_url}/me/drive/root/search(q='{filename.replace('.xlsx', '')}')"
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
+            futuros = [
+                executor.submit(self._search_in_folder, access_token, carpeta['id'], filename)
+                for carpeta in carpetas
+            ]
+            futuros.append(futuro_global)
             
-            data = response.json()
-            
-            if data.get('value'):
+            archivo_similar = None
+            for futuro in as_completed(futuros):
+                if futuro is not futuro_global:
+                    folder_result = futuro.result()
+                    if folder_result:
+                        return folder_result
+                    continue
+                
+                try:
+                    resultados = futuro.result()
+                except requests.exceptions.RequestException as e:
+                    st.warning(f"⚠️ Error en búsqueda global: {str(e)}")
+                    continue
+                
                 # Buscar coincidencia exacta
-                for item in data['value']:
+                for item in resultados:
                     if item['name'].lower() == filename.lower():
                         st.success(f"✅ Archivo encontrado: {item['name']}")
                         st.info(f"📂 Ubicación: {item.get('parentReference', {}).get('path', 'Raíz')}")
                         return item
                 
-                # Si no hay coincidencia exacta, buscar archivos .xlsx similares
-                for item in data['value']:
+                # Si no hay coincidencia exacta, recordar archivos .xlsx similares
+                for item in resultados:
                     if item['name'].lower().endswith('.xlsx') and filename.lower().replace('.xlsx', '') in item['name'].lower():
-                        st.info(f"📄 Archivo similar encontrado: {item['name']}")
-                        st.info(f"📂 Ubicación: {item.get('parentReference', {}).get('path', 'Raíz')}")
-                        return item
+                        archivo_similar = item
+                        break
+            
+            if archivo_similar:
+                st.info(f"📄 Archivo similar encontrado: {archivo_similar['name']}")
+                st.info(f"📂 Ubicación: {archivo_similar.get('parentReference', {}).get('path', 'Raíz')}")
+                return archivo_similar
             
             st.warning(f"⚠️ No se encontró el archivo: {filename}")
             return None
@@ -231,6 +536,62 @@ class OneDriveGraphConnector:
         except requests.exceptions.RequestException as e:
             st.error(f"❌ Error buscando archivo: {str(e)}")
             return None
+        finally:
+            # No esperar a las consultas restantes
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _iterar_elementos(self, url: str, headers: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre un listado de Graph página por página siguiendo @odata.nextLink
+        
+        Pide solo las propiedades de CAMPOS_LISTADO; las páginas siguientes se piden a medida
+        que se consumen, de modo que quien itera puede detenerse al encontrar el archivo.
+        
+        Args:
+            url: URL del listado (children o search)
+            headers: Encabezados con el token de acceso
+            
+        Yields:
+            Elementos (archivos y carpetas) del listado
+        """
+        params = {'$select': CAMPOS_LISTADO, '$top': ELEMENTOS_POR_PAGINA}
+        while url:
+            response = self._get(url, headers=headers, params=params)
+            response.raise_for_status()
+            data = response.json()
+            
+            yield from data.get('value', [])
+            
+            # nextLink ya incluye los parámetros de la consulta
+            url = data.get('@odata.nextLink')
+            params = None
+    
+    def _search_global(self, access_token: str, filename: str) -> List[Dict[str, Any]]:
+        """
+        Búsqueda global en todo OneDrive
+        
+        Recorre las páginas de resultados y se detiene en la primera coincidencia exacta.
+        
+        Args:
+            access_token: Token de acceso válido
+            filename: Nombre del archivo a buscar
+            
+        Returns:
+            Lista de elementos encontrados por Graph
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        
+        search_url = f"{self.graph_url}/me/drive/root/search(q='{filename.replace('.xlsx', '')}')"
+        resultados = []
+        for item in self._iterar_elementos(search_url, headers):
+            resultados.append(item)
+            if item['name'].lower() == filename.lower():
+                break
+        
+        return resultados
     
     def _search_in_folder(self, access_token: str, folder_id: str, filename: str) -> Optional[Dict[str, Any]]:
         """
@@ -251,16 +612,10 @@ class OneDriveGraphConnector:
         
         try:
             search_url = f"{self.graph_url}/me/drive/items/{folder_id}/children"
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if data.get('value'):
-                for item in data['value']:
-                    if item['name'].lower() == filename.lower():
-                        st.success(f"✅ Archivo encontrado en carpeta: {item['name']}")
-                        return item
+            for item in self._iterar_elementos(search_url, headers):
+                if item['name'].lower() == filename.lower():
+                    st.success(f"✅ Archivo encontrado en carpeta: {item['name']}")
+                    return item
             
             return None
             
@@ -268,40 +623,310 @@ class OneDriveGraphConnector:
             st.warning(f"⚠️ Error buscando en carpeta: {str(e)}")
             return None
     
-    def download_file(self, access_token: str, file_id: str) -> Optional[bytes]:
+    def download_file(self, access_token: str, file_id: str,
+                      metadata: Optional[Dict[str, Any]] = None) -> Optional[str]:
         """
-        Descarga el contenido de un archivo
+        Descarga un archivo a la caché local, escribiéndolo a disco por bloques
+        
+        Consulta primero los metadatos: si el eTag coincide con la copia guardada en disco
+        se devuelve esa copia sin descargar el archivo. La descarga usa el conector asíncrono
+        (event loop compartido, reanuda con Range) y, si httpx no está instalado, esta sesión
+        HTTP.
         
         Args:
             access_token: Token de acceso válido
             file_id: ID del archivo en OneDrive
+            metadata: Metadatos ya obtenidos del archivo (evita una consulta extra)
             
         Returns:
-            Contenido del archivo en bytes o None si hay error
+            Ruta del archivo descargado o None si hay error
         """
         headers = {
             'Authorization': f'Bearer {access_token}'
         }
         
+        # Verificar si el archivo cambió antes de descargarlo
+        if metadata is None:
+            metadata = self.get_item_metadata(access_token, file_id)
+        etag = metadata.get('eTag') if metadata else None
+        
+        clave_cache = f"descarga_{file_id}"
+        ruta = ruta_archivo(clave_cache, 'xlsx')
+        if etag and leer_json(clave_cache).get('eTag') == etag and os.path.exists(ruta):
+            st.info("⚡ Archivo sin cambios, usando copia local")
+            return ruta
+        
         download_url = f"{self.graph_url}/me/drive/items/{file_id}/content"
         
         try:
-            response = requests.get(download_url, headers=headers)
-            response.raise_for_status()
+            conector = self._conector_async()
+            if conector is not None:
+                from onedrive_graph_async import ejecutar
+                if ejecutar(conector.download_file(access_token, file_id, ruta)) is None:
+                    st.error("Error descargando archivo")
+                    return None
+            else:
+                with self._get(download_url, headers=headers, stream=True) as response:
+                    response.raise_for_status()
+                    ruta = guardar_flujo(clave_cache, response.iter_content(chunk_size=TAMANO_BLOQUE), 'xlsx')
             
-            return response.content
+            # Asociar la copia local al eTag
+            if etag:
+                guardar_json(clave_cache, {'eTag': etag, 'size': os.path.getsize(ruta)})
+            
+            return ruta
             
         except requests.exceptions.RequestException as e:
             st.error(f"Error descargando archivo: {str(e)}")
             return None
-    
-    def get_excel_data(self, access_token: str, filename: str) -> Optional[pd.DataFrame]:
+
+    def get_item_metadata(self, access_token: str, file_id: str,
+                          drive_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene solo los metadatos de un archivo (sin descargar su contenido)
+
+        Args:
+            access_token: Token de acceso válido
+            file_id: ID del archivo en OneDrive
+            drive_id: ID del drive (opcional, por defecto el drive del usuario)
+
+        Returns:
+            Metadatos del archivo (incluye eTag y cTag) o None si no existe o hay error
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}'
+        }
+
+        drive_path = f"drives/{drive_id}" if drive_id else "me/drive"
+        metadata_url = f"{self.graph_url}/{drive_path}/items/{file_id}"
+        params = {'$select': 'id,name,eTag,cTag,size,lastModifiedDateTime,parentReference'}
+
+        try:
+            response = self._get(metadata_url, headers=headers, params=params)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+
+            return response.json()
+
+        except requests.exceptions.RequestException as e:
+            st.warning(f"⚠️ Error obteniendo metadatos: {str(e)}")
+            return None
+
+    def get_excel_data_delta(self, access_token: str, filename: str,
+                             transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                             forzar_completo: bool = False,
+                             usar_workbook_api: bool = False) -> Optional[pd.DataFrame]:
+        """
+        Sincronización incremental: procesa solo las filas nuevas del Excel
+
+        Recuerda el último estado sincronizado (eTag/cTag, cantidad de filas y último MessageID)
+        y mantiene en disco el conjunto de datos ya transformado. Si el archivo no cambió no se
+        descarga. Si cambió, la bitácora de transacciones (por MessageID) compara todas las
+        filas del libro e indica cuáles son nuevas, cuáles cambiaron y cuáles se eliminaron;
+        solo esas se vuelven a transformar. Con la API de workbook, si solo se agregaron filas
+        al final, se leen y transforman únicamente esas filas.
+
+        Args:
+            access_token: Token de acceso válido
+            filename: Nombre del archivo Excel
+            transform: Función que transforma un bloque de filas crudas (opcional)
+            forzar_completo: Ignorar el estado guardado y reprocesar todo el archivo
+            usar_workbook_api: Leer solo las filas nuevas con la API de workbook (sin descargar el xlsx)
+
+        Returns:
+            DataFrame combinado (datos locales + filas nuevas) o None si hay error; el cTag
+            (o eTag) de la versión sincronizada queda en attrs['version_fuente']
+        """
+        # El estado, el snapshot y la bitácora son de la cuenta: otra cuenta con un archivo del
+        # mismo nombre no debe recibir estos datos
+        nombre_cache = f"{self.cuenta_id}_{filename}" if self.cuenta_id else filename
+        clave = f"delta_{nombre_cache}"
+        estado = {} if forzar_completo else leer_json(clave)
+        bitacora = BitacoraTransacciones(nombre_cache, estado.get('segmentos_bitacora', 0))
+        datos_locales = None
+        if estado:
+            # El snapshot local solo sirve si corresponde a la versión sincronizada
+            datos_locales, meta_snapshot = leer_snapshot(clave)
+            if meta_snapshot.get('version') != estado.get('cTag', estado.get('eTag')):
+                datos_locales = None
+            else:
+                datos_locales.attrs['version_fuente'] = meta_snapshot['version']
+
+        # Verificar el archivo conocido con una sola consulta de metadatos
+        file_info = None
+        if estado.get('item_id') and datos_locales is not None:
+            file_info = self.get_item_metadata(access_token, estado['item_id'])
+
+        if not file_info:
+            file_info = self.search_files(access_token, filename)
+
+        if not file_info:
+            st.error(f"No se encontró el archivo: {filename}")
+            return datos_locales
+
+        mismo_archivo = datos_locales is not None and file_info['id'] == estado.get('item_id')
+
+        # Sin cambios de contenido: usar los datos locales
+        if mismo_archivo and file_info.get('cTag', file_info.get('eTag')) == estado.get('cTag', estado.get('eTag')):
+            st.info(f"⚡ Sin cambios en {file_info['name']}, usando datos locales ({len(datos_locales)} filas)")
+            return datos_locales
+
+        filas_previas = estado.get('row_count', 0)
+
+        # Modo workbook: pedir a Graph solo las filas posteriores a las ya sincronizadas
+        if usar_workbook_api and mismo_archivo and filas_previas > 0:
+            # Se incluye la última fila sincronizada para verificar que no cambió
+            resultado = self.get_workbook_rows(access_token, file_info['id'], desde_fila=filas_previas - 1)
+            if resultado is not None:
+                df_bloque, total_filas = resultado
+                # Solo sirve si se agregaron filas: con el cTag distinto y la misma cantidad de
+                # filas el libro se editó, y eso requiere la fusión completa por MessageID
+                if total_filas > filas_previas and _primer_message_id(df_bloque) == estado.get('last_message_id'):
+                    df_resultado = _fusionar_filas(bitacora, datos_locales, df_bloque.iloc[1:], transform, completo=False)
+                    st.success(f"✅ Sincronización incremental (workbook): {total_filas - filas_previas} filas nuevas")
+                    self._guardar_estado_delta(clave, file_info, df_resultado, total_filas,
+                                               _ultimo_message_id(df_bloque), bitacora)
+                    return df_resultado
+            st.info("🔄 No se pudo leer solo las filas nuevas, descargando el archivo completo...")
+
+        ruta_excel = self.download_file(access_token, file_info['id'], metadata=file_info)
+
+        if not ruta_excel:
+            st.error("Error descargando el archivo")
+            return datos_locales
+
+        if datos_locales is not None and COLUMNA_ID not in datos_locales.columns:
+            datos_locales = None
+        if datos_locales is None:
+            # Sin datos locales: todas las filas cuentan como nuevas y la bitácora queda al día
+            bitacora.reiniciar()
+
+        try:
+            # El libro cambió: comparar todas sus filas con la bitácora por MessageID, así
+            # también se detectan las filas anteriores modificadas o eliminadas
+            df_resultado, total_filas, ultimo_message_id = _fusionar_por_bloques(
+                ruta_excel, bitacora, datos_locales, transform
+            )
+        except Exception as e:
+            st.error(f"Error leyendo Excel: {str(e)}")
+            return datos_locales
+
+        if datos_locales is None:
+            st.success(f"✅ Sincronización completa: {total_filas} filas")
+        else:
+            st.success(f"✅ Sincronización por MessageID: {len(df_resultado) - len(datos_locales):+d} filas ({total_filas} en el libro)")
+
+        self._guardar_estado_delta(clave, file_info, df_resultado, total_filas, ultimo_message_id, bitacora)
+
+        return df_resultado
+
+    def _guardar_estado_delta(self, clave: str, file_info: Dict[str, Any], df_resultado: pd.DataFrame,
+                              total_filas: int, last_message_id: Optional[str],
+                              bitacora: BitacoraTransacciones) -> None:
+        """
+        Persiste el conjunto de datos sincronizado y el estado de la última sincronización
+
+        La versión sincronizada se anota en df_resultado.attrs['version_fuente']. El estado
+        se escribe al final: confirma los segmentos de la bitácora agregados en esta
+        sincronización, que recién entonces se puede compactar.
+        """
+        version = file_info.get('cTag', file_info.get('eTag'))
+        guardar_snapshot(clave, df_resultado, version)
+        df_resultado.attrs['version_fuente'] = version
+        guardar_json(clave, {
+            'item_id': file_info['id'],
+            'eTag': file_info.get('eTag'),
+            'cTag': file_info.get('cTag'),
+            'row_count': total_filas,
+            'last_message_id': last_message_id,
+            'segmentos_bitacora': bitacora.ultimo_segmento
+        })
+        bitacora.compactar()
+
+    def get_workbook_rows(self, access_token: str, file_id: str, desde_fila: int = 0,
+                          hoja: Optional[str] = None) -> Optional[Tuple[pd.DataFrame, int]]:
+        """
+        Lee filas del Excel con la API de workbook de Graph, sin descargar el archivo
+
+        Consulta el usedRange de la hoja y pide solo el rango desde `desde_fila`, en bloques
+        de FILAS_POR_BLOQUE_WORKBOOK filas. El resultado usa las 9 columnas de COLUMNAS_EXCEL.
+
+        Args:
+            access_token: Token de acceso válido
+            file_id: ID del archivo en OneDrive
+            desde_fila: Índice (base 0, sin contar encabezado) de la primera fila de datos a leer
+            hoja: Nombre de la hoja (por defecto la primera)
+
+        Returns:
+            Tupla (DataFrame con las filas pedidas, total de filas de datos) o None si hay error
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}'
+        }
+
+        hojas_url = f"{self.graph_url}/me/drive/items/{file_id}/workbook/worksheets"
+
+        try:
+            if hoja is None:
+                response = self._get(hojas_url, headers=headers, params={'$select': 'name', '$top': 1})
+                response.raise_for_status()
+                hojas = response.json().get('value', [])
+                if not hojas:
+                    return None
+                hoja = hojas[0]['name']
+
+            hoja_url = f"{hojas_url}/{quote(hoja, safe='')}"
+
+            response = self._get(
+                f"{hoja_url}/usedRange(valuesOnly=true)",
+                headers=headers,
+                params={'$select': 'address,rowCount,columnCount'}
+            )
+            response.raise_for_status()
+            rango_usado = response.json()
+
+            if rango_usado.get('columnCount', 0) < len(COLUMNAS_EXCEL):
+                return None
+
+            fila_inicio, columna_inicio = _inicio_rango(rango_usado['address'])
+            total_filas = rango_usado['rowCount'] - 1  # sin encabezado
+            columna_fin = columna_inicio + len(COLUMNAS_EXCEL) - 1
+
+            # Filas de Excel (base 1): la fila fila_inicio es el encabezado
+            primera = fila_inicio + 1 + desde_fila
+            ultima = fila_inicio + total_filas
+
+            valores = []
+            for inicio in range(primera, ultima + 1, FILAS_POR_BLOQUE_WORKBOOK):
+                fin = min(inicio + FILAS_POR_BLOQUE_WORKBOOK - 1, ultima)
+                direccion = f"{_letra_columna(columna_inicio)}{inicio}:{_letra_columna(columna_fin)}{fin}"
+                response = self._get(
+                    f"{hoja_url}/range(address='{direccion}')",
+                    headers=headers,
+                    params={'$select': 'values'}
+                )
+                response.raise_for_status()
+                valores.extend(response.json().get('values', []))
+
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            st.warning(f"⚠️ Error leyendo rango del workbook: {str(e)}")
+            return None
+
+        df = pd.DataFrame(valores, columns=COLUMNAS_EXCEL)
+        df = df.where(df != '')  # Graph devuelve celdas vacías como ''
+
+        return _normalizar_crudas(df), total_filas
+
+    def get_excel_data(self, access_token: str, filename: str,
+                       transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> Optional[pd.DataFrame]:
         """
         Busca y descarga un archivo Excel, devolviendo un DataFrame
         
         Args:
             access_token: Token de acceso válido
             filename: Nombre del archivo Excel
+            transform: Función aplicada a cada bloque de filas al leer (opcional)
             
         Returns:
             DataFrame con los datos del Excel o None si hay error
@@ -316,15 +941,15 @@ class OneDriveGraphConnector:
         st.success(f"✅ Archivo encontrado: {file_info['name']}")
         
         # Descargar el archivo
-        file_content = self.download_file(access_token, file_info['id'])
+        ruta_excel = self.download_file(access_token, file_info['id'], metadata=file_info)
         
-        if not file_content:
+        if not ruta_excel:
             st.error("Error descargando el archivo")
             return None
         
         # Convertir a DataFrame
         try:
-            df = pd.read_excel(BytesIO(file_content))
+            df = leer_excel(ruta_excel, transform=transform)
             st.success(f"✅ Archivo Excel cargado: {len(df)} filas")
             return df
             
@@ -333,33 +958,235 @@ class OneDriveGraphConnector:
             return None
 
 
-def init_graph_connection() -> Optional[OneDriveGraphConnector]:
+def _normalizar_crudas(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Inicializa la conexión con Microsoft Graph usando variables de entorno
-    
+    Representación cruda común a la API de workbook y al xlsx descargado
+
+    La API de workbook entrega las fechas como número de serie de Excel (o texto) y el xlsx
+    como objetos fecha; se convierten a datetime en ambos casos, y los números quedan con
+    los tipos de unificar_tipos, para que el hash de la bitácora no dependa de la vía por
+    la que se leyó la fila.
+    """
+    df = unificar_tipos(df)
+    if 'Date' in df.columns:
+        df = df.assign(Date=parsear_fechas(df['Date']))
+    return df
+
+
+def _fusionar_por_bloques(fuente: str, bitacora: BitacoraTransacciones,
+                          datos_locales: Optional[pd.DataFrame],
+                          transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]]
+                          ) -> Tuple[pd.DataFrame, int, Optional[str]]:
+    """
+    Recorre el libro por bloques y fusiona cada uno con la bitácora
+
+    De cada bloque solo se conservan (ya transformadas) las filas nuevas o modificadas; el
+    libro crudo nunca se reúne completo en memoria. Al terminar se registran como eliminados
+    los MessageID que no aparecieron.
+
+    Args:
+        fuente: Ruta del xlsx descargado
+        bitacora: Bitácora de transacciones del archivo
+        datos_locales: Datos transformados de la sincronización anterior (None si no hay)
+        transform: Función que transforma un bloque de filas crudas (opcional)
+
     Returns:
-        Conector configurado o None si faltan credenciales
+        Tupla (datos transformados actualizados, total de filas, último MessageID)
+    """
+    total_filas = 0
+    ultimo_message_id = None
+    vistos: Set[str] = set()
+    cambiados: Set[str] = set()
+    transformadas = []
+
+    for bloque in iterar_bloques_excel(fuente):
+        bloque = _normalizar_crudas(bloque)
+        total_filas += len(bloque)
+        ultimo_message_id = _ultimo_message_id(bloque)
+
+        cambiadas, _ = bitacora.fusionar(bloque, completo=False)
+        if COLUMNA_ID in bloque.columns:
+            vistos.update(bloque[COLUMNA_ID].dropna().astype(str))
+            cambiados.update(cambiadas[COLUMNA_ID].dropna().astype(str))
+        if not cambiadas.empty:
+            transformadas.append(_transformar_por_bloques(cambiadas, transform))
+
+    eliminados = bitacora.registrar_eliminados(vistos)
+    nuevas = pd.concat(transformadas, ignore_index=True) if transformadas else pd.DataFrame()
+
+    # Un MessageID repetido en bloques distintos cuenta una sola vez (la última fila)
+    if COLUMNA_ID in nuevas.columns:
+        ids_nuevas = nuevas[COLUMNA_ID].astype(str).where(nuevas[COLUMNA_ID].notna())
+        nuevas = nuevas[ids_nuevas.isna() | ~ids_nuevas.duplicated(keep='last')]
+
+    if datos_locales is None:
+        return nuevas.reset_index(drop=True), total_filas, ultimo_message_id
+
+    # Filas locales reemplazadas o eliminadas; las filas sin MessageID vienen de nuevo en el libro
+    ids_locales = datos_locales[COLUMNA_ID].astype(str).where(datos_locales[COLUMNA_ID].notna())
+    quitar = ids_locales.isna() | ids_locales.isin(cambiados | eliminados)
+
+    df = pd.concat([datos_locales[~quitar], nuevas], ignore_index=True)
+    return df, total_filas, ultimo_message_id
+
+
+def _transformar_por_bloques(df: pd.DataFrame,
+                             transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]]) -> pd.DataFrame:
+    """
+    Aplica la transformación en bloques de FILAS_POR_BLOQUE_WORKBOOK filas
+    """
+    if transform is None or df.empty:
+        return df.reset_index(drop=True)
+
+    bloques = [
+        transform(df.iloc[inicio:inicio + FILAS_POR_BLOQUE_WORKBOOK])
+        for inicio in range(0, len(df), FILAS_POR_BLOQUE_WORKBOOK)
+    ]
+    return pd.concat(bloques, ignore_index=True)
+
+
+def _fusionar_filas(bitacora: BitacoraTransacciones, datos_locales: pd.DataFrame, df_crudo: pd.DataFrame,
+                    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]],
+                    completo: bool) -> pd.DataFrame:
+    """
+    Fusiona filas crudas con los datos ya transformados usando la bitácora
+
+    Solo se transforman las filas nuevas o modificadas; las versiones anteriores de esas
+    filas y las eliminadas se quitan de los datos locales.
+
+    Args:
+        bitacora: Bitácora de transacciones del archivo
+        datos_locales: Datos transformados de la sincronización anterior
+        df_crudo: Filas leídas del libro (todas si `completo`, o solo las agregadas)
+        transform: Función que transforma un bloque de filas crudas (opcional)
+        completo: Si df_crudo es el libro completo
+
+    Returns:
+        Datos transformados actualizados
+    """
+    if COLUMNA_ID not in df_crudo.columns or COLUMNA_ID not in datos_locales.columns:
+        if completo:
+            return _transformar_por_bloques(df_crudo, transform)
+        return pd.concat([datos_locales, _transformar_por_bloques(df_crudo, transform)], ignore_index=True)
+
+    cambiadas, eliminados = bitacora.fusionar(df_crudo, completo=completo)
+
+    # Filas locales reemplazadas o eliminadas; las filas sin MessageID solo se conservan
+    # en sincronizaciones parciales (en las completas vienen de nuevo en df_crudo)
+    ids_locales = datos_locales[COLUMNA_ID].astype(str).where(datos_locales[COLUMNA_ID].notna())
+    quitar = ids_locales.isin(set(cambiadas[COLUMNA_ID].dropna().astype(str)) | eliminados)
+    if completo:
+        quitar |= ids_locales.isna()
+
+    return pd.concat(
+        [datos_locales[~quitar], _transformar_por_bloques(cambiadas, transform)],
+        ignore_index=True
+    )
+
+
+def _primer_message_id(df: pd.DataFrame) -> Optional[str]:
+    """
+    Obtiene el MessageID de la primera fila (None si no hay filas o columna MessageID)
+    """
+    if df.empty or 'MessageID' not in df.columns:
+        return None
+    return str(df['MessageID'].iloc[0])
+
+
+def _inicio_rango(direccion: str) -> Tuple[int, int]:
+    """
+    Obtiene (fila, columna) base 1 de la celda inicial de una dirección como 'Hoja1!B2:J50'
+    """
+    celda = direccion.split('!')[-1].split(':')[0].replace('$', '')
+    letras = ''.join(c for c in celda if c.isalpha()).upper()
+    columna = 0
+    for letra in letras:
+        columna = columna * 26 + (ord(letra) - ord('A') + 1)
+    return int(celda[len(letras):]), columna
+
+
+def _letra_columna(columna: int) -> str:
+    """
+    Convierte un número de columna base 1 en letras de Excel (1 -> A, 27 -> AA)
+    """
+    letras = ''
+    while columna > 0:
+        columna, resto = divmod(columna - 1, 26)
+        letras = chr(ord('A') + resto) + letras
+    return letras
+
+
+def _ultimo_message_id(df: pd.DataFrame) -> Optional[str]:
+    """
+    Obtiene el MessageID de la última fila (None si no hay filas o columna MessageID)
+    """
+    if df.empty or 'MessageID' not in df.columns:
+        return None
+    return str(df['MessageID'].iloc[-1])
+
+
+def leer_credenciales_azure() -> Tuple[Optional[str], Optional[str], Optional[str]]:
     """
-    # Importar streamlit para ambos casos
-    import streamlit as st
+    Credenciales de Azure desde st.secrets (Streamlit Cloud) o variables de entorno
     
+    Returns:
+        Tupla (client_id, client_secret, tenant_id); los valores faltantes son None
+    """
     # Intentar leer desde secrets primero (Streamlit Cloud)
     try:
-        client_id = st.secrets["AZURE_CLIENT_ID"]
-        client_secret = st.secrets["AZURE_CLIENT_SECRET"]
-        tenant_id = st.secrets["AZURE_TENANT_ID"]
-        # Si llegamos aquí, estamos en Streamlit Cloud
-    except:
+        return st.secrets["AZURE_CLIENT_ID"], st.secrets["AZURE_CLIENT_SECRET"], st.secrets["AZURE_TENANT_ID"]
+    except Exception:
         # Fallback para desarrollo local
-        client_id = os.getenv('AZURE_CLIENT_ID')
-        client_secret = os.getenv('AZURE_CLIENT_SECRET')
-        tenant_id = os.getenv('AZURE_TENANT_ID')
+        return os.getenv('AZURE_CLIENT_ID'), os.getenv('AZURE_CLIENT_SECRET'), os.getenv('AZURE_TENANT_ID')
+
+
+def init_graph_connection() -> Optional[OneDriveGraphConnector]:
+    """
+    Inicializa la conexión con Microsoft Graph usando variables de entorno
+    
+    Returns:
+        Conector configurado o None si faltan credenciales
+    """
+    client_id, client_secret, tenant_id = leer_credenciales_azure()
     
     if not all([client_id, client_secret, tenant_id]):
         st.warning("⚠️ Configuración de Azure incompleta. Revisa las variables de entorno.")
         return None
     
-    return OneDriveGraphConnector(client_id, client_secret, tenant_id)
+    # Permite apuntar a un servidor Graph local para pruebas
+    graph_url = os.getenv('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0')
+    
+    return OneDriveGraphConnector(client_id, client_secret, tenant_id, graph_url=graph_url)
+
+
+def asegurar_token_vigente(connector: OneDriveGraphConnector) -> Optional[str]:
+    """
+    Devuelve un token vigente para la sesión actual, renovándolo antes de que venza
+    
+    Usa la cuenta guardada en la sesión y la caché de tokens del proceso; si la cuenta no
+    está en la caché recurre al refresh token de la sesión.
+    
+    Args:
+        connector: Conector de Graph
+        
+    Returns:
+        Token de acceso (también se actualiza en session_state) o None si no hay sesión
+    """
+    connector.cuenta_id = st.session_state.get('cuenta_msal')
+    token = connector.obtener_token_vigente()
+    
+    if token is None and 'refresh_token' in st.session_state:
+        result = connector.get_token_from_refresh(st.session_state['refresh_token'])
+        if result:
+            token = result['access_token']
+            st.session_state['refresh_token'] = result.get('refresh_token', st.session_state['refresh_token'])
+            st.session_state['cuenta_msal'] = connector.cuenta_id = connector.cuenta_de_resultado(result)
+    
+    if token is None:
+        return st.session_state.get('access_token')
+    
+    st.session_state['access_token'] = token
+    return token
 
 
 def handle_oauth_callback():
@@ -383,6 +1210,7 @@ def handle_oauth_callback():
         if token_data and 'access_token' in token_data:
             # Guardar tokens en session state
             st.session_state['access_token'] = token_data['access_token']
+            st.session_state['cuenta_msal'] = connector.cuenta_de_resultado(token_data)
             if 'refresh_token' in token_data:
                 st.session_state['refresh_token'] = token_data['refresh_token']
             
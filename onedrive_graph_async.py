@@ -0,0 +1,466 @@
+"""
+Versión asíncrona del conector de Microsoft Graph
+Todas las consultas (búsqueda, metadatos, descarga y renovación de token) corren en un único
+event loop del proceso con un pool de conexiones compartido, de modo que varias sesiones y
+varios sondeos de carpetas no ocupan un hilo de Streamlit cada uno. OneDriveGraphConnector lo
+usa para la búsqueda completa y para descargar el archivo a disco por bloques
+"""
+
+import asyncio
+import os
+import threading
+from typing import Optional, Dict, Any, List, Coroutine, TypeVar, AsyncIterator
+
+import httpx
+import msal
+
+from cache_local import leer_json, guardar_json
+from cache_tokens import obtener_cache_tokens, guardar_cache_tokens
+from descarga import TAMANO_BLOQUE
+from onedrive_graph import (
+    TIMEOUT_GRAPH, MAX_SONDEOS_PARALELOS, CAMPOS_LISTADO, ELEMENTOS_POR_PAGINA, leer_credenciales_azure
+)
+
+T = TypeVar('T')
+
+# Event loop compartido por todo el proceso, ejecutándose en un hilo propio
+_bucle: Optional[asyncio.AbstractEventLoop] = None
+_cliente_http: Optional[httpx.AsyncClient] = None
+_lock_bucle = threading.Lock()
+
+# Reintentos ante límites de Graph y errores del servidor
+ESTADOS_REINTENTO = {429, 500, 502, 503, 504}
+MAX_REINTENTOS = 4
+ESPERA_BASE_S = 0.5
+
+
+def obtener_bucle() -> asyncio.AbstractEventLoop:
+    """
+    Obtiene (e inicia la primera vez) el event loop compartido del proceso
+    """
+    global _bucle
+    with _lock_bucle:
+        if _bucle is None:
+            bucle = asyncio.new_event_loop()
+            threading.Thread(target=bucle.run_forever, name="graph-async", daemon=True).start()
+            _bucle = bucle
+        return _bucle
+
+
+def ejecutar(corrutina: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """
+    Ejecuta una corrutina en el event loop compartido y espera su resultado
+
+    Permite usar el conector asíncrono desde el código síncrono de Streamlit.
+
+    Args:
+        corrutina: Corrutina a ejecutar
+        timeout: Segundos máximos de espera (opcional)
+
+    Returns:
+        Resultado de la corrutina
+    """
+    return asyncio.run_coroutine_threadsafe(corrutina, obtener_bucle()).result(timeout)
+
+
+def _obtener_cliente_http() -> httpx.AsyncClient:
+    """
+    Cliente HTTP asíncrono compartido (keep-alive), creado dentro del event loop
+    """
+    global _cliente_http
+    if _cliente_http is None:
+        conexion, lectura = TIMEOUT_GRAPH
+        _cliente_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(lectura, connect=conexion),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            follow_redirects=True
+        )
+    return _cliente_http
+
+
+class OneDriveGraphConnectorAsync:
+    def __init__(self, client_id: str, client_secret: str, tenant_id: str,
+                 graph_url: str = "https://graph.microsoft.com/v1.0",
+                 app: Optional[msal.PublicClientApplication] = None):
+        """
+        Inicializa el conector asíncrono de Microsoft Graph
+
+        Args:
+            client_id: Application (client) ID de Azure
+            client_secret: Client secret de Azure
+            tenant_id: Directory (tenant) ID de Azure
+            graph_url: URL base de Graph (permite apuntar a un servidor local de pruebas)
+            app: Aplicación MSAL ya creada (p. ej. la del conector síncrono) para compartir
+                su caché de tokens
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self.scopes = ["https://graph.microsoft.com/Files.Read.All"]
+        self.graph_url = graph_url.rstrip('/')
+
+        self.app = app or msal.PublicClientApplication(
+            client_id=self.client_id,
+            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+            token_cache=obtener_cache_tokens()
+        )
+
+        # Cuenta de MSAL (home_account_id) de la sesión y tokens reemplazados tras un 401
+        self.cuenta_id: Optional[str] = None
+        self._tokens_renovados: Dict[str, str] = {}
+
+    async def _get(self, url: str, access_token: str, **kwargs) -> httpx.Response:
+        """
+        GET a Graph con el cliente compartido
+
+        Si Graph responde 401 renueva el token una vez y repite la solicitud (igual que el
+        conector síncrono).
+        """
+        access_token = self._tokens_renovados.get(access_token, access_token)
+        response = await self._enviar(url, access_token, **kwargs)
+
+        if response.status_code == 401:
+            nuevo_token = await self.obtener_token_vigente(forzar=True)
+            if nuevo_token and nuevo_token != access_token:
+                self._tokens_renovados[access_token] = nuevo_token
+                response = await self._enviar(url, nuevo_token, **kwargs)
+        return response
+
+    async def _enviar(self, url: str, access_token: str, **kwargs) -> httpx.Response:
+        """
+        Ejecuta el GET reintentando 429/5xx con backoff exponencial y respetando Retry-After
+        """
+        headers = {'Authorization': f'Bearer {access_token}'}
+        cliente = _obtener_cliente_http()
+
+        for intento in range(MAX_REINTENTOS + 1):
+            try:
+                response = await cliente.get(url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if intento == MAX_REINTENTOS:
+                    raise
+                await asyncio.sleep(ESPERA_BASE_S * 2 ** intento)
+                continue
+
+            if response.status_code not in ESTADOS_REINTENTO or intento == MAX_REINTENTOS:
+                return response
+
+            espera = response.headers.get('Retry-After')
+            await asyncio.sleep(float(espera) if espera and espera.isdigit() else ESPERA_BASE_S * 2 ** intento)
+
+        return response
+
+    async def obtener_token_vigente(self, forzar: bool = False) -> Optional[str]:
+        """
+        Token de acceso vigente de la cuenta del conector (self.cuenta_id)
+
+        MSAL es síncrono: se ejecuta en un hilo auxiliar para no bloquear el event loop.
+
+        Args:
+            forzar: Renovar aunque el token guardado siga vigente (p. ej. tras un 401)
+
+        Returns:
+            Token de acceso o None si la cuenta no está en la caché o no se pudo renovar
+        """
+        if not self.cuenta_id:
+            return None
+
+        def renovar() -> Optional[Dict[str, Any]]:
+            cuenta = next(
+                (c for c in self.app.get_accounts() if c.get('home_account_id') == self.cuenta_id),
+                None
+            )
+            if cuenta is None:
+                return None
+            result = self.app.acquire_token_silent_with_error(self.scopes, account=cuenta, force_refresh=forzar)
+            guardar_cache_tokens()
+            return result
+
+        result = await asyncio.to_thread(renovar)
+        if result and "access_token" in result:
+            return result["access_token"]
+        return None
+
+    async def get_token_from_refresh(self, refresh_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Renueva el token usando el refresh token (MSAL es síncrono: se ejecuta en un hilo
+        auxiliar para no bloquear el event loop)
+
+        Returns:
+            Nuevo token de acceso o None si hay error
+        """
+        try:
+            result = await asyncio.to_thread(
+                self.app.acquire_token_by_refresh_token,
+                refresh_token=refresh_token,
+                scopes=self.scopes
+            )
+        except Exception:
+            return None
+        guardar_cache_tokens()
+        return result if "access_token" in result else None
+
+    async def get_item_metadata(self, access_token: str, file_id: str,
+                                drive_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene solo los metadatos de un archivo (sin descargar su contenido)
+
+        Returns:
+            Metadatos del archivo (incluye eTag y cTag) o None si no existe o hay error
+        """
+        drive_path = f"drives/{drive_id}" if drive_id else "me/drive"
+        metadata_url = f"{self.graph_url}/{drive_path}/items/{file_id}"
+        params = {'$select': 'id,name,eTag,cTag,size,lastModifiedDateTime,parentReference'}
+
+        try:
+            response = await self._get(metadata_url, access_token, params=params)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError:
+            return None
+
+    async def download_file(self, access_token: str, file_id: str, ruta_destino: str) -> Optional[str]:
+        """
+        Descarga el contenido de un archivo a disco por bloques, con el cliente compartido
+
+        Los bytes se escriben en `ruta_destino + '.parcial'` y solo al completarse se mueve el
+        archivo a su destino. Si la conexión se corta, la descarga continúa desde el último
+        byte recibido con Range (If-Range con el eTag, así una versión nueva se descarga
+        completa). Los 429/5xx se reintentan como en _enviar y un 401 renueva el token una vez.
+
+        Args:
+            access_token: Token de acceso válido
+            file_id: ID del archivo en OneDrive
+            ruta_destino: Ruta final del archivo descargado
+
+        Returns:
+            ruta_destino o None si la descarga no se completó
+        """
+        access_token = self._tokens_renovados.get(access_token, access_token)
+        url = f"{self.graph_url}/me/drive/items/{file_id}/content"
+        ruta_parcial = f"{ruta_destino}.parcial"
+        cliente = _obtener_cliente_http()
+
+        descargado = 0
+        validador: Optional[str] = None
+        token_renovado = False
+        for intento in range(MAX_REINTENTOS + 1):
+            headers = {'Authorization': f'Bearer {access_token}'}
+            if descargado and validador:
+                headers['Range'] = f"bytes={descargado}-"
+                headers['If-Range'] = validador
+
+            espera: Optional[float] = None
+            try:
+                async with cliente.stream('GET', url, headers=headers) as response:
+                    if response.status_code == 401 and not token_renovado:
+                        token_renovado = True
+                        nuevo_token = await self.obtener_token_vigente(forzar=True)
+                        if nuevo_token and nuevo_token != access_token:
+                            self._tokens_renovados[access_token] = nuevo_token
+                            access_token = nuevo_token
+                            continue
+
+                    if response.status_code in ESTADOS_REINTENTO and intento < MAX_REINTENTOS:
+                        retry_after = response.headers.get('Retry-After')
+                        espera = float(retry_after) if retry_after and retry_after.isdigit() else ESPERA_BASE_S * 2 ** intento
+                    else:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            # Primera solicitud, o el servidor ignoró el Range: empezar de cero
+                            descargado = 0
+                            validador = response.headers.get('ETag')
+
+                        with open(ruta_parcial, 'ab' if descargado else 'wb') as f:
+                            async for bloque in response.aiter_bytes(TAMANO_BLOQUE):
+                                # La escritura a disco no bloquea el event loop compartido
+                                await asyncio.to_thread(f.write, bloque)
+                                descargado += len(bloque)
+
+                        os.replace(ruta_parcial, ruta_destino)
+                        return ruta_destino
+
+            except httpx.TransportError:
+                if intento == MAX_REINTENTOS:
+                    return None
+                # Sin validador no se puede reanudar con seguridad
+                if not validador:
+                    descargado = 0
+                espera = ESPERA_BASE_S * 2 ** intento
+            except (httpx.HTTPError, OSError):
+                return None
+
+            if espera is not None:
+                await asyncio.sleep(espera)
+
+        return None
+
+    async def search_files(self, access_token: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un archivo por nombre: primero la ubicación guardada de la cuenta y, si ya no es válida,
+        la raíz, las carpetas comunes y la búsqueda global de forma concurrente
+
+        Returns:
+            Información del archivo o None si no se encuentra
+        """
+        clave = self._clave_ubicacion(filename)
+        ubicacion = leer_json('ubicaciones_archivos').get(clave) if clave else None
+        if ubicacion:
+            item = await self.get_item_metadata(access_token, ubicacion['item_id'], drive_id=ubicacion.get('drive_id'))
+            if item and item.get('name', '').lower() == filename.lower():
+                if item.get('parentReference', {}).get('path') != ubicacion.get('path'):
+                    self._guardar_ubicacion(filename, item)
+                return item
+
+        item = await self.search_files_full(access_token, filename)
+        if item:
+            self._guardar_ubicacion(filename, item)
+        return item
+
+    def _clave_ubicacion(self, filename: str) -> Optional[str]:
+        """
+        Clave de la ubicación guardada: cuenta y nombre del archivo (None sin cuenta)
+        """
+        return f"{self.cuenta_id}:{filename.lower()}" if self.cuenta_id else None
+
+    def _guardar_ubicacion(self, filename: str, item: Dict[str, Any]) -> None:
+        """
+        Guarda en disco la ubicación resuelta de un archivo (mismo formato que el conector síncrono)
+        """
+        clave = self._clave_ubicacion(filename)
+        if not clave:
+            return
+        ubicaciones = leer_json('ubicaciones_archivos')
+        ubicaciones[clave] = {
+            'drive_id': item.get('parentReference', {}).get('driveId'),
+            'item_id': item['id'],
+            'path': item.get('parentReference', {}).get('path')
+        }
+        guardar_json('ubicaciones_archivos', ubicaciones)
+
+    async def search_files_full(self, access_token: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Búsqueda completa concurrente; la primera coincidencia exacta gana y se cancelan
+        las consultas pendientes
+        """
+        nombre = filename.lower()
+        limite = asyncio.Semaphore(MAX_SONDEOS_PARALELOS)
+
+        async def con_limite(corrutina):
+            async with limite:
+                return await corrutina
+
+        tarea_global = asyncio.ensure_future(con_limite(self._search_global(access_token, filename)))
+        pendientes = {tarea_global}
+
+        try:
+            common_folders = ['casa', 'documents', 'documentos', 'home', 'archivos']
+            async for item in self._iterar_elementos(f"{self.graph_url}/me/drive/root/children", access_token):
+                if item['name'].lower() == nombre:
+                    return item
+                if 'folder' in item and item['name'].lower() in common_folders:
+                    pendientes.add(asyncio.ensure_future(
+                        con_limite(self._search_in_folder(access_token, item['id'], filename))
+                    ))
+
+            archivo_similar = None
+            for siguiente in asyncio.as_completed(pendientes):
+                try:
+                    resultado = await siguiente
+                except httpx.HTTPError:
+                    continue
+
+                if isinstance(resultado, dict):
+                    return resultado
+                if not resultado:
+                    continue
+
+                # Resultados de la búsqueda global
+                for item in resultado:
+                    if item['name'].lower() == nombre:
+                        return item
+                if archivo_similar is None:
+                    archivo_similar = next(
+                        (item for item in resultado
+                         if item['name'].lower().endswith('.xlsx') and nombre.replace('.xlsx', '') in item['name'].lower()),
+                        None
+                    )
+
+            return archivo_similar
+
+        except httpx.HTTPError:
+            return None
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+
+    async def _iterar_elementos(self, url: str, access_token: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Recorre un listado de Graph página por página siguiendo @odata.nextLink, pidiendo
+        solo las propiedades de CAMPOS_LISTADO
+
+        Yields:
+            Elementos (archivos y carpetas) del listado
+        """
+        params = {'$select': CAMPOS_LISTADO, '$top': ELEMENTOS_POR_PAGINA}
+        while url:
+            response = await self._get(url, access_token, params=params)
+            response.raise_for_status()
+            data = response.json()
+
+            for item in data.get('value', []):
+                yield item
+
+            # nextLink ya incluye los parámetros de la consulta
+            url = data.get('@odata.nextLink')
+            params = None
+
+    async def _search_global(self, access_token: str, filename: str) -> List[Dict[str, Any]]:
+        """
+        Búsqueda global en todo OneDrive; se detiene en la primera coincidencia exacta
+
+        Returns:
+            Lista de elementos encontrados por Graph
+        """
+        search_url = f"{self.graph_url}/me/drive/root/search(q='{filename.replace('.xlsx', '')}')"
+        resultados = []
+        async for item in self._iterar_elementos(search_url, access_token):
+            resultados.append(item)
+            if item['name'].lower() == filename.lower():
+                break
+        return resultados
+
+    async def _search_in_folder(self, access_token: str, folder_id: str,
+                                filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un archivo en una carpeta específica
+
+        Returns:
+            Información del archivo o None si no se encuentra
+        """
+        try:
+            async for item in self._iterar_elementos(f"{self.graph_url}/me/drive/items/{folder_id}/children", access_token):
+                if item['name'].lower() == filename.lower():
+                    return item
+        except httpx.HTTPError:
+            pass
+        return None
+
+
+def init_graph_connection_async() -> Optional[OneDriveGraphConnectorAsync]:
+    """
+    Inicializa el conector asíncrono con las mismas credenciales que init_graph_connection
+    (st.secrets o variables de entorno)
+
+    Returns:
+        Conector configurado o None si faltan credenciales
+    """
+    client_id, client_secret, tenant_id = leer_credenciales_azure()
+
+    if not all([client_id, client_secret, tenant_id]):
+        return None
+
+    graph_url = os.getenv('GRAPH_API_URL', 'https://graph.microsoft.com/v1.0')
+    return OneDriveGraphConnectorAsync(client_id, client_secret, tenant_id, graph_url=graph_url)
@@ -0,0 +1,314 @@
+"""
+Registro de datos compartido por todo el proceso
+Todas las sesiones del dashboard usan una única copia de solo lectura de cada versión del
+conjunto de datos; cada sesión guarda solo sus filtros y la versión que está mostrando
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple, Any
+
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+ClaveDatos = Tuple[str, int]
+
+# Clave en st.session_state de los datos que no se comparten entre sesiones
+CLAVE_DATOS_SESION = '_datos_sesion'
+
+logger = logging.getLogger(__name__)
+
+
+def _id_sesion() -> str:
+    """
+    ID de la sesión de Streamlit actual ('local' si se ejecuta fuera de Streamlit)
+    """
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else 'local'
+
+
+def _sesion_activa(sesion_id: str) -> bool:
+    """
+    Indica si la sesión sigue abierta en el servidor de Streamlit
+    """
+    try:
+        if not runtime.exists():
+            return True
+        return runtime.get_instance().is_active_session(sesion_id)
+    except Exception:
+        return True
+
+
+class RegistroDatos:
+    """
+    Registro con conteo de referencias de los conjuntos de datos cargados
+
+    Cada conjunto se identifica por (fuente, versión). Las versiones que ya no son las
+    vigentes se liberan cuando ninguna sesión las está usando.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._datos: Dict[ClaveDatos, pd.DataFrame] = {}
+        self._info: Dict[ClaveDatos, Dict[str, Any]] = {}
+        self._vigente: Dict[str, int] = {}
+        self._locks_carga: Dict[str, threading.Lock] = {}
+        self._sesiones: Dict[str, ClaveDatos] = {}
+        self._actualizadores: Dict[str, threading.Thread] = {}
+        self._contador = 0
+
+    def adquirir(self, fuente: str, cargar: Callable[[], Optional[pd.DataFrame]]) -> Optional[pd.DataFrame]:
+        """
+        Obtiene la versión vigente de una fuente para la sesión actual
+
+        Si todavía no hay datos, los carga una sola vez aunque varias sesiones los pidan
+        al mismo tiempo.
+
+        Args:
+            fuente: Identificador de la fuente (p. ej. nombre del archivo)
+            cargar: Función que carga los datos si no están en el registro
+
+        Returns:
+            DataFrame compartido (no se debe modificar) o None si la carga falló
+        """
+        while True:
+            clave = self.clave_vigente(fuente)
+            if clave is None:
+                with self._lock_carga(fuente):
+                    # Otra sesión pudo cargar los datos mientras esperábamos
+                    clave = self.clave_vigente(fuente)
+                    if clave is None:
+                        df = cargar()
+                        if df is None:
+                            return None
+                        clave = self.publicar(fuente, df)
+
+            with self._lock:
+                # La versión pudo reemplazarse y liberarse entre la consulta y este punto
+                if clave in self._datos:
+                    self._asignar_sesion(_id_sesion(), clave)
+                    return self._datos[clave]
+
+    def publicar(self, fuente: str, df: pd.DataFrame, version: Optional[str] = None) -> ClaveDatos:
+        """
+        Publica una nueva versión de la fuente, que pasa a ser la vigente
+
+        Args:
+            fuente: Identificador de la fuente
+            df: Datos ya procesados
+            version: Versión de la fuente (eTag u otro identificador); por defecto
+                df.attrs['version_fuente'] si existe
+
+        Returns:
+            Clave (fuente, número de versión) de los datos publicados
+        """
+        with self._lock:
+            self._contador += 1
+            clave = (fuente, self._contador)
+            ahora = datetime.now()
+            self._datos[clave] = df
+            self._info[clave] = {
+                'referencias': 0,
+                'cargado': ahora,
+                'verificado': ahora,
+                'version': version if version is not None else df.attrs.get('version_fuente')
+            }
+            self._vigente[fuente] = clave[1]
+            self._purgar()
+        return clave
+
+    def invalidar(self, fuente: str) -> None:
+        """
+        Descarta la versión vigente para que la próxima solicitud vuelva a cargar los datos
+        """
+        with self._lock:
+            self._vigente.pop(fuente, None)
+            self._purgar()
+
+    def clave_vigente(self, fuente: str) -> Optional[ClaveDatos]:
+        """
+        Clave de la versión vigente de la fuente o None si no hay datos cargados
+        """
+        with self._lock:
+            version = self._vigente.get(fuente)
+            return (fuente, version) if version is not None else None
+
+    def info_vigente(self, fuente: str) -> Optional[Dict[str, Any]]:
+        """
+        Información de la versión vigente: versión de la fuente, cuándo se cargó y cuándo
+        se verificó por última vez que sigue actualizada
+
+        Returns:
+            Copia de la información o None si no hay datos cargados
+        """
+        with self._lock:
+            clave = self.clave_vigente(fuente)
+            if clave is None or clave not in self._info:
+                return None
+            return dict(self._info[clave])
+
+    def revalidar(self, fuente: str, cargar: Callable[[], Optional[pd.DataFrame]],
+                  obtener_version: Optional[Callable[[], Optional[str]]] = None) -> bool:
+        """
+        Verifica la fuente y publica una nueva versión solo si cambió
+
+        Se compara primero la versión liviana (obtener_version) y, si no la hay, la versión
+        de los datos cargados (df.attrs['version_fuente']). Mientras tanto las sesiones siguen
+        usando la versión vigente; el cambio de versión es atómico.
+
+        Args:
+            fuente: Identificador de la fuente
+            cargar: Función que carga los datos completos
+            obtener_version: Función liviana que devuelve la versión actual de la fuente
+
+        Returns:
+            True si se publicó una nueva versión
+        """
+        info = self.info_vigente(fuente)
+        if info is not None and obtener_version is not None:
+            version = obtener_version()
+            if version and version == info['version']:
+                self._marcar_verificado(fuente)
+                return False
+
+        with self._lock_carga(fuente):
+            df = cargar()
+        if df is None:
+            return False
+
+        # La carga puede confirmar que la versión no cambió (p. ej. la huella del contenido
+        # de una fuente sin ETag): no se republica
+        version = df.attrs.get('version_fuente')
+        if info is not None and version and version == info['version']:
+            self._marcar_verificado(fuente)
+            return False
+
+        self.publicar(fuente, df)
+        return True
+
+    def programar_actualizacion(self, fuente: str, cargar: Callable[[], Optional[pd.DataFrame]],
+                                obtener_version: Optional[Callable[[], Optional[str]]] = None,
+                                intervalo_s: float = 300.0) -> None:
+        """
+        Inicia (una sola vez por fuente) un hilo que revalida la fuente periódicamente
+
+        Args:
+            fuente: Identificador de la fuente
+            cargar: Función que carga los datos completos
+            obtener_version: Función liviana que devuelve la versión actual de la fuente
+            intervalo_s: Segundos entre verificaciones
+        """
+        with self._lock:
+            if fuente in self._actualizadores:
+                return
+            hilo = threading.Thread(
+                target=self._bucle_actualizacion,
+                args=(fuente, cargar, obtener_version, intervalo_s),
+                name=f"actualizador-{fuente}",
+                daemon=True
+            )
+            self._actualizadores[fuente] = hilo
+        hilo.start()
+
+    def _bucle_actualizacion(self, fuente: str, cargar: Callable[[], Optional[pd.DataFrame]],
+                             obtener_version: Optional[Callable[[], Optional[str]]],
+                             intervalo_s: float) -> None:
+        while True:
+            time.sleep(intervalo_s)
+            try:
+                if self.revalidar(fuente, cargar, obtener_version):
+                    logger.info("Nueva versión de datos publicada para %s", fuente)
+            except Exception:
+                # Se mantiene la última copia buena
+                logger.exception("Error actualizando datos de %s", fuente)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """
+        Versiones en memoria, sesiones que las usan y memoria ocupada
+        """
+        with self._lock:
+            self._purgar()
+            return {
+                'versiones': len(self._datos),
+                'sesiones': len(self._sesiones),
+                'memoria_mb': float(sum(
+                    df.memory_usage(deep=True).sum() for df in self._datos.values()
+                )) / 1024 ** 2
+            }
+
+    def _marcar_verificado(self, fuente: str) -> None:
+        with self._lock:
+            clave = self.clave_vigente(fuente)
+            if clave in self._info:
+                self._info[clave]['verificado'] = datetime.now()
+
+    def _lock_carga(self, fuente: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_carga.setdefault(fuente, threading.Lock())
+
+    def _asignar_sesion(self, sesion_id: str, clave: ClaveDatos) -> None:
+        anterior = self._sesiones.get(sesion_id)
+        if anterior == clave:
+            return
+        if anterior in self._info:
+            self._info[anterior]['referencias'] -= 1
+        self._sesiones[sesion_id] = clave
+        self._info[clave]['referencias'] += 1
+        self._purgar()
+
+    def _purgar(self) -> None:
+        # Soltar las referencias de sesiones que ya se cerraron
+        for sesion_id in list(self._sesiones):
+            if not _sesion_activa(sesion_id):
+                clave = self._sesiones.pop(sesion_id)
+                if clave in self._info:
+                    self._info[clave]['referencias'] -= 1
+
+        # Eliminar versiones no vigentes que ninguna sesión usa
+        for clave in list(self._datos):
+            fuente, version = clave
+            if self._vigente.get(fuente) != version and self._info[clave]['referencias'] <= 0:
+                del self._datos[clave]
+                del self._info[clave]
+
+
+@st.cache_resource
+def obtener_registro() -> RegistroDatos:
+    """
+    Registro único del proceso, compartido por todas las sesiones
+    """
+    return RegistroDatos()
+
+
+def adquirir_de_sesion(fuente: str, cargar: Callable[[], Optional[pd.DataFrame]]) -> Optional[pd.DataFrame]:
+    """
+    Obtiene datos que solo puede ver la sesión actual (p. ej. los de una cuenta sin identificar)
+
+    Se guardan en st.session_state y no en el registro del proceso: se liberan al cerrarse la
+    sesión en lugar de quedar como la versión vigente de una fuente por navegador.
+
+    Args:
+        fuente: Identificador de la fuente dentro de la sesión
+        cargar: Función que carga los datos si la sesión todavía no los tiene
+
+    Returns:
+        DataFrame de la sesión o None si la carga falló
+    """
+    datos = st.session_state.setdefault(CLAVE_DATOS_SESION, {})
+    if fuente not in datos:
+        df = cargar()
+        if df is None:
+            return None
+        datos[fuente] = df
+    return datos[fuente]
+
+
+def invalidar_de_sesion(fuente: str) -> None:
+    """
+    Descarta los datos de la sesión actual para que se vuelvan a cargar
+    """
+    st.session_state.get(CLAVE_DATOS_SESION, {}).pop(fuente, None)
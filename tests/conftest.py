@@ -0,0 +1,16 @@
+"""
+Configuración de pytest: los módulos del proyecto están en la raíz del repositorio y la
+caché local de cada prueba va a un directorio temporal
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def cache_temporal(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOMESPEND_CACHE_DIR', str(tmp_path / 'cache'))
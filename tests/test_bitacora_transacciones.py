@@ -0,0 +1,69 @@
+import os
+
+import pandas as pd
+
+from bitacora_transacciones import BitacoraTransacciones
+
+
+def _libro(filas):
+    return pd.DataFrame(
+        [{'MessageID': message_id, 'Amount': monto} for message_id, monto in filas]
+    )
+
+
+def _segmentos_en_disco(bitacora):
+    return sorted(archivo for archivo in os.listdir(bitacora.directorio) if archivo.startswith('segmento_'))
+
+
+def test_compactar_deja_un_segmento_con_el_mismo_indice():
+    bitacora = BitacoraTransacciones('gastos.xlsx')
+    bitacora.fusionar(_libro([('a', 1), ('b', 2), ('c', 3)]))
+    bitacora.fusionar(_libro([('a', 10), ('b', 2), ('c', 3)]))
+    bitacora.fusionar(_libro([('a', 10), ('c', 3), ('d', 4)]))
+    indice = dict(bitacora.indice())
+
+    assert bitacora.compactar(max_segmentos=1)
+
+    assert bitacora.segmentos == 1
+    assert bitacora.ultimo_segmento == 3
+    assert _segmentos_en_disco(bitacora) == ['segmento_000003.parquet']
+    assert BitacoraTransacciones('gastos.xlsx', 3).indice() == indice
+
+
+def test_no_compacta_por_debajo_del_limite():
+    bitacora = BitacoraTransacciones('gastos.xlsx')
+    bitacora.fusionar(_libro([('a', 1)]))
+    bitacora.fusionar(_libro([('a', 2)]))
+
+    assert not bitacora.compactar(max_segmentos=2)
+    assert bitacora.segmentos == 2
+
+
+def test_segmentos_posteriores_a_la_compactacion_siguen_la_numeracion():
+    bitacora = BitacoraTransacciones('gastos.xlsx')
+    bitacora.fusionar(_libro([('a', 1)]))
+    bitacora.fusionar(_libro([('a', 2)]))
+    bitacora.compactar(max_segmentos=1)
+
+    bitacora.fusionar(_libro([('a', 3)]))
+
+    assert bitacora.ultimo_segmento == 3
+    # Una sincronización sin confirmar (estado en el segmento 2) se descarta al abrir
+    reabierta = BitacoraTransacciones('gastos.xlsx', 2)
+    assert reabierta.segmentos == 1
+    cambiadas, _ = reabierta.fusionar(_libro([('a', 3)]))
+    assert cambiadas['MessageID'].tolist() == ['a']
+
+
+def test_compactacion_interrumpida_conserva_las_bajas():
+    bitacora = BitacoraTransacciones('gastos.xlsx')
+    bitacora.fusionar(_libro([('a', 1), ('b', 2)]))
+    bitacora.fusionar(_libro([('b', 2)]))
+    bitacora.compactar(max_segmentos=1)
+
+    # Simula un corte después de escribir el segmento compactado: el primero sigue en disco
+    _libro([('a', 1), ('b', 2)]).assign(_hash='x', _op='alta').to_parquet(
+        os.path.join(bitacora.directorio, 'segmento_000001.parquet'), index=False
+    )
+
+    assert set(BitacoraTransacciones('gastos.xlsx', 2).indice()) == {'b'}
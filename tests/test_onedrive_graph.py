@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import onedrive_graph
+from onedrive_graph import OneDriveGraphConnector, obtener_estadisticas_http
+
+
+class GraphFalso:
+    """
+    Servidor HTTP local que responde como Graph con respuestas preparadas por ruta
+    """
+
+    def __init__(self):
+        self.respuestas = {}
+        self.solicitudes = []
+        graph = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                ruta = self.path.split('?', 1)[0]
+                graph.solicitudes.append((self.path, self.headers.get('Authorization'), time.monotonic()))
+                pendientes = graph.respuestas.get(ruta, [])
+                estado, encabezados, cuerpo = pendientes.pop(0) if pendientes else (404, {}, {})
+                contenido = json.dumps(cuerpo).encode('utf-8')
+                self.send_response(estado)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(contenido)))
+                for nombre, valor in encabezados.items():
+                    self.send_header(nombre, valor)
+                self.end_headers()
+                self.wfile.write(contenido)
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}/v1.0"
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def responder(self, ruta, *respuestas):
+        self.respuestas.setdefault(f"/v1.0{ruta}", []).extend(respuestas)
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+@pytest.fixture
+def graph():
+    servidor = GraphFalso()
+    yield servidor
+    servidor.cerrar()
+
+
+@pytest.fixture
+def conector(graph, monkeypatch):
+    # MSAL consulta el tenant al crearse; las pruebas no usan login.microsoftonline.com
+    monkeypatch.setattr(onedrive_graph.msal, 'PublicClientApplication', lambda **kwargs: None)
+    return OneDriveGraphConnector('cliente', 'secreto', 'tenant', graph_url=graph.url)
+
+
+def test_iterar_elementos_sigue_la_cadena_de_next_link(graph, conector):
+    graph.responder('/me/drive/root/children',
+                    (200, {}, {'value': [{'name': 'a'}, {'name': 'b'}],
+                               '@odata.nextLink': f"{graph.url}/paginas/2?$skiptoken=x"}))
+    graph.responder('/paginas/2',
+                    (200, {}, {'value': [{'name': 'c'}],
+                               '@odata.nextLink': f"{graph.url}/paginas/3?$skiptoken=y"}))
+    graph.responder('/paginas/3', (200, {}, {'value': [{'name': 'd'}]}))
+
+    elementos = conector._iterar_elementos(f"{graph.url}/me/drive/root/children",
+                                           {'Authorization': 'Bearer token'})
+
+    assert [elemento['name'] for elemento in elementos] == ['a', 'b', 'c', 'd']
+    rutas = [ruta for ruta, _, _ in graph.solicitudes]
+    # Solo la primera solicitud lleva $select/$top; el nextLink ya trae sus parámetros
+    assert '%24select=' in rutas[0] and '%24top=' in rutas[0]
+    assert rutas[1:] == ['/v1.0/paginas/2?$skiptoken=x', '/v1.0/paginas/3?$skiptoken=y']
+
+
+def test_iterar_elementos_pide_las_paginas_a_medida_que_se_consumen(graph, conector):
+    graph.responder('/me/drive/root/children',
+                    (200, {}, {'value': [{'name': 'a'}], '@odata.nextLink': f"{graph.url}/paginas/2"}))
+
+    elementos = conector._iterar_elementos(f"{graph.url}/me/drive/root/children", {})
+
+    assert next(elementos)['name'] == 'a'
+    assert len(graph.solicitudes) == 1
+
+
+def test_sesion_compartida_reintenta_429_respetando_retry_after(graph, conector):
+    graph.responder('/me/drive/items/1',
+                    (429, {'Retry-After': '1'}, {'error': {'code': 'TooManyRequests'}}),
+                    (200, {}, {'id': '1'}))
+    reintentos_previos = obtener_estadisticas_http()['reintentos']
+
+    response = conector._get(f"{graph.url}/me/drive/items/1")
+
+    assert response.status_code == 200
+    assert response.json() == {'id': '1'}
+    assert len(graph.solicitudes) == 2
+    assert graph.solicitudes[1][2] - graph.solicitudes[0][2] >= 1
+    assert obtener_estadisticas_http()['reintentos'] == reintentos_previos + 1
+
+
+def test_get_renueva_el_token_tras_un_401(graph, conector, monkeypatch):
+    graph.responder('/me/drive/items/1',
+                    (401, {}, {'error': {'code': 'InvalidAuthenticationToken'}}),
+                    (200, {}, {'id': '1'}),
+                    (200, {}, {'id': '1'}))
+    renovaciones = []
+
+    def obtener_token_vigente(forzar=False):
+        renovaciones.append(forzar)
+        return 'token-nuevo'
+
+    monkeypatch.setattr(conector, 'obtener_token_vigente', obtener_token_vigente)
+
+    response = conector._get(f"{graph.url}/me/drive/items/1", headers={'Authorization': 'Bearer token-viejo'})
+
+    assert response.status_code == 200
+    assert renovaciones == [True]
+    assert [autorizacion for _, autorizacion, _ in graph.solicitudes] == [
+        'Bearer token-viejo', 'Bearer token-nuevo'
+    ]
+
+    # Las siguientes solicitudes con el token vencido usan directamente el renovado
+    conector._get(f"{graph.url}/me/drive/items/1", headers={'Authorization': 'Bearer token-viejo'})
+    assert graph.solicitudes[-1][1] == 'Bearer token-nuevo'
+    assert renovaciones == [True]
+
+
+def test_get_no_repite_la_solicitud_si_no_hay_token_nuevo(graph, conector, monkeypatch):
+    graph.responder('/me/drive/items/1', (401, {}, {'error': {'code': 'InvalidAuthenticationToken'}}))
+    monkeypatch.setattr(conector, 'obtener_token_vigente', lambda forzar=False: None)
+
+    response = conector._get(f"{graph.url}/me/drive/items/1", headers={'Authorization': 'Bearer token-viejo'})
+
+    assert response.status_code == 401
+    assert len(graph.solicitudes) == 1
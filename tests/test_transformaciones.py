@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import transformaciones
+from transformaciones import parsear_fechas
+
+
+@pytest.fixture(autouse=True)
+def sin_formatos_recordados(monkeypatch):
+    monkeypatch.setattr(transformaciones, '_formatos_detectados', {})
+
+
+def test_fechas_ambiguas_se_leen_mes_dia_como_pd_to_datetime():
+    textos = pd.Series(['01/02/2025', '03/04/2025', '12/11/2024'], name='Fecha')
+
+    fechas = parsear_fechas(textos)
+
+    assert fechas.tolist() == pd.to_datetime(textos).tolist()
+    assert fechas[0] == pd.Timestamp('2025-01-02')
+
+
+def test_fechas_con_dia_mayor_que_12_se_leen_dia_mes():
+    textos = pd.Series(['01/02/2025', '25/04/2025'], name='Fecha')
+
+    fechas = parsear_fechas(textos)
+
+    assert fechas.tolist() == [pd.Timestamp('2025-02-01'), pd.Timestamp('2025-04-25')]
+
+
+def test_fechas_ambiguas_con_hora():
+    textos = pd.Series(['01/02/2025 10:30', '03/04/2025 11:00'], name='Fecha')
+
+    fechas = parsear_fechas(textos)
+
+    assert fechas.tolist() == [pd.Timestamp('2025-01-02 10:30'), pd.Timestamp('2025-03-04 11:00')]
+
+
+def test_formato_de_create_sample_data_y_seriales_de_excel():
+    assert parsear_fechas(pd.Series(['Monday, January 06, 2025'], name='Fecha'))[0] == pd.Timestamp('2025-01-06')
+    assert parsear_fechas(pd.Series([45663.5], name='Serial'))[0] == pd.Timestamp('2025-01-06 12:00')
@@ -0,0 +1,498 @@
+"""
+Transformaciones vectorizadas compartidas por los dashboards
+Operan sobre columnas completas en lugar de recorrer las filas con apply
+"""
+
+import os
+from typing import Optional, Dict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Valor usado cuando no hay responsable configurado
+RESPONSABLE_DESCONOCIDO = 'Desconocido'
+
+# Valor para los textos faltantes (los números quedan NaN y las fechas NaT)
+VALOR_FALTANTE = 'Desconocido'
+
+# Columnas de dimensión (pocos valores distintos) que se guardan como categóricas
+COLUMNAS_DIMENSION = (
+    'Bank', 'Banco', 'Business', 'Location', 'Card', 'Tarjeta', 'Responsible', 'Responsable',
+    'Categoria', 'Categoría', 'Descripcion',
+)
+
+
+def _leer_configuracion(nombre: str):
+    """
+    Lee un valor de los secrets de Streamlit o, si no está, de las variables de entorno
+    """
+    try:
+        import streamlit as st
+        return st.secrets[nombre]
+    except Exception:
+        return os.getenv(nombre)
+
+
+def cargar_tarjetas_responsables() -> Dict[str, str]:
+    """
+    Mapa terminación de tarjeta (últimos 4 dígitos) -> responsable
+
+    Se configura en TARJETAS_RESPONSABLES, como tabla en los secrets de Streamlit
+    ([TARJETAS_RESPONSABLES] "9366" = "Nombre") o como texto en el .env
+    ("9366=Nombre;2081=Otro nombre").
+
+    Returns:
+        Diccionario con las terminaciones configuradas (vacío si no hay configuración)
+    """
+    configuracion = _leer_configuracion('TARJETAS_RESPONSABLES')
+    if not configuracion:
+        return {}
+
+    if isinstance(configuracion, str):
+        pares = (par.split('=', 1) for par in configuracion.split(';') if '=' in par)
+    else:
+        pares = dict(configuracion).items()
+
+    return {str(tarjeta).strip()[-4:]: str(nombre).strip() for tarjeta, nombre in pares}
+
+
+def obtener_responsable_por_defecto() -> str:
+    """
+    Responsable de las tarjetas sin terminación configurada (RESPONSABLE_POR_DEFECTO)
+    """
+    return _leer_configuracion('RESPONSABLE_POR_DEFECTO') or RESPONSABLE_DESCONOCIDO
+
+
+def asignar_responsables(df: pd.DataFrame, columna_tarjeta: str = 'Card',
+                         columna_responsable: str = 'Responsable',
+                         tarjetas: Optional[Dict[str, str]] = None,
+                         por_defecto: Optional[str] = None) -> pd.Series:
+    """
+    Completa el responsable según la terminación de la tarjeta
+
+    Solo se asigna donde el responsable está vacío; la búsqueda se hace una vez por
+    terminación distinta (mapa sobre una columna categórica), no por fila.
+
+    Args:
+        df: Datos con la columna de tarjeta
+        columna_tarjeta: Columna con el número (o terminación) de la tarjeta
+        columna_responsable: Columna de responsable a completar (puede no existir)
+        tarjetas: Mapa terminación -> responsable (por defecto, el configurado)
+        por_defecto: Responsable para terminaciones sin mapear (por defecto, el configurado)
+
+    Returns:
+        Serie de responsables alineada con df
+    """
+    tarjetas = cargar_tarjetas_responsables() if tarjetas is None else tarjetas
+    por_defecto = obtener_responsable_por_defecto() if por_defecto is None else por_defecto
+
+    if columna_responsable in df.columns:
+        actual = df[columna_responsable]
+        vacio = actual.isna() | actual.astype(str).str.strip().eq('')
+    else:
+        actual = pd.Series(None, index=df.index, dtype=object)
+        vacio = pd.Series(True, index=df.index)
+
+    if not vacio.any():
+        return actual
+
+    # Últimos 4 dígitos (tolera números leídos como float, p. ej. "1234.0")
+    terminaciones = (
+        df.loc[vacio, columna_tarjeta].astype(str)
+        .str.extract(r'(\d{4})(?:\.0+)?\s*$', expand=False)
+        .astype('category')
+    )
+    asignados = terminaciones.map(tarjetas).astype(object).fillna(por_defecto)
+
+    resultado = actual.astype(object).copy()
+    resultado[vacio] = asignados
+    return resultado
+
+
+def semana_personalizada(fechas: pd.Series) -> pd.Series:
+    """
+    Semana personalizada de cada fecha como código entero AAAASS
+
+    La semana 1 va del 1 de enero al primer domingo; las siguientes van de lunes a
+    domingo. Se calcula con aritmética entera sobre el día del año y el día de la semana,
+    sin crear objetos por fila.
+
+    Args:
+        fechas: Serie datetime64
+
+    Returns:
+        Serie Int32 con el código (p. ej. 202503), nulo donde no hay fecha
+    """
+    dia_del_año = fechas.dt.dayofyear
+    # Día de la semana del 1 de enero (lunes = 0)
+    inicio_año = (fechas.dt.dayofweek - (dia_del_año - 1)) % 7
+    semana = (dia_del_año - 1 + inicio_año) // 7 + 1
+    return (fechas.dt.year * 100 + semana).astype('Int32')
+
+
+def etiqueta_semana(codigos: pd.Series) -> pd.Series:
+    """
+    Convierte códigos AAAASS en etiquetas "AAAA-SNN" (p. ej. "2025-S03")
+    """
+    codigos = codigos.astype('int64')
+    return (codigos // 100).astype(str) + '-S' + (codigos % 100).astype(str).str.zfill(2)
+
+
+# Columnas de la dimensión de calendario (códigos enteros)
+COLUMNAS_CALENDARIO = ('Dia', 'Semana', 'SemanaISO', 'Mes', 'Trimestre', 'Año', 'DiaSemana')
+
+
+def dimension_calendario(fechas: pd.Series) -> pd.DataFrame:
+    """
+    Claves de calendario de cada fecha como códigos enteros compactos
+
+    Columnas: Dia (AAAAMMDD), Semana (personalizada, AAAASS), SemanaISO (AAAASS del año
+    ISO), Mes (AAAAMM), Trimestre (AAAAT), Año y DiaSemana (lunes = 0). Agrupar por
+    estos códigos evita formatear fechas como texto en cada interacción.
+
+    Args:
+        fechas: Serie datetime64
+
+    Returns:
+        DataFrame alineado con `fechas` (valores nulos donde no hay fecha)
+    """
+    año = fechas.dt.year
+    mes = fechas.dt.month
+    iso = fechas.dt.isocalendar()
+    return pd.DataFrame({
+        'Dia': (año * 10000 + mes * 100 + fechas.dt.day).astype('Int32'),
+        'Semana': semana_personalizada(fechas),
+        'SemanaISO': (iso['year'].astype('Int32') * 100 + iso['week'].astype('Int32')).astype('Int32'),
+        'Mes': (año * 100 + mes).astype('Int32'),
+        'Trimestre': (año * 10 + fechas.dt.quarter).astype('Int32'),
+        'Año': año.astype('Int16'),
+        'DiaSemana': fechas.dt.dayofweek.astype('Int8'),
+    }, index=fechas.index)
+
+
+def agregar_calendario(df: pd.DataFrame, columna_fecha: str = 'Fecha') -> pd.DataFrame:
+    """
+    Agrega la dimensión de calendario al DataFrame si todavía no la tiene
+
+    Args:
+        df: Datos con la columna de fecha ya convertida a datetime
+        columna_fecha: Columna de fecha
+
+    Returns:
+        El mismo DataFrame con las columnas de COLUMNAS_CALENDARIO
+    """
+    if df is None or columna_fecha not in df.columns:
+        return df
+    if all(columna in df.columns for columna in COLUMNAS_CALENDARIO):
+        return df
+
+    calendario = dimension_calendario(df[columna_fecha])
+    for columna in COLUMNAS_CALENDARIO:
+        df[columna] = calendario[columna]
+    return df
+
+
+def codigo_mes(fecha) -> int:
+    """
+    Código AAAAMM de una fecha (para comparar con la columna Mes)
+    """
+    return fecha.year * 100 + fecha.month
+
+
+def etiqueta_mes(codigos: pd.Series) -> pd.Series:
+    """
+    Convierte códigos AAAAMM en etiquetas "AAAA-MM"
+    """
+    codigos = codigos.astype('int64')
+    return (codigos // 100).astype(str) + '-' + (codigos % 100).astype(str).str.zfill(2)
+
+
+def fecha_de_codigo(codigos: pd.Series) -> pd.Series:
+    """
+    Convierte códigos Dia (AAAAMMDD) o Mes (AAAAMM, primer día del mes) en fechas
+    """
+    codigos = codigos.astype('int64')
+    if codigos.empty or codigos.max() < 1000000:
+        codigos = codigos * 100 + 1
+    return pd.to_datetime(codigos.astype(str), format='%Y%m%d')
+
+
+def _es_texto(serie: pd.Series) -> bool:
+    """
+    Indica si una columna guarda texto (y no números o fechas dentro de un object)
+    """
+    if serie.dtype != object and not pd.api.types.is_string_dtype(serie.dtype):
+        return False
+    return pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty', 'mixed', 'mixed-integer')
+
+
+def completar_vacios(df: pd.DataFrame, valor: str = VALOR_FALTANTE) -> pd.DataFrame:
+    """
+    Completa los valores faltantes según el tipo de cada columna
+
+    Solo las columnas de texto (y las categóricas) reciben `valor`; las numéricas y las
+    de fecha conservan NaN/NaT para no convertirse en columnas object.
+
+    Args:
+        df: Datos a completar (se modifican en el mismo DataFrame)
+        valor: Texto para los faltantes
+
+    Returns:
+        El mismo DataFrame
+    """
+    for columna in df.columns:
+        serie = df[columna]
+        if not serie.hasnans:
+            continue
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            if valor not in serie.cat.categories:
+                serie = serie.cat.add_categories([valor])
+            df[columna] = serie.fillna(valor)
+        elif _es_texto(serie):
+            df[columna] = serie.fillna(valor)
+    return df
+
+
+def _como_categoria(serie: pd.Series, valor_faltante: str) -> pd.Series:
+    """
+    Convierte una columna de dimensión a categórica de textos
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        # Números de tarjeta leídos como float (1234.0)
+        serie = serie.astype('Int64')
+    texto = serie.astype(str).where(serie.notna(), valor_faltante)
+    return texto.astype('category')
+
+
+def aplicar_esquema(df: pd.DataFrame, columna_fecha: Optional[str] = None,
+                    columna_monto: Optional[str] = None,
+                    dimensiones=COLUMNAS_DIMENSION,
+                    valor_faltante: str = VALOR_FALTANTE) -> pd.DataFrame:
+    """
+    Aplica los tipos del conjunto de transacciones
+
+    La fecha queda como datetime64, el monto como float64 y las dimensiones como
+    categóricas (cada texto distinto se guarda una sola vez, y los groupby y filtros por
+    igualdad trabajan sobre códigos enteros). Los faltantes se completan por tipo de columna.
+
+    Se aplica una vez sobre el conjunto completo: al concatenar bloques con categorías
+    distintas pandas vuelve a object.
+
+    Args:
+        df: Datos ya transformados
+        columna_fecha: Columna de fecha (opcional)
+        columna_monto: Columna de monto (opcional)
+        dimensiones: Columnas a convertir en categóricas, si existen
+        valor_faltante: Texto para los faltantes
+
+    Returns:
+        DataFrame con el esquema aplicado (los datos originales no se modifican)
+    """
+    df = df.copy(deep=False)
+
+    if columna_fecha in df.columns and not pd.api.types.is_datetime64_any_dtype(df[columna_fecha]):
+        df[columna_fecha] = parsear_fechas(df[columna_fecha])
+    if columna_monto in df.columns and df[columna_monto].dtype != 'float64':
+        df[columna_monto] = pd.to_numeric(df[columna_monto], errors='coerce').astype('float64')
+
+    for columna in dimensiones:
+        if columna in df.columns:
+            df[columna] = _como_categoria(df[columna], valor_faltante)
+
+    return completar_vacios(df, valor_faltante)
+
+
+# Monto de texto válido: símbolo de moneda y espacios opcionales, signo "-" al inicio (antes
+# o después del símbolo) o el monto entre paréntesis, y comas solo como separador de miles:
+# "1,234.50", "₡-1,234", "-$1,234", "(1,234)". Cualquier otro texto ("1e3", "2,5", "12-34")
+# no es un monto
+_PATRON_MONTO = (
+    r'^\s*(?P<abre>\()?\s*(?P<signo>-)?\s*[₡$€]?\s*(?P<signo_moneda>-)?\s*'
+    r'(?P<numero>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)'
+    r'\s*(?P<cierra>\))?\s*$'
+)
+
+# Tipos inferidos de una columna object que ya contiene solo números
+_TIPOS_NUMERICOS = ('integer', 'floating', 'mixed-integer-float', 'decimal', 'empty')
+
+
+def parsear_montos(valores: pd.Series):
+    """
+    Convierte una columna de montos a float64
+
+    Admite celdas ya numéricas y textos con símbolo de moneda (₡, $, €), separadores de
+    miles con coma y negativos con signo inicial o entre paréntesis. Los textos se validan
+    y separan con una sola expresión regular de Arrow (RE2) y se convierten con un cast
+    directo; los textos que no tienen forma de monto quedan como NaN.
+
+    Args:
+        valores: Columna de montos
+
+    Returns:
+        Tupla (Serie float64, máscara de filas sin monto válido)
+    """
+    if pd.api.types.is_numeric_dtype(valores) and not pd.api.types.is_bool_dtype(valores):
+        montos = valores.astype('float64')
+        return montos, montos.isna()
+
+    tipo = pd.api.types.infer_dtype(valores, skipna=True) if valores.dtype == object else None
+    if tipo in _TIPOS_NUMERICOS:
+        montos = pd.to_numeric(valores, errors='coerce').astype('float64')
+        return montos, montos.isna()
+
+    texto = pa.array(valores.astype('string[pyarrow]'))
+    if isinstance(texto, pa.ChunkedArray):
+        texto = texto.combine_chunks()
+
+    # Sin coincidencia la fila queda nula; los grupos opcionales ausentes quedan vacíos
+    partes = pc.extract_regex(texto, _PATRON_MONTO)
+    grupo = lambda nombre: pc.struct_field(partes, nombre)
+    numeros = pc.cast(pc.replace_substring(grupo('numero'), ',', ''), pa.float64())
+
+    abre, cierra = pc.equal(grupo('abre'), '('), pc.equal(grupo('cierra'), ')')
+    negativos = pc.or_(abre, pc.or_(pc.equal(grupo('signo'), '-'), pc.equal(grupo('signo_moneda'), '-')))
+    numeros = pc.if_else(negativos, pc.negate(numeros), numeros)
+    # Paréntesis sin cerrar (o sin abrir): no es un monto
+    numeros = pc.if_else(pc.equal(abre, cierra), numeros, pa.scalar(None, pa.float64()))
+
+    montos = pd.Series(numeros.to_numpy(zero_copy_only=False), index=valores.index, name=valores.name)
+
+    if tipo in ('mixed', 'mixed-integer'):
+        # Celdas numéricas mezcladas con textos: se toman tal cual (sin pasar por texto)
+        es_numero = valores.map(lambda valor: pd.api.types.is_number(valor) and not isinstance(valor, bool))
+        montos = montos.mask(es_numero, pd.to_numeric(valores.where(es_numero), errors='coerce'))
+
+    montos = montos.astype('float64')
+    return montos, montos.isna()
+
+
+# Formatos de fecha conocidos, en orden de preferencia. Con barras va primero mes/día, la
+# lectura de pd.to_datetime sin formato: una muestra ambigua (todos los días <= 12) se lee
+# igual que antes y día/mes solo gana si algún valor tiene un día mayor que 12
+FORMATOS_FECHA = (
+    '%A, %B %d, %Y',       # Monday, January 06, 2025 (create_sample_data.py)
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+)
+
+# Valores distintos usados para detectar el formato
+TAMANO_MUESTRA_FECHAS = 200
+
+# Rango de números de serie de Excel (1900-01-01 a 9999-12-31)
+SERIAL_EXCEL_MIN = 1
+SERIAL_EXCEL_MAX = 2958465
+ORIGEN_SERIAL_EXCEL = '1899-12-30'
+
+# Formato detectado por columna; se reutiliza mientras siga sirviendo para la muestra
+_formatos_detectados: Dict[str, str] = {}
+
+
+def _desde_serial_excel(numeros: pd.Series) -> pd.Series:
+    """
+    Convierte números de serie de Excel en fechas (NaT fuera de rango)
+    """
+    numeros = pd.to_numeric(numeros, errors='coerce').astype('float64')
+    numeros = numeros.where(numeros.between(SERIAL_EXCEL_MIN, SERIAL_EXCEL_MAX))
+    return pd.to_datetime(numeros, unit='D', origin=ORIGEN_SERIAL_EXCEL)
+
+
+def _aciertos(muestra: pd.Series, formato: str) -> int:
+    return int(pd.to_datetime(muestra, format=formato, errors='coerce').notna().sum())
+
+
+def _detectar_formato(muestra: pd.Series, clave: Optional[str]) -> Optional[str]:
+    """
+    Formato que reconoce más valores de la muestra (primero el detectado antes para la columna);
+    en un empate gana el que aparece antes en FORMATOS_FECHA
+    """
+    previo = _formatos_detectados.get(clave) if clave else None
+    if previo and _aciertos(muestra, previo) == len(muestra):
+        return previo
+
+    mejor, aciertos_mejor = None, 0
+    for formato in FORMATOS_FECHA:
+        aciertos = _aciertos(muestra, formato)
+        if aciertos > aciertos_mejor:
+            mejor, aciertos_mejor = formato, aciertos
+        if aciertos == len(muestra):
+            break
+
+    if mejor and clave:
+        _formatos_detectados[clave] = mejor
+    return mejor
+
+
+def _parsear_textos(textos: pd.Series, clave: Optional[str]) -> pd.Series:
+    """
+    Convierte textos de fecha con el formato dominante; solo los que no lo cumplen
+    pasan por la inferencia elemento a elemento
+    """
+    textos = textos.str.strip()
+    muestra = textos.drop_duplicates().head(TAMANO_MUESTRA_FECHAS)
+    formato = _detectar_formato(muestra, clave)
+
+    if formato is None:
+        return pd.to_datetime(textos, errors='coerce', format='mixed')
+
+    # cache=True: cada texto distinto se convierte una sola vez
+    fechas = pd.to_datetime(textos, format=formato, errors='coerce', cache=True)
+    restantes = fechas.isna()
+    if restantes.any():
+        fechas = fechas.astype('datetime64[ns]')
+        fechas[restantes] = pd.to_datetime(textos[restantes], errors='coerce', format='mixed').astype('datetime64[ns]')
+    return fechas
+
+
+def parsear_fechas(valores: pd.Series, clave: Optional[str] = None) -> pd.Series:
+    """
+    Convierte una columna de fechas a datetime64
+
+    Las fechas ya convertidas se devuelven tal cual y los números se interpretan como
+    números de serie de Excel. Para los textos se detecta el formato dominante con una
+    muestra y se convierten con ese formato explícito; solo los textos que no lo cumplen
+    usan la inferencia lenta.
+
+    Args:
+        valores: Columna de fechas
+        clave: Nombre con el que se recuerda el formato detectado (p. ej. la columna),
+            para no volver a detectarlo en cada bloque
+
+    Returns:
+        Serie datetime64 (NaT donde no hay fecha válida)
+    """
+    clave = clave or valores.name
+    if pd.api.types.is_datetime64_any_dtype(valores):
+        return valores
+    if pd.api.types.is_numeric_dtype(valores) and not pd.api.types.is_bool_dtype(valores):
+        return _desde_serial_excel(valores)
+
+    tipo = pd.api.types.infer_dtype(valores, skipna=True)
+    if tipo in ('datetime', 'datetime64', 'date'):
+        return pd.to_datetime(valores, errors='coerce')
+    if tipo == 'string':
+        return _parsear_textos(valores.astype(str).where(valores.notna()), clave)
+
+    # Columna mezclada (típico del Workbook API): números de serie, fechas y textos
+    resultado = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[ns]')
+    tipos = valores.map(type)
+    es_texto = tipos.eq(str).to_numpy()
+    es_numero = valores.notna().to_numpy() & valores.map(pd.api.types.is_number).to_numpy() & ~tipos.eq(bool).to_numpy()
+    es_otro = valores.notna().to_numpy() & ~es_texto & ~es_numero
+
+    if es_texto.any():
+        resultado[es_texto] = _parsear_textos(valores[es_texto].astype(str), clave).astype('datetime64[ns]').to_numpy()
+    if es_numero.any():
+        resultado[es_numero] = _desde_serial_excel(valores[es_numero]).astype('datetime64[ns]').to_numpy()
+    if es_otro.any():
+        resultado[es_otro] = pd.to_datetime(valores[es_otro], errors='coerce').astype('datetime64[ns]').to_numpy()
+    return resultado